@@ -1,5 +1,6 @@
 from flask import (
     Flask,
+    Response,
     render_template,
     request,
     redirect,
@@ -10,39 +11,54 @@ from flask import (
     current_app,
     g,
     abort,
+    before_render_template,
+    template_rendered,
 )
-from routes import drink_maker, bar, recipes
-from utils import get_db_connection, load_lists, close_db_connection
+from routes import drink_maker, bar, recipes, stock
+from utils import (
+    close_db_connection,
+    get_db_connection,
+    get_lists,
+    load_lists,
+    read_only,
+    start_db_keepalive,
+    start_local_replica_sync,
+)
+from local_replica import OfflineError, replica as local_replica
 from helpers import fetch_drinks_missing_ingredients, fetch_drinks_with_base
+from catalog import get_catalog
+from normalization import refresh_recipe_refs
+from ingest import IngestError, detect_format, ingest, iter_rows
+from rollups import GROUPINGS, parse_cursor, purchase_page, purchase_summary
+from stock import open_purchase_bottles
+from changes import ENTITIES, changes_since
+from events import broker, start_event_bridge, stream
+from fragment_cache import FragmentCacheExtension
+from metrics import metrics
+from memo import init_memo, invalidate, memo
+from singleflight import flights
+from jsonio import encode_records, encode_rows, init_json
+from assets import init_assets
+from compression import init_compression
+from warmup import migrate_on_startup, seed_from_snapshot, start_background_warmup, warm
 from config import Config
+from units import UNIT_TO_ML, convert_to_ml, normalize_unit, parse_float
 import time
 import logging
 from datetime import date
 from werkzeug.exceptions import BadRequest, BadRequestKeyError
 
-UNIT_TO_ML = {
-    "ml": 1.0,
-    "milliliter": 1.0,
-    "millilitre": 1.0,
-    "l": 1000.0,
-    "liter": 1000.0,
-    "litre": 1000.0,
-    "oz": 29.5735,
-    "fl oz": 29.5735,
-    "floz": 29.5735,
-    "fluid ounce": 29.5735,
-    "gal": 3785.41,
-    "gallon": 3785.41,
-    "qt": 946.353,
-    "quart": 946.353,
-    "pt": 473.176,
-    "pint": 473.176,
-    "cup": 236.588,
-    "tbsp": 14.7868,
-    "tablespoon": 14.7868,
-    "tsp": 4.92892,
-    "teaspoon": 4.92892,
-}
+PURCHASE_JSON_COLUMNS = (
+    "id",
+    "purchase_date",
+    "location",
+    "size_value",
+    "size_unit",
+    "size_ml",
+    "price",
+    "price_per_ml",
+    "notes",
+)
 
 PURCHASE_UNITS = [
     {"value": "ml", "label": "ml"},
@@ -52,41 +68,8 @@ PURCHASE_UNITS = [
 ]
 
 
-def _normalize_unit(unit: str) -> str:
-    u = (unit or "").strip().lower()
-    u = u.replace(".", "")
-    u = u.replace("fluid ounces", "fluid ounce")
-    u = u.replace("fluid ounce", "fl oz")
-    u = u.replace("fl oz", "fl oz")
-    u = u.replace("floz", "fl oz")
-    u = " ".join(u.split())
-    if u.endswith("s") and u[:-1] in UNIT_TO_ML:
-        u = u[:-1]
-    return u
-
-
-def _convert_to_ml(value: float, unit: str) -> float | None:
-    try:
-        v = float(value)
-    except (TypeError, ValueError):
-        return None
-    factor = UNIT_TO_ML.get(_normalize_unit(unit))
-    if not factor:
-        return None
-    return v * factor
-
-
-def _parse_float(value) -> float | None:
-    if value is None:
-        return None
-    try:
-        return float(str(value).replace(",", "").strip())
-    except (TypeError, ValueError):
-        return None
-
-
 def _format_size_value(value: float | int | None) -> str:
-    n = _parse_float(value)
+    n = parse_float(value)
     if n is None:
         return ""
     if n.is_integer():
@@ -95,42 +78,47 @@ def _format_size_value(value: float | int | None) -> str:
 
 
 def _display_unit(unit: str) -> str:
-    normalized = _normalize_unit(unit)
+    normalized = normalize_unit(unit)
     if normalized == "l":
         return "L"
     return (unit or "").strip()
 
 
-def _ensure_ingredient_purchases_table(conn) -> None:
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS IngredientPurchases (
-            id SERIAL PRIMARY KEY,
-            ingredient_id INTEGER NOT NULL REFERENCES PossibleIngredients(id) ON DELETE CASCADE,
-            purchase_date TEXT NOT NULL,
-            location TEXT,
-            size_value REAL NOT NULL,
-            size_unit TEXT NOT NULL,
-            price REAL NOT NULL,
-            notes TEXT
-        )
-        """
-    )
-    conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_ingredient_purchases_ingredient_id ON IngredientPurchases (ingredient_id)"
-    )
-    conn.commit()
-
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     app.secret_key = app.config["SECRET_KEY"]
 
-    app.config["LISTS"] = load_lists()
+    # eager: load everything before serving (old behaviour); background: boot
+    # without DB I/O and warm caches in a thread; lazy: load on first use only
+    # Migrations run before serving in every mode; only cache warm-up is deferred
+    startup_mode = app.config["STARTUP_MODE"]
+    migrated = migrate_on_startup(app)
+    if startup_mode == "eager" and migrated:
+        warm(app)
+    else:
+        seed_from_snapshot(app)
+        if startup_mode == "background":
+            start_background_warmup(app)
+    start_db_keepalive(app)
+    start_local_replica_sync(app)
+
+    broker.queue_size = app.config["EVENT_QUEUE_SIZE"]
+    broker.max_subscribers = app.config["EVENT_MAX_SUBSCRIBERS"]
+    start_event_bridge(app)
+
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache.maxsize = app.config["FRAGMENT_CACHE_SIZE"]
+
+    init_json(app)
+    init_memo(app)
+    init_assets(app)
+    init_compression(app)
 
     app.register_blueprint(drink_maker.drink_maker_bp, url_prefix="/drink")
     app.register_blueprint(bar.bar_bp, url_prefix="/bar")
     app.register_blueprint(recipes.recipes_bp, url_prefix="/recipe")
+    app.register_blueprint(stock.stock_bp, url_prefix="/stock")
 
     @app.teardown_appcontext
     def teardown_db(exception=None):
@@ -177,13 +165,31 @@ def create_app(config_class=Config):
     def _perf_start():
         g._t0 = time.perf_counter()
 
+    @before_render_template.connect_via(app)
+    def _render_start(sender, template, context, **extra):
+        g._render_t0 = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def _render_done(sender, template, context, **extra):
+        t0 = g.pop("_render_t0", None)
+        if t0 is None:
+            return
+        dt_ms = (time.perf_counter() - t0) * 1000
+        g._render_ms = g.get("_render_ms", 0.0) + dt_ms
+        metrics.observe(f"render.{template.name}", dt_ms)
+
     @app.after_request
     def _perf_log(response):
         try:
             dt_ms = (time.perf_counter() - g._t0) * 1000
             # Only log the slow endpoints (adjust threshold as you want)
-            if request.path.startswith("/recipe/recipe") or dt_ms > 300:
-                current_app.logger.warning(f"[PERF] {request.method} {request.path} -> {response.status_code} in {dt_ms:.0f} ms")
+            slow = dt_ms > 300 and response.mimetype != "text/event-stream"
+            if request.path.startswith("/recipe/recipe") or slow:
+                render = ""
+                if "_render_ms" in g:
+                    stats = g.get("fragment_cache_stats", {"hit": 0, "miss": 0})
+                    render = f" (render {g._render_ms:.0f} ms, fragments {stats['hit']} hit / {stats['miss']} miss)"
+                current_app.logger.warning(f"[PERF] {request.method} {request.path} -> {response.status_code} in {dt_ms:.0f} ms{render}")
         except Exception:
             pass
         return response
@@ -200,38 +206,69 @@ def create_app(config_class=Config):
     def home():
         return redirect(url_for("bar.bar"))
 
+    @app.route("/metrics")
+    def get_metrics():
+        snapshot = metrics.snapshot()
+        snapshot["fragment_cache_size"] = len(current_app.jinja_env.fragment_cache)
+        snapshot["memo"] = memo.stats()
+        snapshot["warmup"] = current_app.extensions.get("warmup")
+        snapshot["local_replica"] = local_replica.stats()
+        return jsonify(snapshot)
+
+    # Not @read_only: the change_log locks (changes.py) only order reads against writers on the primary
+    @app.route("/changes")
+    def get_changes():
+        # ?since=<version from the last response>&entities=recipe,ingredient,purchase
+        since = request.args.get("since", -1, type=int)
+        limit = min(request.args.get("limit", 1000, type=int), 5000)
+        requested = request.args.get("entities")
+        entities = [e.strip() for e in requested.split(",")] if requested else list(ENTITIES)
+        conn = get_db_connection()
+        try:
+            payload = changes_since(conn, since, entities, limit)
+        finally:
+            close_db_connection()
+        return jsonify(payload)
+
+    @app.route("/events/stream")
+    def event_stream():
+        subscription = broker.subscribe(request.headers.get("Last-Event-ID"))
+        if subscription is None:
+            return jsonify({"message": "Too many live connections."}), 503, {"Retry-After": "30"}
+        response = Response(
+            stream(subscription, current_app.config["EVENT_STREAM_MAX_SECONDS"]),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # Covers clients that disconnect before the generator ever runs
+        response.call_on_close(lambda: broker.unsubscribe(subscription))
+        return response
+
     @app.route("/subcategories/<category>")
+    @read_only
     def get_subcategories(category):
-        lists = current_app.config["LISTS"]
+        lists = get_lists()
         subcategories = lists["subcategories"].get(category, [])
         return jsonify(subcategories)
 
     @app.route("/ingredients")
+    @read_only
     def get_ingredients():
-        lists = current_app.config["LISTS"]
-        ingredients = set(lists["categories"])
-        for subs in lists["subcategories"].values():
-            ingredients.update(subs)
-
-        conn = get_db_connection()
-        try:
-            # Add "owned" ingredient names
-            owned_names = conn.execute(
-                "SELECT name FROM possibleingredients WHERE in_bar = TRUE"
-            ).fetchall()
-            ingredients.update([row["name"] for row in owned_names])
-
-            # Add all possible ingredient names
-            possible_ingredients = conn.execute(
-                "SELECT name FROM possibleingredients"
-            ).fetchall()
-            ingredients.update([row["name"] for row in possible_ingredients])
-
-            serialized = sorted(ingredients)
-        finally:
-            close_db_connection()
-
-        return jsonify(serialized)
+        lists = get_lists()
+        catalog = get_catalog()
+
+        def build():
+            ingredients = set(lists["categories"])
+            for subs in lists["subcategories"].values():
+                ingredients.update(subs)
+            # Every owned ingredient is also a possible ingredient, so the catalog covers both
+            ingredients.update(catalog.names())
+            return sorted(ingredients)
+
+        # Encoded once per LISTS/catalog generation
+        return app.json.cached_response(
+            ("ingredients", lists.get("_generation"), id(catalog), catalog.generation), build
+        )
 
     # --- Helpful 400 logging (Render currently only shows the status code) ---
     app.logger.setLevel(logging.INFO)
@@ -257,26 +294,21 @@ def create_app(config_class=Config):
         return "Bad Request", 400
 
     @app.route("/ingredient-details/<name>")
+    @read_only
     def get_ingredient_details(name):
-        conn = get_db_connection()
-        try:
-            ingredient = conn.execute(
-                "SELECT category, sub_category FROM PossibleIngredients WHERE name = %s",
-                (name,),
-            ).fetchone()
-        finally:
-            close_db_connection()
+        ingredient = get_catalog().find(name)
 
         if ingredient:
             return jsonify(
                 {
-                    "category": ingredient["category"],
-                    "sub_category": ingredient["sub_category"] or "",
+                    "category": ingredient.category,
+                    "sub_category": ingredient.sub_category,
                 }
             )
         return jsonify({"error": "Ingredient not found"}), 404
 
     @app.route("/missing-ingredients")
+    @read_only
     def missing_ingredients():
         if not current_app.config.get("ENABLE_FUTURE_ROUTES", False):
             abort(404)
@@ -286,6 +318,7 @@ def create_app(config_class=Config):
         )
 
     @app.route("/have-base")
+    @read_only
     def have_base():
         if not current_app.config.get("ENABLE_FUTURE_ROUTES", False):
             abort(404)
@@ -293,6 +326,7 @@ def create_app(config_class=Config):
         return render_template("have_base.html", have_base_spirit=have_base_spirit)
 
     @app.route("/lists", methods=["GET", "POST"])
+    @read_only
     def manage_lists():
         if request.method == "POST":
             conn = get_db_connection()
@@ -367,93 +401,91 @@ def create_app(config_class=Config):
             finally:
                 close_db_connection()
 
-            current_app.config["LISTS"] = load_lists()
+            current_app.config["LISTS"] = flights.do("lists", load_lists)
+            invalidate("lists")
+            # Category/sub-category sets changed, so any recipe label may resolve differently
+            conn = get_db_connection()
+            try:
+                refresh_recipe_refs(conn)
+                conn.commit()
+            finally:
+                close_db_connection()
             return redirect(url_for("manage_lists"))
 
-        return render_template("lists.html", lists=current_app.config["LISTS"])
+        return render_template("lists.html", lists=get_lists())
 
     @app.route("/possible-ingredients-json")
+    @read_only
     def possible_ingredients_json():
-        conn = get_db_connection()
-        query = """
-            SELECT DISTINCT name FROM PossibleIngredients WHERE name IS NOT NULL AND name != ''
-            UNION
-            SELECT DISTINCT category FROM PossibleIngredients WHERE category IS NOT NULL AND category != ''
-            UNION
-            SELECT DISTINCT sub_category FROM PossibleIngredients WHERE sub_category IS NOT NULL AND sub_category != ''
-            ORDER BY 1
-        """
-        try:
-            results = conn.execute(query).fetchall()
-        finally:
-            close_db_connection()
-        all_options = []
-        for row in results:
-            first_val = row["name"]
-            if first_val:
-                all_options.append(first_val)
-        return jsonify(all_options)
+        catalog = get_catalog()
+
+        def build():
+            all_options = set()
+            for ingredient in catalog:
+                all_options.update(
+                    value
+                    for value in (ingredient.name, ingredient.category, ingredient.sub_category)
+                    if value
+                )
+            return sorted(all_options)
+
+        return app.json.cached_response(("possible-ingredients", id(catalog), catalog.generation), build)
 
     @app.route("/possible-ingredients", methods=["GET", "POST"])
+    @read_only
     def possible_ingredients():
-        conn = get_db_connection()
-        try:
-            if request.method == "POST":
+        if request.method == "POST":
+            conn = get_db_connection()
+            try:
                 name = request.form["name"].strip()
                 category = request.form["category"]
                 sub_category = request.form.get("sub_category", "")
                 if name and category:
-                    conn.execute(
+                    inserted = conn.execute(
                         """
                         INSERT INTO PossibleIngredients (name, category, sub_category)
                         VALUES (%s, %s, %s)
                         ON CONFLICT DO NOTHING
+                        RETURNING id, name, category, sub_category, in_bar
                         """,
                         (name, category, sub_category or None),
-                    )
+                    ).fetchone()
                     conn.commit()
-                current_app.config["LISTS"] = load_lists()
-                return redirect(url_for("possible_ingredients"))
-
-            ingredients = conn.execute(
-                "SELECT id, name, category, sub_category FROM PossibleIngredients ORDER BY name"
-            ).fetchall()
-            categories = conn.execute(
-                "SELECT DISTINCT category FROM PossibleIngredients WHERE category IS NOT NULL ORDER BY category"
-            ).fetchall()
-        finally:
-            close_db_connection()
+                    invalidate("catalog")
+                    if inserted:
+                        get_catalog().upsert(inserted)
+                        # Recipe rows naming this bottle or its categories can now resolve to it
+                        refresh_recipe_refs(conn, (name, category, sub_category))
+                        conn.commit()
+            finally:
+                close_db_connection()
+            return redirect(url_for("possible_ingredients"))
 
+        catalog = get_catalog()
         return render_template(
             "possible_ingredients.html",
-            ingredients=ingredients,
-            categories=[cat["category"] for cat in categories],
+            ingredients=sorted(catalog, key=lambda ing: ing.name),
+            categories=catalog.categories(),
         )
 
     @app.route("/possible-ingredient-names")
+    @read_only
     def get_possible_ingredient_names():
-        conn = get_db_connection()
-        try:
-            names = conn.execute(
-                "SELECT DISTINCT name FROM PossibleIngredients ORDER BY name"
-            ).fetchall()
-        finally:
-            close_db_connection()
-        return jsonify([row["name"] for row in names])
+        catalog = get_catalog()
+        return app.json.cached_response(("ingredient-names", id(catalog), catalog.generation), catalog.names)
 
     @app.route("/ingredient-purchases/<int:ingredient_id>", methods=["GET", "POST"])
+    @read_only
     def ingredient_purchases(ingredient_id):
         conn = get_db_connection()
         try:
-            _ensure_ingredient_purchases_table(conn)
-
             if request.method == "POST":
                 data = request.get_json(silent=True) or request.form
                 purchase_date = (data.get("purchase_date") or "").strip()
                 location = (data.get("location") or "").strip()
-                size_value = _parse_float(data.get("size_value"))
+                size_value = parse_float(data.get("size_value"))
                 size_unit = (data.get("size_unit") or "").strip()
-                price = _parse_float(data.get("price"))
+                price = parse_float(data.get("price"))
                 notes = (data.get("notes") or "").strip()
 
                 if not purchase_date:
@@ -465,11 +497,12 @@ def create_app(config_class=Config):
                 if price is None or price <= 0:
                     return jsonify({"message": "Price must be a positive number."}), 400
 
-                conn.execute(
+                purchase = conn.execute(
                     """
                     INSERT INTO IngredientPurchases
-                        (ingredient_id, purchase_date, location, size_value, size_unit, price, notes)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        (ingredient_id, purchase_date, location, size_value, size_unit, size_ml, price, notes)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
                     """,
                     (
                         ingredient_id,
@@ -477,60 +510,51 @@ def create_app(config_class=Config):
                         location or None,
                         size_value,
                         size_unit,
+                        convert_to_ml(size_value, size_unit),
                         price,
                         notes or None,
                     ),
-                )
+                ).fetchone()
+                open_purchase_bottles(conn, purchase["id"])
                 conn.commit()
+                invalidate("stock")
                 return jsonify({"message": "Purchase added."}), 201
 
-            rows = conn.execute(
-                """
-                SELECT id, purchase_date, location, size_value, size_unit, price, notes
-                FROM IngredientPurchases
-                WHERE ingredient_id = %s
-                ORDER BY purchase_date DESC, id DESC
-                """,
-                (ingredient_id,),
-            ).fetchall()
+            rows = conn.run("purchases.for_ingredient", (ingredient_id,)).fetchall()
         finally:
             close_db_connection()
 
         purchases = []
         for row in rows:
-            size_value = row["size_value"]
-            size_unit = row["size_unit"]
-            size_ml = _convert_to_ml(size_value, size_unit)
+            size_ml = row["size_ml"]
             price = row["price"]
-            price_per_ml = (price / size_ml) if (size_ml and price is not None) else None
             purchases.append(
-                {
-                    "id": row["id"],
-                    "purchase_date": row["purchase_date"],
-                    "location": row["location"] or "",
-                    "size_value": size_value,
-                    "size_unit": size_unit,
-                    "size_ml": size_ml,
-                    "price": price,
-                    "price_per_ml": price_per_ml,
-                    "notes": row["notes"] or "",
-                }
+                (
+                    row["id"],
+                    row["purchase_date"],
+                    row["location"] or "",
+                    row["size_value"],
+                    row["size_unit"],
+                    size_ml,
+                    price,
+                    (price / size_ml) if (size_ml and price is not None) else None,
+                    row["notes"] or "",
+                )
             )
-        return jsonify(purchases)
+        return jsonify(encode_rows(PURCHASE_JSON_COLUMNS, purchases))
 
     @app.route("/prices", methods=["GET", "POST"])
+    @read_only
     def prices():
         conn = get_db_connection()
         try:
-            _ensure_ingredient_purchases_table(conn)
-
             if request.method == "POST":
                 ingredient_id_raw = (request.form.get("ingredient_id") or "").strip()
                 purchase_date = (request.form.get("purchase_date") or "").strip()
                 location = (request.form.get("location") or "").strip()
-                size_value = _parse_float(request.form.get("size_value"))
+                size_value = parse_float(request.form.get("size_value"))
                 size_unit = (request.form.get("size_unit") or "").strip()
-                price = _parse_float(request.form.get("price"))
+                price = parse_float(request.form.get("price"))
                 notes = (request.form.get("notes") or "").strip()
 
                 ingredient_id = None
@@ -543,11 +567,7 @@ def create_app(config_class=Config):
                     flash("Please select an ingredient.")
                     return redirect(url_for("prices"))
 
-                ingredient_exists = conn.execute(
-                    "SELECT id FROM PossibleIngredients WHERE id = %s",
-                    (ingredient_id,),
-                ).fetchone()
-                if not ingredient_exists:
+                if get_catalog().get(ingredient_id) is None:
                     flash("Selected ingredient was not found.")
                     return redirect(url_for("prices"))
 
@@ -564,11 +584,12 @@ def create_app(config_class=Config):
                     flash("Price must be a positive number.")
                     return redirect(url_for("prices"))
 
-                conn.execute(
+                purchase = conn.execute(
                     """
                     INSERT INTO IngredientPurchases
-                        (ingredient_id, purchase_date, location, size_value, size_unit, price, notes)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        (ingredient_id, purchase_date, location, size_value, size_unit, size_ml, price, notes)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
                     """,
                     (
                         ingredient_id,
@@ -576,35 +597,25 @@ def create_app(config_class=Config):
                         location or None,
                         size_value,
                         size_unit,
+                        convert_to_ml(size_value, size_unit),
                         price,
                         notes or None,
                     ),
-                )
+                ).fetchone()
+                open_purchase_bottles(conn, purchase["id"])
                 conn.commit()
+                invalidate("stock")
                 flash("Purchase added.")
                 return redirect(url_for("prices"))
 
-            ingredient_rows = conn.execute(
-                "SELECT id, name FROM PossibleIngredients ORDER BY name"
-            ).fetchall()
-            purchase_rows = conn.execute(
-                """
-                SELECT
-                    ip.id,
-                    ip.ingredient_id,
-                    pi.name AS ingredient_name,
-                    ip.purchase_date,
-                    ip.location,
-                    ip.size_value,
-                    ip.size_unit,
-                    ip.price,
-                    ip.notes
-                FROM IngredientPurchases ip
-                JOIN PossibleIngredients pi
-                  ON pi.id = ip.ingredient_id
-                ORDER BY ip.purchase_date DESC, ip.id DESC
-                """
-            ).fetchall()
+            ingredient_filter = request.args.get("ingredient_id", type=int)
+            purchase_rows, next_cursor = purchase_page(
+                conn,
+                parse_cursor(request.args.get("cursor")),
+                limit=app.config["PRICES_PAGE_SIZE"],
+                ingredient_id=ingredient_filter,
+            )
+            summary = purchase_summary(conn, "ingredient", ingredient_id=ingredient_filter)
         finally:
             close_db_connection()
 
@@ -612,7 +623,7 @@ def create_app(config_class=Config):
         for row in purchase_rows:
             size_value = row["size_value"]
             size_unit = row["size_unit"]
-            size_ml = _convert_to_ml(size_value, size_unit)
+            size_ml = row["size_ml"]
             price = row["price"]
             price_per_ml = (price / size_ml) if (size_ml and price is not None) else None
             price_per_oz = (
@@ -639,19 +650,77 @@ def create_app(config_class=Config):
 
         return render_template(
             "prices.html",
-            ingredients=ingredient_rows,
+            ingredients=sorted(get_catalog(), key=lambda ing: ing.name),
             purchases=purchases,
+            summary=summary,
+            ingredient_filter=ingredient_filter,
+            next_cursor=next_cursor,
             purchase_units=PURCHASE_UNITS,
             today=date.today().isoformat(),
         )
 
+    # Rollup totals (JSON): ?by=ingredient|location|month, optional ingredient_id / location filters
+    @app.route("/prices/summary")
+    @read_only
+    def prices_summary():
+        by = request.args.get("by", "ingredient")
+        if by not in GROUPINGS:
+            return jsonify({"message": f"'by' must be one of: {', '.join(GROUPINGS)}."}), 400
+        conn = get_db_connection()
+        try:
+            rows = purchase_summary(
+                conn,
+                by,
+                ingredient_id=request.args.get("ingredient_id", type=int),
+                location=request.args.get("location"),
+            )
+        finally:
+            close_db_connection()
+        return jsonify(encode_records(rows))
+
+    def _run_import(kind):
+        # Multipart upload ("file") or the raw request body
+        upload = request.files.get("file")
+        if upload is not None:
+            stream = upload.stream
+            fmt = detect_format(upload.filename, upload.mimetype, request.args.get("format"))
+        else:
+            stream = request.stream
+            fmt = detect_format(None, request.mimetype, request.args.get("format"))
+        if fmt is None:
+            return jsonify({"message": "Upload CSV, JSON or NDJSON (or pass ?format=)."}), 415
+
+        conn = get_db_connection()
+        try:
+            result = ingest(
+                conn,
+                kind,
+                iter_rows(stream, fmt),
+                batch_size=app.config["INGEST_BATCH_SIZE"],
+                max_errors=app.config["INGEST_MAX_ERRORS"],
+                dry_run=request.args.get("dry_run", "").lower() in ("1", "true", "yes"),
+            )
+        except IngestError as e:
+            return jsonify({"message": f"{e} Nothing was imported."}), 400
+        finally:
+            close_db_connection()
+        return jsonify(result)
+
+    @app.route("/possible-ingredients/import", methods=["POST"])
+    def import_possible_ingredients():
+        return _run_import("ingredients")
+
+    @app.route("/prices/import", methods=["POST"])
+    def import_purchases():
+        return _run_import("purchases")
+
     @app.route("/ingredient-purchase/<int:purchase_id>", methods=["DELETE"])
     def delete_ingredient_purchase(purchase_id):
         conn = get_db_connection()
         try:
-            _ensure_ingredient_purchases_table(conn)
             conn.execute("DELETE FROM IngredientPurchases WHERE id = %s", (purchase_id,))
             conn.commit()
+            invalidate("stock")
         finally:
             close_db_connection()
         return jsonify({"message": "Purchase deleted."}), 200
@@ -662,9 +731,13 @@ def create_app(config_class=Config):
         try:
             conn.execute("DELETE FROM PossibleIngredients WHERE id = %s", (id,))
             conn.commit()
+            invalidate("catalog", "bar", "stock")
+            removed = get_catalog().remove(id)
+            if removed is not None:
+                refresh_recipe_refs(conn, (removed.name, removed.category, removed.sub_category))
+                conn.commit()
         finally:
             close_db_connection()
-        current_app.config["LISTS"] = load_lists()
         return jsonify({"message": "Ingredient deleted successfully"}), 200
 
     @app.route("/update_possible_ingredient/<id>", methods=["POST"])
@@ -679,12 +752,24 @@ def create_app(config_class=Config):
             return jsonify({"message": "Name and category are required."}), 400
 
         try:
-            conn.execute(
-                "UPDATE PossibleIngredients SET name = %s, category = %s, sub_category = %s WHERE id = %s",
+            updated = conn.execute(
+                """
+                UPDATE PossibleIngredients SET name = %s, category = %s, sub_category = %s WHERE id = %s
+                RETURNING id, name, category, sub_category, in_bar
+                """,
                 (name, category, sub_category or None, id),
-            )
+            ).fetchone()
             conn.commit()
-            current_app.config["LISTS"] = load_lists()
+            invalidate("catalog")
+            if updated:
+                catalog = get_catalog()
+                previous = catalog.get(int(id))
+                catalog.upsert(updated)
+                labels = [name, category, sub_category]
+                if previous is not None:
+                    labels += [previous.name, previous.category, previous.sub_category]
+                refresh_recipe_refs(conn, labels)
+                conn.commit()
             return jsonify({"message": "Ingredient updated successfully."}), 200
         except Exception as e:
             conn.rollback()
@@ -692,6 +777,12 @@ def create_app(config_class=Config):
         finally:
             close_db_connection()
 
+    @app.errorhandler(OfflineError)
+    def handle_offline(e):
+        # Postgres is unreachable and the local replica can't stand in for this request
+        app.logger.warning("[DB] Offline: %s %s: %s", request.method, request.path, e.__cause__ or e)
+        return jsonify({"message": str(e)}), 503
+
     @app.errorhandler(404)
     def page_not_found(e):
         return render_template("404.html"), 404
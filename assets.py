@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from flask import Flask, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants are still produced/served
+    brotli = None
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+PRECOMPRESS_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+_VARIANT_SUFFIXES = (".gz", ".br")
+
+
+class AssetManifest:
+    """
+    Maps static paths to content-hashed names ("js/bar.js" -> "js/bar.1a2b3c4d5e.js") and back.
+    """
+
+    def __init__(self, hashed: Optional[Dict[str, str]] = None):
+        self.hashed: Dict[str, str] = hashed or {}
+        self.original: Dict[str, str] = {v: k for k, v in self.hashed.items()}
+
+    @classmethod
+    def build(cls, static_folder: str) -> "AssetManifest":
+        hashed: Dict[str, str] = {}
+        for root, _dirs, files in os.walk(static_folder):
+            for filename in files:
+                if filename.endswith(_VARIANT_SUFFIXES):
+                    continue
+                path = os.path.join(root, filename)
+                rel = os.path.relpath(path, static_folder).replace(os.sep, "/")
+                with open(path, "rb") as fh:
+                    digest = hashlib.sha256(fh.read()).hexdigest()[:10]
+                stem, ext = os.path.splitext(rel)
+                hashed[rel] = f"{stem}.{digest}{ext}"
+        return cls(hashed)
+
+
+def precompress(static_folder: str) -> int:
+    """
+    Write .gz (and .br when brotli is installed) next to every text asset. Returns files written.
+    """
+    written = 0
+    for root, _dirs, files in os.walk(static_folder):
+        for filename in files:
+            if os.path.splitext(filename)[1] not in PRECOMPRESS_EXTENSIONS:
+                continue
+            path = os.path.join(root, filename)
+            with open(path, "rb") as fh:
+                data = fh.read()
+            with open(path + ".gz", "wb") as fh:
+                fh.write(gzip.compress(data, compresslevel=9, mtime=0))
+            written += 1
+            if brotli is not None:
+                with open(path + ".br", "wb") as fh:
+                    fh.write(brotli.compress(data, quality=11))
+                written += 1
+    return written
+
+
+def _precompressed_variant(static_folder: str, filename: str) -> Optional[tuple[str, str]]:
+    source = safe_join(static_folder, filename)
+    if source is None or not os.path.isfile(source):
+        return None
+    accepted = request.accept_encodings
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        variant = source + suffix
+        if not accepted[encoding] or not os.path.isfile(variant):
+            continue
+        # Ignore variants left behind by an older build of the file
+        if os.path.getmtime(variant) >= os.path.getmtime(source):
+            return encoding, filename + suffix
+    return None
+
+
+def init_assets(app: Flask) -> None:
+    """
+    Fingerprint url_for('static', ...) and serve hashed names with immutable caching,
+    preferring precompressed variants when the client accepts them.
+    """
+    static_folder = app.static_folder
+    if not static_folder or not app.config.get("ASSET_FINGERPRINTING", True):
+        return
+
+    manifest = AssetManifest.build(static_folder)
+    app.extensions["asset_manifest"] = manifest
+
+    @app.url_defaults
+    def _fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = manifest.hashed.get(values["filename"], values["filename"])
+
+    def static(filename):
+        original = manifest.original.get(filename)
+        real = original or filename
+        # Hashed names never change content, so browsers may keep them for a year
+        max_age = IMMUTABLE_MAX_AGE if original else None
+        variant = _precompressed_variant(static_folder, real)
+
+        if variant:
+            encoding, served = variant
+            response = send_from_directory(
+                static_folder,
+                served,
+                mimetype=mimetypes.guess_type(real)[0] or "application/octet-stream",
+                max_age=max_age,
+            )
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = send_from_directory(static_folder, real, max_age=max_age)
+        response.vary.add("Accept-Encoding")
+
+        if original:
+            response.cache_control.immutable = True
+        return response
+
+    app.view_functions["static"] = static
+
+
+if __name__ == "__main__":
+    here = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    print(f"Precompressed {precompress(here)} static variants in {here}")
@@ -0,0 +1,266 @@
+import math
+import time
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+from catalog import IngredientCatalog, get_catalog
+from metrics import metrics
+from resolver import REF_CATEGORY, REF_INGREDIENT, REF_SUB_CATEGORY, IngredientResolver, get_resolver
+from units import convert_to_ml, parse_quantity
+
+# A single bottle provides at most three tokens (its id, category and sub_category),
+# so only recipes missing that many or fewer can be unlocked by one purchase.
+_MAX_TOKENS_PER_BOTTLE = 3
+
+# Requirement tokens: an ingredient id (int) for a named bottle, a lowercase
+# label (str) for a category/sub-category, or ("?", label) for labels nothing
+# in the catalog can ever satisfy.
+Token = Hashable
+
+
+def _label_key(label: Optional[str]) -> str:
+    return (label or "").strip().lower()
+
+
+def _bottle_tokens(ingredient_id: int, category: str, sub_category: str) -> FrozenSet[Token]:
+    tokens = {key for key in map(_label_key, (category, sub_category)) if key}
+    tokens.add(ingredient_id)
+    return frozenset(tokens)
+
+
+def requirement_token(label_key: str, ref_kind: Optional[str], ingredient_id: Optional[int]) -> Token:
+    if ref_kind in (REF_CATEGORY, REF_SUB_CATEGORY):
+        return label_key
+    if ref_kind == REF_INGREDIENT and ingredient_id is not None:
+        return ingredient_id
+    return ("?", label_key)
+
+
+def recipe_row_token(row, resolver: Optional[IngredientResolver] = None) -> Token:
+    """Token for a recipeingredients row, resolving rows not yet backfilled (ref_kind IS NULL)."""
+    if row["ref_kind"] is None:
+        ref = (resolver or get_resolver()).reference(row["ingredient"])
+        return requirement_token(ref.label_key, ref.ref_kind, ref.ingredient_id)
+    return requirement_token(row["label_key"], row["ref_kind"], row["possible_ingredient_id"])
+
+
+def serving_ml(quantity, unit) -> float:
+    """Volume one serving needs; 0.0 when the amount isn't a volume (e.g. "1 sprig")."""
+    amount = parse_quantity(quantity)
+    return (convert_to_ml(amount, unit) or 0.0) if amount is not None else 0.0
+
+
+def providers(token: Token, catalog: IngredientCatalog) -> List:
+    """Catalog records that satisfy a requirement token."""
+    if isinstance(token, int):
+        record = catalog.get(token)
+        return [record] if record is not None else []
+    if isinstance(token, str):
+        return [
+            record
+            for record in catalog
+            if token in (_label_key(record.category), _label_key(record.sub_category))
+        ]
+    return []
+
+
+def _subset_masks(index: Dict[FrozenSet[Token], int], tokens: FrozenSet[Token]) -> int:
+    """OR together the recipe masks whose missing set is a non-empty subset of tokens."""
+    mask = 0
+    items = tuple(tokens)
+    for size in range(1, len(items) + 1):
+        for subset in combinations(items, size):
+            mask |= index.get(frozenset(subset), 0)
+    return mask
+
+
+class AvailabilityIndex:
+    """
+    Recipe requirement sets checked against the labels the bar currently provides.
+
+    Each recipe is a bit position; sets of recipes are plain Python ints so
+    "which drinks does this bottle unlock" is a handful of ORs and a popcount.
+
+    Owned bottles carry their remaining volume (None when untracked, i.e.
+    unlimited). A requirement is met when some bottle providing its token
+    holds at least one serving's worth.
+    """
+
+    def __init__(
+        self,
+        recipes: List[Tuple[int, str, str, List[Tuple[str, Token, float]]]],
+        owned: Iterable[Tuple[int, str, str, Optional[float]]],
+        candidates: Iterable[Tuple[int, str, str, str]] = (),
+    ):
+        self.volumes: Dict[Token, float] = {}
+        self.owned_sub_categories: set[str] = set()
+        for ingredient_id, category, sub_category, remaining_ml in owned:
+            volume = math.inf if remaining_ml is None else remaining_ml
+            if volume <= 0:
+                continue
+            for token in _bottle_tokens(ingredient_id, category, sub_category):
+                self.volumes[token] = max(self.volumes.get(token, 0.0), volume)
+            if _label_key(sub_category):
+                self.owned_sub_categories.add(_label_key(sub_category))
+        self.available: set[Token] = set(self.volumes)
+
+        self.recipe_ids: List[int] = []
+        self.drinks: List[str] = []
+        self.base_spirits: List[str] = []
+        self.missing: List[FrozenSet[Token]] = []
+        self._display: List[Dict[Token, str]] = []
+
+        # Tokens we own but not enough of for some recipe
+        self.short: set[Token] = set()
+        for recipe_id, drink, base_spirit, ingredients in recipes:
+            display: Dict[Token, str] = {}
+            need: Dict[Token, float] = defaultdict(float)
+            for label, token, ml in ingredients:
+                if token not in display:
+                    display[token] = label.strip()
+                need[token] += ml
+            missing = frozenset(t for t in display if t not in self.volumes or self.volumes[t] < need[t])
+            self.short.update(missing & self.available)
+            self.recipe_ids.append(recipe_id)
+            self.drinks.append(drink)
+            self.base_spirits.append((base_spirit or "").strip())
+            self.missing.append(missing)
+            self._display.append(display)
+
+        # Bottles we could buy: anything in the catalog that adds a token we lack or are short of
+        sufficient = self.available - self.short
+        self.candidates: List[Tuple[str, FrozenSet[Token]]] = []
+        for ingredient_id, name, category, sub_category in candidates:
+            tokens = _bottle_tokens(ingredient_id, category, sub_category) - sufficient
+            if tokens:
+                self.candidates.append((name, tokens))
+
+    # ---- missing-k ----
+
+    def missing_labels(self, i: int) -> List[str]:
+        display = self._display[i]
+        return sorted((display[k] for k in self.missing[i]), key=str.lower)
+
+    def missing_k(self, k: int) -> List[int]:
+        """Recipe indexes exactly k ingredients away, ordered by drink name."""
+        hits = [i for i, m in enumerate(self.missing) if len(m) == k]
+        return sorted(hits, key=lambda i: self.drinks[i].lower())
+
+    def by_missing_count(self, max_k: int) -> Dict[int, List[int]]:
+        buckets: Dict[int, List[int]] = {k: [] for k in range(max_k + 1)}
+        for i, m in enumerate(self.missing):
+            if len(m) <= max_k:
+                buckets[len(m)].append(i)
+        for k in buckets:
+            buckets[k].sort(key=lambda i: self.drinks[i].lower())
+        return buckets
+
+    def drinks_in(self, mask: int) -> List[str]:
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self.drinks[low.bit_length() - 1])
+            mask ^= low
+        return sorted(names, key=str.lower)
+
+    # ---- shopping ----
+
+    @staticmethod
+    def _index_by_missing(residual: List[FrozenSet[Token]]) -> Tuple[Dict[FrozenSet[Token], int], Dict[Token, int]]:
+        by_set: Dict[FrozenSet[Token], int] = defaultdict(int)
+        by_label: Dict[Token, int] = defaultdict(int)
+        for i, m in enumerate(residual):
+            if not m:
+                continue
+            bit = 1 << i
+            if len(m) <= _MAX_TOKENS_PER_BOTTLE:
+                by_set[m] |= bit
+            for label in m:
+                by_label[label] |= bit
+        return by_set, by_label
+
+    def best_single_purchases(self, limit: int = 10) -> List[dict]:
+        """Rank candidate bottles by how many drinks each one unlocks on its own."""
+        by_set, _ = self._index_by_missing(self.missing)
+        ranked = []
+        for name, tokens in self.candidates:
+            mask = _subset_masks(by_set, tokens)
+            if mask:
+                ranked.append((mask.bit_count(), name, mask))
+        ranked.sort(key=lambda item: (-item[0], item[1].lower()))
+        return [
+            {"ingredient": name, "unlocks": count, "drinks": self.drinks_in(mask)}
+            for count, name, mask in ranked[:limit]
+        ]
+
+    def best_purchase_set(self, budget: int) -> dict:
+        """
+        Greedy set cover: pick up to `budget` bottles, each time taking the one that
+        unlocks the most new drinks (ties broken by how many recipes it brings closer).
+        """
+        residual = list(self.missing)
+        unlocked = 0
+        picks = []
+        remaining = list(self.candidates)
+
+        for _ in range(max(0, budget)):
+            by_set, by_label = self._index_by_missing(residual)
+            best = None
+            for pos, (name, tokens) in enumerate(remaining):
+                gain_mask = _subset_masks(by_set, tokens) & ~unlocked
+                progress_mask = 0
+                for label in tokens:
+                    progress_mask |= by_label.get(label, 0)
+                score = (gain_mask.bit_count(), progress_mask.bit_count())
+                if score[1] and (best is None or score > best[0]):
+                    best = (score, pos, gain_mask)
+            if best is None:
+                break
+
+            _, pos, gain_mask = best
+            name, tokens = remaining.pop(pos)
+            unlocked |= gain_mask
+            residual = [m - tokens if m else m for m in residual]
+            picks.append({"ingredient": name, "unlocks": self.drinks_in(gain_mask)})
+
+        return {
+            "ingredients": picks,
+            "unlocks": unlocked.bit_count(),
+            "drinks": self.drinks_in(unlocked),
+        }
+
+
+def load_availability(conn) -> AvailabilityIndex:
+    """
+    Build an AvailabilityIndex from the current recipes and bar contents (two queries).
+
+    Recipe rows carry their write-time resolution; rows not yet backfilled
+    (ref_kind IS NULL) are resolved here instead. Owned ingredients with bottle
+    rows (stock.py) are limited to what their open bottles hold.
+    """
+    t0 = time.perf_counter()
+    rows = conn.run("availability.requirements").fetchall()
+    owned_rows = conn.run("availability.owned").fetchall()
+
+    resolver = None
+    recipes: Dict[int, Tuple[str, str, List[Tuple[str, Token, float]]]] = {}
+    for row in rows:
+        entry = recipes.setdefault(row["recipe_id"], (row["drink"], row["base_spirit"], []))
+        label = row["ingredient"]
+        if not label or not label.strip():
+            continue
+        if row["ref_kind"] is None:
+            resolver = resolver or get_resolver()
+        entry[2].append((label, recipe_row_token(row, resolver), serving_ml(row["quantity"], row["unit"])))
+
+    owned = [(r["id"], r["category"], r["sub_category"], r["remaining_ml"]) for r in owned_rows]
+    candidates = [(ing.id, ing.name, ing.category, ing.sub_category) for ing in get_catalog()]
+
+    index = AvailabilityIndex(
+        [(recipe_id, drink, base, ingredients) for recipe_id, (drink, base, ingredients) in recipes.items()],
+        owned,
+        candidates,
+    )
+    metrics.observe("availability.build", (time.perf_counter() - t0) * 1000)
+    return index
@@ -6,3 +6,6 @@ pip install -r requirements.txt
 # Install Node dependencies and build Tailwind
 npm install
 npm run build:css
+
+# Precompress static assets (served when the browser accepts gzip/brotli)
+python assets.py
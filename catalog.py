@@ -0,0 +1,177 @@
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from flask import current_app, has_request_context
+
+from singleflight import flights
+from utils import get_db_connection
+
+
+class IngredientRecord:
+    """
+    Compact, slot-based view of a single PossibleIngredients row.
+    """
+
+    __slots__ = ("id", "name", "category", "sub_category", "in_bar")
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        category: str,
+        sub_category: str = "",
+        in_bar: bool = False,
+    ):
+        self.id = id
+        self.name = name
+        # Categories repeat across hundreds of rows; intern them so every
+        # record shares a single string object per distinct value.
+        self.category = sys.intern(category)
+        self.sub_category = sys.intern(sub_category)
+        self.in_bar = in_bar
+
+    @classmethod
+    def from_row(cls, row: Any) -> "IngredientRecord":
+        return cls(
+            int(row["id"]),
+            (row["name"] or "").strip(),
+            (row["category"] or "").strip(),
+            (row.get("sub_category") or "").strip(),
+            bool(row.get("in_bar")),
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        # Lets templates and callers keep using row["name"] style access.
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "category": self.category,
+            "sub_category": self.sub_category,
+            "in_bar": self.in_bar,
+        }
+
+    def __repr__(self) -> str:
+        return f"IngredientRecord({self.id!r}, {self.name!r}, {self.category!r}, {self.sub_category!r})"
+
+
+class IngredientCatalog:
+    """
+    In-memory index of PossibleIngredients keyed by id and lowercase name.
+
+    Loaded once per worker, then kept current with upsert()/remove() after each
+    write instead of re-reading the whole table. `generation` increases whenever
+    names or categories change so derived lookups know when to rebuild.
+    """
+
+    def __init__(self, records: Optional[List[IngredientRecord]] = None):
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, IngredientRecord] = {}
+        self._by_name: Dict[str, IngredientRecord] = {}
+        self.generation = 0
+        self.loaded_at = time.monotonic()
+        for record in records or []:
+            self._index(record)
+
+    @classmethod
+    def load(cls, conn) -> "IngredientCatalog":
+        rows = conn.run("catalog.all").fetchall()
+        return cls([IngredientRecord.from_row(row) for row in rows])
+
+    def _index(self, record: IngredientRecord) -> None:
+        self._by_id[record.id] = record
+        if record.name:
+            self._by_name[record.name.lower()] = record
+
+    def _unindex(self, record: IngredientRecord) -> None:
+        key = record.name.lower()
+        if self._by_name.get(key) is record:
+            del self._by_name[key]
+        self._by_id.pop(record.id, None)
+
+    def upsert(self, row: Any) -> IngredientRecord:
+        """Insert or replace a record from a DB row (or any mapping with the same keys)."""
+        record = IngredientRecord.from_row(row)
+        with self._lock:
+            previous = self._by_id.get(record.id)
+            if previous is not None:
+                self._unindex(previous)
+            self._index(record)
+            self.generation += 1
+        return record
+
+    def remove(self, ingredient_id: int) -> Optional[IngredientRecord]:
+        with self._lock:
+            record = self._by_id.get(ingredient_id)
+            if record is not None:
+                self._unindex(record)
+                self.generation += 1
+        return record
+
+    def set_in_bar(self, name: str, in_bar: bool) -> Optional[IngredientRecord]:
+        # Ownership does not change names or categories, so generation stays put.
+        record = self._by_name.get((name or "").strip().lower())
+        if record is not None:
+            record.in_bar = in_bar
+        return record
+
+    def get(self, ingredient_id: int) -> Optional[IngredientRecord]:
+        return self._by_id.get(ingredient_id)
+
+    def find(self, name: str) -> Optional[IngredientRecord]:
+        return self._by_name.get((name or "").strip().lower())
+
+    def names(self) -> List[str]:
+        return sorted({record.name for record in self._by_id.values() if record.name})
+
+    def categories(self) -> List[str]:
+        return sorted({record.category for record in self._by_id.values() if record.category})
+
+    def __iter__(self) -> Iterator[IngredientRecord]:
+        return iter(list(self._by_id.values()))
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+
+def get_catalog() -> IngredientCatalog:
+    """
+    Return the per-worker catalog, loading it on first use or once it is older
+    than CATALOG_MAX_AGE seconds (other workers' writes only reach us on reload).
+
+    An expired catalog keeps being served while one background thread reloads
+    it; a stale catalog (e.g. seeded from the warm snapshot) beats making every
+    request wait for the same query.
+    """
+    catalog = current_app.config.get("CATALOG")
+    max_age = current_app.config.get("CATALOG_MAX_AGE", 300)
+    if catalog is not None and (not max_age or time.monotonic() - catalog.loaded_at < max_age):
+        return catalog
+    if catalog is None:
+        return flights.do("catalog", reload_catalog)
+    flights.refresh("catalog", reload_catalog)
+    return catalog
+
+
+def reload_catalog() -> IngredientCatalog:
+    """
+    Load the catalog from the database and install it in the app config.
+    """
+    catalog = current_app.config.get("CATALOG")
+    conn = get_db_connection()
+    try:
+        fresh = IngredientCatalog.load(conn)
+    finally:
+        if not has_request_context():
+            conn.close()
+    if catalog is not None:
+        # Keep generations monotonic so dependent caches notice the reload.
+        fresh.generation = catalog.generation + 1
+    current_app.config["CATALOG"] = fresh
+    return fresh
@@ -0,0 +1,150 @@
+"""
+Delta sync over the change_log table (migrations/m0005).
+
+Clients keep the `version` from their last response and pass it back as
+`since`; they get only the rows written after it (latest state per entity),
+or a full snapshot with "reset": true when they have no cursor yet (since < 0)
+or their cursor predates the retained log.
+
+A cursor belongs to the entities it was read for. Writers lock per entity
+(migrations/m0009), so versions are only in commit order within one entity;
+reads hold those locks in shared mode, which waits out in-flight writers of
+the requested entities and holds new ones back until the read is done.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional
+
+from flask import current_app
+
+from helpers import build_recipe_payload, fetch_recipe_ingredients
+from utils import get_db_connection
+from warmup import register_warmer
+
+# entity name in change_log -> key in the response
+ENTITIES = {"recipe": "recipes", "ingredient": "ingredients", "purchase": "purchases"}
+
+# Advisory lock (class, key) the change_log trigger takes per entity (migrations/m0009)
+_LOCK_CLASS = 7326002
+_LOCK_KEYS = {"recipe": 1, "ingredient": 2, "purchase": 3}
+
+
+def _load_recipes(conn, ids: Optional[List[int]]) -> Dict[int, dict]:
+    if ids is None:
+        rows = conn.execute("SELECT * FROM recipes").fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM recipes WHERE id = ANY(%s)", (ids,)).fetchall()
+    ingredients = fetch_recipe_ingredients(conn, [row["id"] for row in rows])
+    return {row["id"]: build_recipe_payload(row, ingredients.get(row["id"], [])) for row in rows}
+
+
+def _load_ingredients(conn, ids: Optional[List[int]]) -> Dict[int, dict]:
+    sql = "SELECT id, name, category, sub_category, in_bar FROM possibleingredients"
+    rows = conn.execute(sql).fetchall() if ids is None else conn.execute(f"{sql} WHERE id = ANY(%s)", (ids,)).fetchall()
+    return {row["id"]: dict(row) for row in rows}
+
+
+def _load_purchases(conn, ids: Optional[List[int]]) -> Dict[int, dict]:
+    sql = """
+        SELECT id, ingredient_id, purchase_date, location, size_value, size_unit, price, notes
+        FROM IngredientPurchases
+    """
+    rows = conn.execute(sql).fetchall() if ids is None else conn.execute(f"{sql} WHERE id = ANY(%s)", (ids,)).fetchall()
+    return {row["id"]: dict(row) for row in rows}
+
+
+_LOADERS: Dict[str, Callable] = {
+    "recipe": _load_recipes,
+    "ingredient": _load_ingredients,
+    "purchase": _load_purchases,
+}
+
+
+def current_version(conn, entities: Iterable[str] = tuple(ENTITIES)) -> int:
+    return conn.execute(
+        "SELECT COALESCE(max(version), 0) AS version FROM change_log WHERE entity = ANY(%s)",
+        (list(entities),),
+    ).fetchone()["version"]
+
+
+def _lock_entities(conn, entities: List[str]) -> None:
+    """Wait for in-flight writers of `entities`, and keep new ones out until this transaction ends."""
+    keys = sorted(_LOCK_KEYS[entity] for entity in entities)
+    conn.execute(
+        "SELECT count(pg_advisory_xact_lock_shared(%s, key)) AS n FROM unnest(%s::int[]) AS key",
+        (_LOCK_CLASS, keys),
+    ).fetchone()
+
+
+def changes_since(conn, since: int, entities: Iterable[str] = tuple(ENTITIES), limit: int = 1000) -> dict:
+    """
+    Return rows changed after `since`, reading at most `limit` log entries.
+    When "more" is true the client should call again with the returned version.
+    """
+    entities = [e for e in entities if e in ENTITIES]
+    _lock_entities(conn, entities)
+    oldest = conn.execute("SELECT min(version) AS version FROM change_log").fetchone()["version"]
+
+    if since < 0 or (oldest is not None and since < oldest - 1):
+        version = current_version(conn, entities)
+        result = {"version": version, "reset": True, "more": False}
+        for entity in entities:
+            rows = _LOADERS[entity](conn, None)
+            result[ENTITIES[entity]] = {"upserted": list(rows.values()), "deleted": []}
+        return result
+
+    log = conn.execute(
+        """
+        SELECT version, entity, entity_id, op
+        FROM change_log
+        WHERE version > %s AND entity = ANY(%s)
+        ORDER BY version
+        LIMIT %s
+        """,
+        (since, entities, limit),
+    ).fetchall()
+
+    # Latest op per entity wins; an upsert whose row is gone is reported as deleted
+    latest: Dict[str, Dict[int, str]] = {entity: {} for entity in entities}
+    for row in log:
+        latest[row["entity"]][row["entity_id"]] = row["op"]
+
+    result = {
+        "version": log[-1]["version"] if log else max(since, current_version(conn, entities)),
+        "reset": False,
+        "more": len(log) == limit,
+    }
+    for entity in entities:
+        ops = latest[entity]
+        wanted = [entity_id for entity_id, op in ops.items() if op == "upsert"]
+        rows = _LOADERS[entity](conn, wanted) if wanted else {}
+        result[ENTITIES[entity]] = {
+            "upserted": [rows[entity_id] for entity_id in wanted if entity_id in rows],
+            "deleted": sorted(entity_id for entity_id in ops if entity_id not in rows),
+        }
+    return result
+
+
+def prune_change_log(conn, retention_days: int) -> int:
+    """Drop log entries older than the retention window, always keeping the newest one."""
+    cur = conn.execute(
+        """
+        DELETE FROM change_log
+        WHERE changed_at < now() - make_interval(days => %s)
+          AND version < (SELECT max(version) FROM change_log)
+        """,
+        (retention_days,),
+    )
+    return cur.rowcount or 0
+
+
+@register_warmer
+def _prune_on_warmup() -> None:
+    retention_days = current_app.config.get("CHANGE_LOG_RETENTION_DAYS", 30)
+    if not retention_days:
+        return
+    conn = get_db_connection()
+    try:
+        prune_change_log(conn, retention_days)
+        conn.commit()
+    finally:
+        conn.close()
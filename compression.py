@@ -0,0 +1,67 @@
+import gzip
+
+from flask import Flask, request
+
+try:
+    import brotli
+except ImportError:  # optional: fall back to gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+
+def _choose_encoding() -> str | None:
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def init_compression(app: Flask) -> None:
+    """
+    Compress HTML/JSON/text responses on the fly once they exceed COMPRESS_MIN_SIZE bytes.
+    """
+    if not app.config.get("COMPRESS_ENABLED", True):
+        return
+
+    min_size = app.config.get("COMPRESS_MIN_SIZE", 500)
+    level = app.config.get("COMPRESS_LEVEL", 6)
+
+    @app.after_request
+    def compress_response(response):
+        # Files and streams (static assets, SSE) are left alone
+        if response.direct_passthrough or response.is_streamed:
+            return response
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = _choose_encoding()
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        if encoding == "br":
+            # Brotli quality 0-11; map the gzip-style 1-9 level onto it
+            compressed = brotli.compress(data, quality=min(11, level))
+        else:
+            compressed = gzip.compress(data, compresslevel=level)
+
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        return response
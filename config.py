@@ -15,3 +15,67 @@ class Config:
     AUTO_OPEN_BROWSER = os.getenv("FLASK_AUTO_OPEN_BROWSER", "false").lower() == "true"
     SHOW_VIEWPORT_DEBUG = os.getenv("SHOW_VIEWPORT_DEBUG", "false").lower() == "true"
     ENABLE_FUTURE_ROUTES = os.getenv("ENABLE_FUTURE_ROUTES", "false").lower() == "true"
+    CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "300"))
+    FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "2048"))
+    # Hashed static names are cached "forever"; skip them while Tailwind --watch rewrites CSS
+    ASSET_FINGERPRINTING = os.getenv("ASSET_FINGERPRINTING", "false" if FLASK_DEV else "true").lower() == "true"
+    COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "true").lower() == "true"
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))
+    COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+    # Applied in create_app() before serving; set false to run `python -m migrations` as a release step instead
+    RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "true").lower() == "true"
+    STARTUP_MODE = os.getenv("STARTUP_MODE", "background").lower()
+    WARMUP_ATTEMPTS = int(os.getenv("WARMUP_ATTEMPTS", "4"))
+    WARM_SNAPSHOT_PATH = os.getenv("WARM_SNAPSHOT_PATH")
+    DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+    DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "3"))
+    DB_CONNECT_BACKOFF = float(os.getenv("DB_CONNECT_BACKOFF", "0.25"))
+    # Seconds between keepalive pings (0 = off); pings stop after IDLE_AFTER seconds without traffic
+    DB_KEEPALIVE_INTERVAL = int(os.getenv("DB_KEEPALIVE_INTERVAL", "0"))
+    DB_KEEPALIVE_IDLE_AFTER = int(os.getenv("DB_KEEPALIVE_IDLE_AFTER", "900"))
+    # Connections kept per worker when psycopg_pool is installed (0 = a new connection per request)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    # Seconds a request waits for a free pooled connection
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    # Send registered queries (queries.py) as server-side prepared statements on pooled connections
+    DB_PREPARE = os.getenv("DB_PREPARE", "true").lower() == "true"
+    # Read-only views use DATABASE_READ_URL when set; after a failed replica connect, the primary for this long
+    DB_READ_RETRY_AFTER = int(os.getenv("DB_READ_RETRY_AFTER", "30"))
+    # Local SQLite replica (local_replica.py): fast reads, and offline operation with queued writes
+    LOCAL_REPLICA = os.getenv("LOCAL_REPLICA", "false").lower() == "true"
+    LOCAL_REPLICA_PATH = os.getenv("LOCAL_REPLICA_PATH")
+    LOCAL_REPLICA_SYNC_INTERVAL = int(os.getenv("LOCAL_REPLICA_SYNC_INTERVAL", "30"))
+    # After a write, sync this many seconds later (one sync for all the writes in between)
+    LOCAL_REPLICA_WRITE_SYNC_DELAY = int(os.getenv("LOCAL_REPLICA_WRITE_SYNC_DELAY", "5"))
+    CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30"))
+    EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+    EVENT_MAX_SUBSCRIBERS = int(os.getenv("EVENT_MAX_SUBSCRIBERS", "50"))
+    # Below gunicorn's worker timeout. Streams hold a worker each: run gunicorn with -k gevent
+    EVENT_STREAM_MAX_SECONDS = int(os.getenv("EVENT_STREAM_MAX_SECONDS", "25"))
+    # Carry events between workers over Postgres LISTEN/NOTIFY (events.py)
+    EVENT_BRIDGE = os.getenv("EVENT_BRIDGE", "true").lower() == "true"
+    BAR_BULK_MAX_OPERATIONS = int(os.getenv("BAR_BULK_MAX_OPERATIONS", "500"))
+    # Rows validated and written per statement by the bulk import endpoints
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+    INGEST_MAX_ERRORS = int(os.getenv("INGEST_MAX_ERRORS", "100"))
+    SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "10"))
+    # Weight ingredients by pour size (2 oz of gin counts more than a dash of bitters)
+    SIMILARITY_WEIGHT_QUANTITIES = os.getenv("SIMILARITY_WEIGHT_QUANTITIES", "false").lower() == "true"
+    # Rebuild the substitution graph this often so recipe edits reach its context edges
+    SUBSTITUTION_MAX_AGE = int(os.getenv("SUBSTITUTION_MAX_AGE", "300"))
+    PLAN_MAX_ITEMS = int(os.getenv("PLAN_MAX_ITEMS", "500"))
+    # Purchases per /prices page (older ones are reached with ?cursor=)
+    PRICES_PAGE_SIZE = int(os.getenv("PRICES_PAGE_SIZE", "50"))
+    # Pour rate is averaged over this many days; stock projected to run out within LOW_DAYS is "low"
+    STOCK_RATE_WINDOW_DAYS = int(os.getenv("STOCK_RATE_WINDOW_DAYS", "30"))
+    STOCK_LOW_DAYS = int(os.getenv("STOCK_LOW_DAYS", "14"))
+    STOCK_MAX_POURS = int(os.getenv("STOCK_MAX_POURS", "500"))
+    # Memoised helpers (memo.py): memory | sqlite (shared by the workers on this host) | off
+    MEMO_BACKEND = os.getenv("MEMO_BACKEND", "memory").lower()
+    MEMO_TTL = int(os.getenv("MEMO_TTL", "300"))
+    # An expired entry is still served (and refreshed in the background) for this long
+    MEMO_STALE_TTL = int(os.getenv("MEMO_STALE_TTL", "600"))
+    MEMO_MAX_ENTRIES = int(os.getenv("MEMO_MAX_ENTRIES", "256"))
+    MEMO_SQLITE_PATH = os.getenv("MEMO_SQLITE_PATH")
+    # JSON encoder (jsonio.py): orjson when installed, or std
+    JSON_BACKEND = os.getenv("JSON_BACKEND", "orjson").lower()
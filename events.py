@@ -0,0 +1,327 @@
+"""
+Server-Sent Events fan-out.
+
+Writers call broker.publish(type, data) after committing. With the bridge on
+(EVENT_BRIDGE, start_event_bridge) the event goes out as a Postgres NOTIFY on
+EVENT_CHANNEL and every worker's listener hands it to its own open
+/events/stream clients, so a write on one worker reaches tabs connected to
+another. Without it (or while the NOTIFY fails) only this worker's clients
+get it. Each subscriber has a bounded
+queue, so a stalled client costs at most EVENT_QUEUE_SIZE events of memory:
+on overflow its queue is dropped and it is told to resync (e.g. via
+/changes). A small ring of recent events lets a reconnecting EventSource
+resume from Last-Event-ID.
+
+Only the bar page opens a stream. A stream holds its worker for up to
+EVENT_STREAM_MAX_SECONDS: serve it from gevent workers
+(gunicorn -k gevent) so open tabs don't take every sync worker.
+"""
+
+import itertools
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Iterator, List, Optional, Set, Tuple
+
+import psycopg
+from flask import Flask
+
+from availability import load_availability
+from metrics import metrics
+
+Event = Tuple[int, str, dict]
+
+EVENT_CHANNEL = "homebar_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more; bigger events become a resync
+_MAX_PAYLOAD = 7900
+# Workers with subscribers announce it this often; an announcement counts for _PRESENCE_TTL
+_PRESENCE_INTERVAL = 20.0
+_PRESENCE_TTL = 60.0
+# Events waiting for the sender thread; beyond this they are delivered on this worker only
+_OUTBOX_SIZE = 1000
+
+
+class Subscription:
+    def __init__(self, maxsize: int):
+        self._events: Deque[Event] = deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self.overflowed = False
+
+    def push(self, event: Event) -> None:
+        with self._cond:
+            if len(self._events) >= self._maxsize:
+                # Too far behind to catch up event by event
+                self._events.clear()
+                self.overflowed = True
+                metrics.incr("events.overflow")
+            else:
+                self._events.append(event)
+            self._cond.notify()
+
+    def pop_all(self, timeout: float) -> Tuple[List[Event], bool]:
+        """Wait up to `timeout` seconds; return (events, overflowed) and reset both."""
+        with self._cond:
+            if not self._events and not self.overflowed:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            overflowed, self.overflowed = self.overflowed, False
+            return events, overflowed
+
+
+class EventBroker:
+    def __init__(self, queue_size: int = 100, history_size: int = 256, max_subscribers: int = 50):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        # Event ids are "<epoch>-<n>"; a Last-Event-ID from another worker or an
+        # earlier process has a different epoch and gets a resync instead of a replay.
+        self.epoch = secrets.token_hex(4)
+        self._ids = itertools.count(1)
+        self._subscribers: Set[Subscription] = set()
+        self._history: Deque[Event] = deque(maxlen=history_size)
+        # Set by start_event_bridge(): publish() goes through Postgres NOTIFY
+        self.bridge: Optional["EventBridge"] = None
+        # monotonic time a subscriber was last connected here; streams reconnect
+        # every EVENT_STREAM_MAX_SECONDS, so "just left" still counts as listening
+        self._last_subscribed = -_PRESENCE_TTL
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def has_listeners(self) -> bool:
+        """Anyone, on this worker or (with the bridge) another, recently had a stream open."""
+        if self._subscribers or time.monotonic() - self._last_subscribed < _PRESENCE_TTL:
+            return True
+        return self.bridge is not None and self.bridge.remote_listeners()
+
+    def _parse_event_id(self, value: Optional[str]) -> Optional[int]:
+        epoch, _, n = (value or "").partition("-")
+        if epoch != self.epoch or not n.isdigit():
+            return None
+        return int(n)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Optional[Subscription]:
+        """Register a subscriber, replaying events after last_event_id. None when full."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self.queue_size)
+            if last_event_id:
+                last = self._parse_event_id(last_event_id)
+                if last is None or (self._history and self._history[0][0] > last + 1):
+                    subscription.overflowed = True
+                else:
+                    for event in [e for e in self._history if e[0] > last][-self.queue_size:]:
+                        subscription.push(event)
+            first = not self._subscribers and time.monotonic() - self._last_subscribed >= _PRESENCE_TTL
+            self._subscribers.add(subscription)
+            self._last_subscribed = time.monotonic()
+        if first and self.bridge is not None:
+            self.bridge.announce()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.discard(subscription)
+                self._last_subscribed = time.monotonic()
+
+    def publish(self, event_type: str, data: dict) -> None:
+        """Send an event to every worker's subscribers (this worker's only, without the bridge)."""
+        if self.bridge is not None and self.bridge.send(event_type, data):
+            return
+        self.deliver(event_type, data)
+
+    def deliver(self, event_type: str, data: dict) -> int:
+        """Fan an event out to this worker's subscribers."""
+        with self._lock:
+            event = (next(self._ids), event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(event)
+        metrics.incr(f"events.published.{event_type}")
+        return event[0]
+
+
+class EventBridge:
+    """
+    Carries events between workers over Postgres LISTEN/NOTIFY. send() only
+    queues: a sender thread notifies on its own autocommit connection, so a
+    slow or unreachable database never holds up the request that published.
+    A listener thread delivers every notification on EVENT_CHANNEL (including
+    this worker's own) to the broker.
+
+    Workers with open streams also announce it ("_presence" messages), so a
+    writer can skip computing availability deltas when nobody anywhere listens.
+    """
+
+    def __init__(self, broker: EventBroker, dsn: str, connect_timeout: int = 5):
+        self.broker = broker
+        self.dsn = dsn
+        self.connect_timeout = connect_timeout
+        self._outbox: "queue.Queue[Tuple[str, dict]]" = queue.Queue(_OUTBOX_SIZE)
+        # worker epoch -> monotonic time of its last presence announcement
+        self._remote: dict = {}
+        # False while the listener is reconnecting: send() then falls back to local delivery
+        self.listening = False
+
+    def _connect(self) -> Any:
+        return psycopg.connect(self.dsn, autocommit=True, connect_timeout=self.connect_timeout)
+
+    def send(self, event_type: str, data: dict) -> bool:
+        """Queue a NOTIFY to every worker; False when it can't be (deliver locally instead)."""
+        if not self.listening:
+            return False
+        try:
+            self._outbox.put_nowait((event_type, data))
+        except queue.Full:
+            metrics.incr("events.bridge.outbox_full")
+            return False
+        return True
+
+    def announce(self) -> None:
+        """Tell the other workers this one has listeners."""
+        if self.listening:
+            try:
+                self._outbox.put_nowait(("_presence", {"worker": self.broker.epoch}))
+            except queue.Full:
+                pass
+
+    def remote_listeners(self) -> bool:
+        now = time.monotonic()
+        return any(now - seen < _PRESENCE_TTL for seen in list(self._remote.values()))
+
+    def run_sender(self) -> None:
+        """Send queued events until the process exits; re-announce presence while streams are open."""
+        conn = None
+        announced_at = -_PRESENCE_INTERVAL
+        while True:
+            if self.broker.has_subscribers() and time.monotonic() - announced_at >= _PRESENCE_INTERVAL:
+                announced_at = time.monotonic()
+                self.announce()
+            try:
+                event_type, data = self._outbox.get(timeout=_PRESENCE_INTERVAL)
+            except queue.Empty:
+                continue
+            payload = json.dumps({"type": event_type, "data": data}, separators=(",", ":"), default=str)
+            if len(payload.encode()) > _MAX_PAYLOAD:
+                payload = json.dumps({"type": "resync", "data": {}})
+            try:
+                if conn is None or conn.closed:
+                    conn = self._connect()
+                conn.execute("SELECT pg_notify(%s, %s)", (EVENT_CHANNEL, payload))
+            except psycopg.Error as e:
+                metrics.incr("events.bridge.send_failed")
+                print(f"[DB] Event NOTIFY failed ({e}); delivering on this worker only")
+                conn = None
+                if event_type != "_presence":
+                    self.broker.deliver(event_type, data)
+
+    def _receive(self, message: dict) -> None:
+        if message["type"] == "_presence":
+            if message["data"]["worker"] != self.broker.epoch:
+                self._remote[message["data"]["worker"]] = time.monotonic()
+            return
+        self.broker.deliver(message["type"], message["data"])
+
+    def listen(self) -> None:
+        """Deliver notifications until the process exits, reconnecting after failures."""
+        delay = 1.0
+        while True:
+            try:
+                with self._connect() as conn:
+                    conn.execute(f"LISTEN {EVENT_CHANNEL}")
+                    self.listening = True
+                    delay = 1.0
+                    for notify in conn.notifies():
+                        try:
+                            message = json.loads(notify.payload)
+                        except ValueError:
+                            continue
+                        self._receive(message)
+            except psycopg.Error as e:
+                metrics.incr("events.bridge.listen_failed")
+                print(f"[DB] Event listener lost its connection ({e}); retrying in {delay:.0f}s")
+            self.listening = False
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+
+broker = EventBroker()
+
+
+def start_event_bridge(app: Flask) -> Optional[threading.Thread]:
+    """
+    Deliver events across workers through Postgres (EVENT_BRIDGE, on by default).
+    Disabled without DATABASE_URL; events then stay on the worker that published them.
+    """
+    dsn = os.environ.get("DATABASE_URL")
+    if not app.config.get("EVENT_BRIDGE", True) or not dsn:
+        return None
+    broker.bridge = EventBridge(broker, dsn, app.config.get("DB_CONNECT_TIMEOUT", 5))
+    threading.Thread(target=broker.bridge.run_sender, name="event-bridge-sender", daemon=True).start()
+    thread = threading.Thread(target=broker.bridge.listen, name="event-bridge", daemon=True)
+    thread.start()
+    return thread
+
+
+def makeable_drinks(conn, force: bool = False) -> Optional[Set[str]]:
+    """
+    Drinks makeable right now, or None when nobody is listening on any worker
+    (skips the work).
+    """
+    if not force and not broker.has_listeners():
+        return None
+    index = load_availability(conn)
+    return {index.drinks[i] for i in index.missing_k(0)}
+
+
+def publish_availability_delta(conn, before: Optional[Set[str]]) -> Optional[dict]:
+    """Publish (and return) what changed since `before`; no-op when before is None."""
+    if before is None:
+        return None
+    after = makeable_drinks(conn, force=True)
+    delta = {"now_makeable": sorted(after - before), "no_longer_makeable": sorted(before - after)}
+    if delta["now_makeable"] or delta["no_longer_makeable"]:
+        broker.publish("availability", delta)
+    return delta
+
+
+def format_sse(event_id: Optional[int], event_type: str, data: dict) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {broker.epoch}-{event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream(subscription: Subscription, max_seconds: float, heartbeat: float = 15.0) -> Iterator[str]:
+    """
+    Yield SSE frames until max_seconds have passed. Streams are kept short so a
+    sync worker is never pinned; EventSource reconnects with Last-Event-ID.
+    """
+    deadline = time.monotonic() + max_seconds
+    try:
+        # Ask the browser to reconnect quickly once we close the stream
+        yield "retry: 1000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events, overflowed = subscription.pop_all(min(heartbeat, remaining))
+            if overflowed:
+                yield format_sse(None, "resync", {})
+            for event_id, event_type, data in events:
+                yield format_sse(event_id, event_type, data)
+            if not events and not overflowed:
+                yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,105 @@
+import itertools
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Hashable, Optional
+
+from flask import g, has_app_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from metrics import metrics
+
+# Bumped every time a template containing {% cache %} is compiled, so a
+# template edit (TEMPLATES_AUTO_RELOAD) never serves fragments from the old source.
+_COMPILE_IDS = itertools.count(1)
+
+
+class FragmentCache:
+    """
+    Bounded LRU of rendered template fragments.
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Markup]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Markup]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Markup) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _freeze(value: Any) -> Hashable:
+    """Turn a row (dict, slot record, list) into a hashable snapshot of its data."""
+    if isinstance(value, Mapping):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_freeze(v) for v in value)
+    slots = getattr(type(value), "__slots__", None)
+    if slots:
+        return (type(value).__name__,) + tuple(_freeze(getattr(value, s, None)) for s in slots)
+    return value
+
+
+def _count(outcome: str) -> None:
+    metrics.incr(f"fragment_cache.{outcome}")
+    if has_app_context():
+        g.fragment_cache_stats = getattr(g, "fragment_cache_stats", {"hit": 0, "miss": 0})
+        g.fragment_cache_stats[outcome] += 1
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache "name", row, other_value %}...{% endcache %}
+
+    The key is the template, the fragment name and a snapshot of every value
+    passed in, so a row re-renders only when its data changes. Pass anything
+    from the surrounding scope that the fragment reads.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        prefix = nodes.Const((parser.name, next(_COMPILE_IDS), lineno))
+        call = self.call_method("_render_cached", [prefix, nodes.List(key_parts)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, prefix, key_parts, caller):
+        cache = self.environment.fragment_cache
+        key = (prefix, _freeze(key_parts))
+        cached = cache.get(key)
+        if cached is not None:
+            _count("hit")
+            return cached
+        _count("miss")
+        rendered = Markup(caller())
+        cache.set(key, rendered)
+        return rendered
@@ -1,121 +1,62 @@
 from collections import defaultdict
 from typing import Dict, List, Optional, Tuple
 
+from flask import has_request_context
+
 from utils import get_db_connection, close_db_connection, load_lists
+from catalog import get_catalog
+from resolver import get_resolver
+from availability import load_availability
+from substitutions import get_substitution_graph
+from memo import AVAILABILITY_TAGS, memoize
 
 
-SPIRIT_CATEGORIES = {
-    'absinthe',
-    'aperitif',
-    'bitters',
-    'brandy',
-    'cognac',
-    'digestif',
-    'fortified wine',
-    'gin',
-    'liqueur',
-    'mezcal',
-    'rum',
-    'tequila',
-    'vermouth',
-    'vodka',
-    'whiskey',
-}
+def _release_connection(conn) -> None:
+    """
+    Close the connection a helper got from get_db_connection(). Outside a request
+    (background memo refreshes, warmers) it is not the request's, so close it directly.
+    """
+    if has_request_context():
+        close_db_connection()
+    else:
+        conn.close()
 
 
+@memoize(AVAILABILITY_TAGS)
 def get_drinks_can_make() -> list[dict[str, str]]:
     conn = get_db_connection()
     try:
-        rows = conn.execute(
-            """
-            SELECT DISTINCT r.drink, r.base_spirit
-            FROM recipes r
-            WHERE NOT EXISTS (
-            SELECT 1
-            FROM recipeingredients ri
-            WHERE ri.drink = r.drink
-                AND NOT EXISTS (
-                    SELECT 1
-                    FROM possibleingredients pi
-                    WHERE pi.in_bar = TRUE
-                        AND (
-                            lower(trim(ri.ingredient)) = lower(trim(pi.name))
-                            OR lower(trim(ri.ingredient)) = lower(trim(pi.category))
-                            OR (
-                                pi.sub_category IS NOT NULL
-                                AND lower(trim(ri.ingredient)) = lower(trim(pi.sub_category))
-                            )
-                        )
-                    )
-                )
-            """
-        ).fetchall()
+        index = load_availability(conn)
     finally:
-        close_db_connection()
+        _release_connection(conn)
 
     return [
         {
-            "drink": row["drink"],
-            "base_spirit": (row["base_spirit"] or "").strip(),
+            "id": index.recipe_ids[i],
+            "drink": index.drinks[i],
+            "base_spirit": index.base_spirits[i],
         }
-        for row in rows
+        for i in index.missing_k(0)
     ]
 
 
-def _build_category_lookup(lists: Dict) -> Dict[str, str]:
-    lookup: Dict[str, str] = {}
-    subcategories = lists.get('subcategories', {})
-    for category, subs in subcategories.items():
-        lookup[category.lower()] = category
-        for sub in subs:
-            lookup[sub.lower()] = category
-    for category in lists.get('categories', []):
-        lookup.setdefault(category.lower(), category)
-    return lookup
-
-
-def _map_spirit_ingredients(conn, lists, category_lookup) -> Dict[str, List[str]]:
+def map_spirit_ingredients(conn) -> Dict[int, List[str]]:
     """
-    Build a mapping of drink name -> list of spirit ingredient names using possibleingredients metadata.
+    Build a mapping of recipe id -> list of spirit ingredient names using the shared resolver.
     """
+    resolver = get_resolver()
+    spirits_by_drink: Dict[int, List[str]] = defaultdict(list)
+    seen: Dict[int, set] = defaultdict(set)
 
-    possible_lookup = {}
-    rows = conn.execute('SELECT name, category, sub_category FROM possibleingredients').fetchall()
-    for row in rows:
-        name = (row['name'] or '').strip()
-        if not name:
-            continue
-        possible_lookup[name.lower()] = {
-            'category': (row['category'] or '').strip(),
-            'sub_category': (row['sub_category'] or '').strip(),
-        }
-
-    spirits_by_drink: Dict[str, List[str]] = defaultdict(list)
-    seen: Dict[str, set] = defaultdict(set)
-
-    ingredient_rows = conn.execute(
-        'SELECT drink, ingredient FROM recipeingredients ORDER BY id'
-    ).fetchall()
+    ingredient_rows = conn.run("recipes.ingredient_names").fetchall()
 
     for row in ingredient_rows:
-        drink = row['drink']
+        drink = row['recipe_id']
         ingredient_name = (row['ingredient'] or '').strip()
         if not ingredient_name:
             continue
 
-        info = possible_lookup.get(ingredient_name.lower())
-        category = (info.get('category') if info else '') or ''
-        sub_category = (info.get('sub_category') if info else '') or ''
-
-        resolved_category = ''
-        if sub_category:
-            resolved_category = category_lookup.get(sub_category.lower(), sub_category)
-        if not resolved_category and category:
-            resolved_category = category_lookup.get(category.lower(), category)
-        if not resolved_category:
-            resolved_category = category_lookup.get(ingredient_name.lower(), ingredient_name)
-
-        if (resolved_category or '').strip().lower() in SPIRIT_CATEGORIES:
+        if resolver.is_spirit(ingredient_name):
             bucket = seen[drink]
             if ingredient_name not in bucket:
                 spirits_by_drink[drink].append(ingredient_name)
@@ -127,174 +68,163 @@ def get_drinks_missing_one() -> list[tuple[str, str]]:
     """
     Returns drinks missing exactly one ingredient, along with that missing ingredient.
     """
+    return [(row["drink"], ", ".join(row["missing"])) for row in get_drinks_missing_k(1)]
+
+
+@memoize(AVAILABILITY_TAGS)
+def get_drinks_missing_k(k: int) -> list[dict]:
+    """
+    Returns drinks exactly k ingredients away from makeable, with their missing ingredients.
+    """
     conn = get_db_connection()
     try:
-        rows = conn.execute(
-            """
-            WITH available AS (
-              SELECT lower(name) AS v FROM possibleingredients WHERE in_bar = TRUE
-              UNION
-              SELECT lower(category) AS v FROM possibleingredients WHERE in_bar = TRUE AND category IS NOT NULL AND category <> ''
-              UNION
-              SELECT lower(sub_category) AS v FROM possibleingredients WHERE in_bar = TRUE AND sub_category IS NOT NULL AND sub_category <> ''
-            ),
-            missing AS (
-              SELECT
-                ri.drink,
-                ri.ingredient
-              FROM recipeingredients ri
-              WHERE lower(ri.ingredient) NOT IN (SELECT v FROM available)
-            ),
-            missing_count AS (
-              SELECT drink, COUNT(*) AS cnt
-              FROM missing
-              GROUP BY drink
-            )
-            SELECT
-              m.drink,
-              string_agg(m.ingredient, ', ' ORDER BY m.ingredient) AS missing_ingredients
-            FROM missing m
-            JOIN missing_count mc
-              ON mc.drink = m.drink
-            WHERE mc.cnt = 1
-            GROUP BY m.drink
-            ORDER BY lower(m.drink)
-            """
-        ).fetchall()
+        index = load_availability(conn)
     finally:
-        close_db_connection()
+        _release_connection(conn)
 
-    return [(row["drink"], row["missing_ingredients"]) for row in rows]
+    return [
+        {
+            "drink": index.drinks[i],
+            "base_spirit": index.base_spirits[i] or "N/A",
+            "missing": index.missing_labels(i),
+        }
+        for i in index.missing_k(k)
+    ]
 
 
-def get_drinks_with_replacements() -> List[Dict]:
+@memoize(AVAILABILITY_TAGS)
+def get_shopping_suggestions(max_k: int = 3, budget: int = 3, limit: int = 10) -> dict:
     """
-    Returns a list of drinks that have missing ingredients but where replacements may exist.
+    Returns drinks grouped by how many ingredients they are missing (0..max_k), the single
+    bottles that unlock the most drinks, and a greedy pick of `budget` bottles.
     """
     conn = get_db_connection()
     try:
-        # Get all recipes and their ingredients
-        recipes = conn.execute('SELECT drink, Base_Spirit FROM Recipes').fetchall()
-        result = []
-        
-        for recipe in recipes:
-            drink_name = recipe['drink']
-            recipe_ings = conn.execute('SELECT ingredient FROM RecipeIngredients WHERE drink = %s', (drink_name,)).fetchall()
-            missing = []
-            replacements = {}
-            
-            for ing in recipe_ings:
-                ing_name = ing['ingredient']
-                # Check if the ingredient is missing
-                # match_found using in_bar
-                match_found = conn.execute(
-                    """
-                    SELECT 1
-                    FROM possibleingredients pi
-                    WHERE pi.in_bar = TRUE
-                    AND (
-                        lower(%s) = lower(pi.name)
-                        OR lower(%s) = lower(pi.category)
-                        OR (pi.sub_category IS NOT NULL AND lower(%s) = lower(pi.sub_category))
-                    )
-                    LIMIT 1
-                    """,
-                    (ing_name, ing_name, ing_name),
-                ).fetchone()
-                
-                if not match_found:
-                    missing.append(ing_name)
-                    # Find the category of the missing ingredient
-                    category = conn.execute(
-                        'SELECT category FROM PossibleIngredients WHERE name = %s OR sub_category = %s OR category = %s LIMIT 1',
-                        (ing_name, ing_name, ing_name)
-                    ).fetchone()
-                    if category:
-                        # Get potential replacements from possibleingredients.in_bar with the same category
-                        replacements[ing_name] = conn.execute(
-                            """
-                            SELECT name
-                            FROM possibleingredients
-                            WHERE in_bar = TRUE
-                            AND lower(category) = lower(%s)
-                            AND lower(name) <> lower(%s)
-                            ORDER BY name
-                            """,
-                            (category["category"], ing_name),
-                        ).fetchall()
-        
-            if missing:  # Only include drinks with at least one missing ingredient
-                result.append({
-                    'drink': drink_name,
-                    'base_spirit': recipe['Base_Spirit'] if recipe['Base_Spirit'] else 'N/A',
-                    'missing_ingredients': missing,
-                    'replacements': {k: [r['name'] for r in v] for k, v in replacements.items()}  # Convert tuples to lists
-                })
+        index = load_availability(conn)
     finally:
-        close_db_connection()
+        _release_connection(conn)
+
+    return {
+        "by_missing": {
+            k: [{"drink": index.drinks[i], "missing": index.missing_labels(i)} for i in hits]
+            for k, hits in index.by_missing_count(max_k).items()
+        },
+        "best_single": index.best_single_purchases(limit),
+        "best_set": index.best_purchase_set(budget),
+    }
+
+
+@memoize(AVAILABILITY_TAGS)
+def get_drinks_with_replacements(limit: int = 5) -> List[Dict]:
+    """
+    Returns drinks with missing ingredients, plus the owned bottles that could stand in
+    for each missing one, best first (see substitutions.py for the ranking).
+    """
+    conn = get_db_connection()
+    try:
+        index = load_availability(conn)
+        graph = get_substitution_graph(conn)
+    finally:
+        _release_connection(conn)
+
+    resolver = get_resolver()
+    owned = {ingredient.id for ingredient in get_catalog() if ingredient.in_bar}
+
+    result = []
+    for i, missing_tokens in enumerate(index.missing):
+        if not missing_tokens:
+            continue
+        missing = index.missing_labels(i)
+        ranked = {label: graph.substitutes(resolver, label, owned, limit) for label in missing}
+        result.append({
+            'drink': index.drinks[i],
+            'base_spirit': index.base_spirits[i] or 'N/A',
+            'missing_ingredients': missing,
+            'replacements': {label: [sub['name'] for sub in subs] for label, subs in ranked.items()},
+            'replacement_scores': ranked,
+        })
     return result
 
+@memoize(("recipes",))
 def fetch_recipe(drink: str) -> Optional[Dict]:
     """
     Fetches the full recipe data from the Recipes table for a specific drink.
     """
     conn = get_db_connection()
     try:
-        recipe = conn.execute('SELECT * FROM Recipes WHERE drink = %s', (drink,)).fetchone()
+        recipe = conn.run("recipes.by_drink", (drink,)).fetchone()
     finally:
-        close_db_connection()
-    if recipe:
-        recipe_dict = dict(recipe)
-        print(f"Recipe for {drink}: {recipe_dict}")  # Debug print
-        return recipe_dict
-    return None
+        _release_connection(conn)
+    return dict(recipe) if recipe else None
+
+def fetch_recipe_ingredients(conn, recipe_ids: List[int]) -> Dict[int, List[Dict]]:
+    """
+    Returns recipe id -> ingredient rows (with the resolved bottle's category) for the given recipes.
+    """
+    rows = conn.run("recipes.ingredients", (list(recipe_ids),)).fetchall()
+    by_recipe: Dict[int, List[Dict]] = defaultdict(list)
+    for row in rows:
+        by_recipe[row["recipe_id"]].append(row)
+    return by_recipe
 
+RECIPE_INGREDIENT_COLUMNS = ("ingredient", "quantity", "unit", "category", "sub_category")
+
+
+def build_recipe_payload(recipe, ingredients, columns: bool = False) -> Dict:
+    """
+    JSON shape of a single recipe, shared by /recipe/<drink> and /changes.
+    With columns=True the ingredients are {"columns": [...], "rows": [[...], ...]}.
+    """
+    if columns:
+        encoded = {
+            "columns": list(RECIPE_INGREDIENT_COLUMNS),
+            "rows": [[ing[column] for column in RECIPE_INGREDIENT_COLUMNS] for ing in ingredients],
+        }
+    else:
+        encoded = [{column: ing[column] for column in RECIPE_INGREDIENT_COLUMNS} for ing in ingredients]
+    return {
+        "id": recipe["id"],
+        "name": recipe["drink"],
+        "glass": recipe["glass"],
+        "garnish": recipe["garnish"],
+        "method": recipe["method"],
+        "ice": recipe["ice"],
+        "notes": recipe["notes"],
+        "base_spirit": recipe["base_spirit"],
+        "ingredients": encoded,
+    }
+
+@memoize(AVAILABILITY_TAGS)
 def fetch_drinks_missing_ingredients() -> list[dict]:
     """
-    Returns drinks that are missing one or more ingredients based on in_bar.
+    Returns drinks that are missing one or more ingredients based on in_bar,
+    closest to makeable first.
     """
     conn = get_db_connection()
     try:
-        rows = conn.execute(
-            """
-            WITH available AS (
-              SELECT lower(name) AS v FROM possibleingredients WHERE in_bar = TRUE
-              UNION
-              SELECT lower(category) AS v FROM possibleingredients WHERE in_bar = TRUE AND category IS NOT NULL AND category <> ''
-              UNION
-              SELECT lower(sub_category) AS v FROM possibleingredients WHERE in_bar = TRUE AND sub_category IS NOT NULL AND sub_category <> ''
-            ),
-            missing AS (
-              SELECT
-                r.drink,
-                COALESCE(r.base_spirit, '') AS base_spirit,
-                ri.ingredient
-              FROM recipes r
-              JOIN recipeingredients ri
-                ON ri.drink = r.drink
-              WHERE lower(ri.ingredient) NOT IN (SELECT v FROM available)
-            )
-            SELECT
-              drink,
-              base_spirit,
-              array_agg(ingredient ORDER BY ingredient) AS missing
-            FROM missing
-            GROUP BY drink, base_spirit
-            ORDER BY lower(base_spirit), lower(drink)
-            """
-        ).fetchall()
+        index = load_availability(conn)
     finally:
-        close_db_connection()
-
+        _release_connection(conn)
+
+    hits = [i for i, missing in enumerate(index.missing) if missing]
+    hits.sort(
+        key=lambda i: (
+            len(index.missing[i]),
+            index.base_spirits[i].lower(),
+            index.drinks[i].lower(),
+        )
+    )
     return [
         {
-            "drink": row["drink"],
-            "base_spirit": row["base_spirit"] or "N/A",
-            "missing": row["missing"] or [],
+            "drink": index.drinks[i],
+            "base_spirit": index.base_spirits[i] or "N/A",
+            "missing": index.missing_labels(i),
+            "missing_count": len(index.missing[i]),
         }
-        for row in rows
+        for i in hits
     ]
 
+@memoize(AVAILABILITY_TAGS)
 def fetch_drinks_with_base() -> list[tuple[str, list[str]]]:
     """
     Returns drinks where the base spirit is in the bar (match against owned sub_category),
@@ -302,41 +232,14 @@ def fetch_drinks_with_base() -> list[tuple[str, list[str]]]:
     """
     conn = get_db_connection()
     try:
-        rows = conn.execute(
-            """
-            WITH available AS (
-              SELECT lower(name) AS v FROM possibleingredients WHERE in_bar = TRUE
-              UNION
-              SELECT lower(category) AS v FROM possibleingredients WHERE in_bar = TRUE AND category IS NOT NULL AND category <> ''
-              UNION
-              SELECT lower(sub_category) AS v FROM possibleingredients WHERE in_bar = TRUE AND sub_category IS NOT NULL AND sub_category <> ''
-            ),
-            owned_base AS (
-              SELECT DISTINCT lower(sub_category) AS v
-              FROM possibleingredients
-              WHERE in_bar = TRUE AND sub_category IS NOT NULL AND sub_category <> ''
-            ),
-            missing AS (
-              SELECT
-                r.drink,
-                ri.ingredient
-              FROM recipes r
-              JOIN recipeingredients ri
-                ON ri.drink = r.drink
-              WHERE lower(ri.ingredient) NOT IN (SELECT v FROM available)
-            )
-            SELECT
-              r.drink,
-              array_agg(m.ingredient ORDER BY m.ingredient) AS missing
-            FROM recipes r
-            JOIN missing m
-              ON m.drink = r.drink
-            WHERE lower(COALESCE(r.base_spirit, '')) IN (SELECT v FROM owned_base)
-            GROUP BY r.drink
-            ORDER BY lower(r.drink)
-            """
-        ).fetchall()
+        index = load_availability(conn)
     finally:
-        close_db_connection()
+        _release_connection(conn)
 
-    return [(row["drink"], row["missing"] or []) for row in rows]
+    hits = [
+        i
+        for i, missing in enumerate(index.missing)
+        if missing and index.base_spirits[i].lower() in index.owned_sub_categories
+    ]
+    hits.sort(key=lambda i: index.drinks[i].lower())
+    return [(index.drinks[i], index.missing_labels(i)) for i in hits]
@@ -0,0 +1,362 @@
+"""
+Bulk CSV/JSON import for PossibleIngredients and IngredientPurchases.
+
+Uploads are read lazily and handled INGEST_BATCH_SIZE rows at a time: each
+batch is validated, its ingredient names resolved with one query, and its
+valid rows written with one statement (an unnest INSERT for ingredients, COPY
+for purchases). Invalid rows are reported by row number and skipped. Everything
+commits together, and the catalog / recipe references are refreshed once at
+the end instead of once per row.
+"""
+
+import csv
+import io
+import json
+import math
+import time
+from datetime import date
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import psycopg
+
+from catalog import reload_catalog
+from events import makeable_drinks, publish_availability_delta
+from memo import invalidate
+from metrics import metrics
+from normalization import refresh_recipe_refs
+from stock import next_purchase_id, open_purchase_bottles
+from units import convert_to_ml, parse_float
+
+KINDS = ("ingredients", "purchases")
+FORMATS = ("csv", "json", "ndjson")
+
+# (row number in the upload, fields with lower-cased keys) -- None when the row isn't an object
+Row = Tuple[int, Optional[dict]]
+
+_PURCHASE_COLUMNS = ("ingredient_id", "purchase_date", "location", "size_value", "size_unit", "size_ml", "price", "notes")
+_TRUE = {"1", "true", "t", "yes", "y"}
+_FALSE = {"0", "false", "f", "no", "n", ""}
+
+
+class IngestError(ValueError):
+    """The upload as a whole could not be imported; nothing was written."""
+
+
+def detect_format(filename: Optional[str], mimetype: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    """Pick csv/json/ndjson from ?format=, then the file extension, then the content type."""
+    requested = (requested or "").strip().lower()
+    if requested in FORMATS:
+        return requested
+    extension = (filename or "").rpartition(".")[2].lower() if "." in (filename or "") else ""
+    if extension in ("jsonl", "ndjson"):
+        return "ndjson"
+    if extension in ("csv", "json"):
+        return extension
+    mimetype = (mimetype or "").lower()
+    if mimetype in ("application/x-ndjson", "application/jsonl"):
+        return "ndjson"
+    if mimetype.endswith("json"):
+        return "json"
+    if mimetype in ("text/csv", "application/csv", "text/plain"):
+        return "csv"
+    return None
+
+
+def _clean(record) -> Optional[dict]:
+    if not isinstance(record, dict):
+        return None
+    return {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+
+
+def _read_rows(stream, fmt: str) -> Iterator[Row]:
+    if fmt == "json":
+        # The stdlib parser needs the whole document; use CSV or NDJSON for very large files
+        data = json.load(stream)
+        if isinstance(data, dict):
+            data = data.get("rows")
+        if not isinstance(data, list):
+            raise IngestError('JSON upload must be an array of objects (or {"rows": [...]}).')
+        for number, record in enumerate(data, start=1):
+            yield number, _clean(record)
+        return
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "ndjson":
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, _clean(record)
+        return
+
+    reader = csv.DictReader(text)
+    for record in reader:
+        # line_num counts the header, so numbers match the spreadsheet row
+        yield reader.line_num, _clean(record)
+
+
+def iter_rows(stream, fmt: str) -> Iterator[Row]:
+    """Yield (row number, fields) from a binary stream; CSV and NDJSON are never held in memory."""
+    try:
+        yield from _read_rows(stream, fmt)
+    except IngestError:
+        raise
+    except (ValueError, csv.Error) as e:
+        raise IngestError(f"Could not read {fmt.upper()} upload: {e}") from e
+
+
+def _batches(rows: Iterable[Row], size: int) -> Iterator[List[Row]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _text(record: dict, *keys: str) -> str:
+    for key in keys:
+        value = record.get(key)
+        if value is not None and str(value).strip():
+            return str(value).strip()
+    return ""
+
+
+def _parse_bool(value) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    text = "" if value is None else str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    return None
+
+
+def _positive(value) -> Optional[float]:
+    number = parse_float(value)
+    if number is None or not math.isfinite(number) or number <= 0:
+        return None
+    return number
+
+
+class IngestReport:
+    def __init__(self, kind: str, max_errors: int):
+        self.kind = kind
+        self.received = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+        self.max_errors = max_errors
+
+    def error(self, row: int, messages: List[str]) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "errors": messages})
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "received": self.received,
+            "inserted": self.inserted,
+            "skipped": self.skipped,
+            "error_count": self.error_count,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+            "errors_truncated": self.error_count > len(self.errors),
+        }
+
+
+def _ingest_ingredients(conn, batch: List[Row], report: IngestReport, seen: Dict[str, int]) -> List[dict]:
+    """Insert new ingredients from one batch; rows naming an existing ingredient are skipped."""
+    valid = []
+    for number, record in batch:
+        if record is None:
+            report.error(number, ["Row is not an object."])
+            continue
+        name = _text(record, "name")
+        category = _text(record, "category")
+        sub_category = _text(record, "sub_category") or None
+        in_bar = _parse_bool(record.get("in_bar"))
+        problems = []
+        if not name:
+            problems.append("Name is required.")
+        if not category:
+            problems.append("Category is required.")
+        if in_bar is None:
+            problems.append("in_bar must be true or false.")
+        if name and name.lower() in seen:
+            problems.append(f"Duplicate of row {seen[name.lower()]}.")
+        if problems:
+            report.error(number, problems)
+            continue
+        seen[name.lower()] = number
+        valid.append((name, category, sub_category, in_bar))
+
+    if not valid:
+        return []
+    existing = {
+        row["key"]
+        for row in conn.execute(
+            "SELECT lower(name) AS key FROM PossibleIngredients WHERE lower(name) = ANY(%s)",
+            ([name.lower() for name, *_ in valid],),
+        ).fetchall()
+    }
+    fresh = [values for values in valid if values[0].lower() not in existing]
+    inserted = []
+    if fresh:
+        names, categories, sub_categories, in_bar = (list(column) for column in zip(*fresh))
+        inserted = conn.execute(
+            """
+            INSERT INTO PossibleIngredients (name, category, sub_category, in_bar)
+            SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::boolean[])
+            ON CONFLICT DO NOTHING
+            RETURNING id, name, category, sub_category, in_bar
+            """,
+            (names, categories, sub_categories, in_bar),
+        ).fetchall()
+    report.inserted += len(inserted)
+    report.skipped += len(valid) - len(inserted)
+    return inserted
+
+
+def _ingest_purchases(conn, batch: List[Row], report: IngestReport) -> None:
+    """COPY one batch of purchases, resolving ingredient names/ids in a single lookup."""
+    parsed = []
+    for number, record in batch:
+        if record is None:
+            report.error(number, ["Row is not an object."])
+            continue
+        problems = []
+        ingredient_id = None
+        raw_id = _text(record, "ingredient_id")
+        if raw_id:
+            try:
+                ingredient_id = int(raw_id)
+            except ValueError:
+                problems.append("ingredient_id must be an integer.")
+        ingredient = _text(record, "ingredient", "ingredient_name", "name")
+        if not raw_id and not ingredient:
+            problems.append("Ingredient (name or ingredient_id) is required.")
+        purchase_date = None
+        try:
+            purchase_date = date.fromisoformat(_text(record, "purchase_date", "date"))
+        except ValueError:
+            problems.append("Purchase date is required (YYYY-MM-DD).")
+        size_value = _positive(record.get("size_value"))
+        if size_value is None:
+            problems.append("Size value must be a positive number.")
+        size_unit = _text(record, "size_unit", "unit")
+        if not size_unit:
+            problems.append("Size unit is required.")
+        price = _positive(record.get("price"))
+        if price is None:
+            problems.append("Price must be a positive number.")
+        if problems:
+            report.error(number, problems)
+            continue
+        values = (
+            purchase_date,
+            _text(record, "location") or None,
+            size_value,
+            size_unit,
+            convert_to_ml(size_value, size_unit),
+            price,
+            _text(record, "notes") or None,
+        )
+        parsed.append((number, ingredient_id, ingredient, values))
+
+    if not parsed:
+        return
+    rows = conn.execute(
+        "SELECT id, lower(name) AS key FROM PossibleIngredients WHERE id = ANY(%s) OR lower(name) = ANY(%s) ORDER BY id",
+        (
+            [ingredient_id for _, ingredient_id, _, _ in parsed if ingredient_id is not None],
+            [ingredient.lower() for _, ingredient_id, ingredient, _ in parsed if ingredient_id is None],
+        ),
+    ).fetchall()
+    known_ids = {row["id"] for row in rows}
+    ids_by_name: Dict[str, int] = {}
+    for row in rows:
+        ids_by_name.setdefault(row["key"], row["id"])
+
+    resolved = []
+    for number, ingredient_id, ingredient, values in parsed:
+        if ingredient_id is None:
+            ingredient_id = ids_by_name.get(ingredient.lower())
+            if ingredient_id is None:
+                report.error(number, [f'Unknown ingredient "{ingredient}".'])
+                continue
+        elif ingredient_id not in known_ids:
+            report.error(number, [f"Unknown ingredient_id {ingredient_id}."])
+            continue
+        resolved.append((ingredient_id, *values))
+
+    if resolved:
+        with conn.copy(f"COPY IngredientPurchases ({', '.join(_PURCHASE_COLUMNS)}) FROM STDIN") as copy:
+            for values in resolved:
+                copy.write_row(values)
+    report.inserted += len(resolved)
+
+
+def ingest(
+    conn,
+    kind: str,
+    rows: Iterable[Row],
+    batch_size: int = 500,
+    max_errors: int = 100,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Import `rows` as `kind` ("ingredients" or "purchases") in one transaction.
+    dry_run does all the work, including the writes, then rolls back.
+    """
+    if kind not in KINDS:
+        raise IngestError(f"Unknown import kind {kind!r}.")
+    report = IngestReport(kind, max_errors)
+    inserted_ingredients: List[dict] = []
+    seen: Dict[str, int] = {}
+    makeable_before = makeable_drinks(conn) if kind == "ingredients" and not dry_run else None
+
+    first_purchase_id = next_purchase_id(conn) if kind == "purchases" else None
+
+    t0 = time.perf_counter()
+    try:
+        for batch in _batches(rows, max(1, batch_size)):
+            report.received += len(batch)
+            try:
+                if kind == "ingredients":
+                    inserted_ingredients.extend(_ingest_ingredients(conn, batch, report, seen))
+                else:
+                    _ingest_purchases(conn, batch, report)
+            except psycopg.Error as e:
+                raise IngestError(f"Rows {batch[0][0]}-{batch[-1][0]} could not be written: {e}") from e
+        if first_purchase_id is not None and report.inserted:
+            # Each purchased bottle starts full (see stock.py)
+            open_purchase_bottles(conn, first_purchase_id)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    metrics.observe(f"ingest.{kind}", (time.perf_counter() - t0) * 1000)
+    metrics.incr(f"ingest.{kind}.rows", report.inserted)
+    if report.inserted and not dry_run:
+        invalidate(*(("catalog", "bar") if kind == "ingredients" else ("stock",)))
+
+    if inserted_ingredients and not dry_run:
+        # One refresh for the whole upload
+        reload_catalog()
+        labels = set()
+        for row in inserted_ingredients:
+            labels.update(value for value in (row["name"], row["category"], row["sub_category"]) if value)
+        refresh_recipe_refs(conn, labels)
+        conn.commit()
+        publish_availability_delta(conn, makeable_before)
+
+    result = report.to_dict()
+    result["dry_run"] = dry_run
+    return result
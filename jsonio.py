@@ -0,0 +1,101 @@
+"""
+JSON responses: an orjson-backed provider (stdlib fallback) and a column-oriented
+encoding for list endpoints.
+
+FastJSONProvider keeps Flask's output contract -- sorted keys, HTTP dates,
+Decimal/UUID/dataclass handling, compact unless debugging -- and only swaps the
+encoder; anything orjson can't encode (e.g. ints past 64 bits) goes through
+the stdlib path. JSON_BACKEND=std turns orjson off.
+
+List endpoints that call encode_rows() answer `?format=columns` with
+{"columns": [...], "rows": [[...], ...]}: every key is sent once instead of
+once per row, and no per-row dicts are built.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Sequence, Union
+
+from flask import Flask, Response, request
+from flask.json.provider import DefaultJSONProvider
+
+from metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+# Encoded bodies kept by cached_response(); old generations simply age out
+_CACHE_SIZE = 64
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    use_orjson = orjson is not None
+
+    def __init__(self, app: Flask):
+        super().__init__(app)
+        self._cache: Dict[Hashable, bytes] = {}
+        self._cache_lock = threading.Lock()
+
+    def _encode(self, obj: Any, indent: bool) -> bytes | None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            metrics.incr("json.fallback")
+            return None
+
+    def _body(self, obj: Any) -> bytes:
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = self._encode(obj, indent) if self.use_orjson else None
+        if body is None:
+            dump_args = {"indent": 2} if indent else {"separators": (",", ":")}
+            body = self.dumps(obj, **dump_args).encode()
+        return body + b"\n"
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        return self._app.response_class(self._body(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
+
+    def cached_response(self, key: Hashable, build: Callable[[], Any]) -> Response:
+        """Serve the encoded body for `key` (which should include a data generation), encoding it on first use."""
+        body = self._cache.get(key)
+        if body is None:
+            body = self._body(build())
+            with self._cache_lock:
+                if len(self._cache) >= _CACHE_SIZE:
+                    self._cache.clear()
+                self._cache[key] = body
+            metrics.incr("json.cache.miss")
+        else:
+            metrics.incr("json.cache.hit")
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def wants_columns() -> bool:
+    return request.args.get("format") == "columns"
+
+
+def encode_rows(columns: Sequence[str], rows: Iterable[Sequence]) -> Union[List[dict], dict]:
+    """Value tuples as a list of objects, or {"columns", "rows"} when the request asked for ?format=columns."""
+    if wants_columns():
+        return {"columns": list(columns), "rows": rows if isinstance(rows, list) else list(rows)}
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def encode_records(records: List[dict]) -> Union[List[dict], dict]:
+    """Like encode_rows() for rows that are already dicts with the same keys (e.g. dict_row results)."""
+    if not wants_columns():
+        return records
+    columns = list(records[0]) if records else []
+    return {"columns": columns, "rows": [[record[column] for column in columns] for record in records]}
+
+
+def init_json(app: Flask) -> None:
+    provider = FastJSONProvider(app)
+    provider.use_orjson = orjson is not None and app.config.get("JSON_BACKEND", "orjson") == "orjson"
+    app.json = provider
+    app.logger.info("[STARTUP] JSON backend: %s", "orjson" if provider.use_orjson else "std")
@@ -0,0 +1,448 @@
+"""
+Local SQLite replica of the recipe, catalog, bar and stock tables. It serves
+reads in well under a millisecond and keeps the bar usable while Postgres
+(Neon) cannot be reached.
+
+Enabled with LOCAL_REPLICA=true. The file is LOCAL_REPLICA_PATH (default
+instance/replica.sqlite3).
+
+Sync: utils.start_local_replica_sync() copies TABLES from Postgres every
+LOCAL_REPLICA_SYNC_INTERVAL seconds. The tables are small, so each sync is a
+full copy, read in one REPEATABLE READ transaction (a consistent snapshot) and
+swapped in by one SQLite transaction.
+
+Reads: on @read_only requests, registered queries declared local=True
+(queries.py) are answered from the copy while it is current. Everything else
+on the request goes to Postgres as usual. A write committed by this process
+marks the copy stale until a sync LOCAL_REPLICA_WRITE_SYNC_DELAY seconds later
+(one for every write in that window), so nobody here reads around their own
+write. Other workers' writes show up within one sync interval.
+
+Offline: while Postgres can't be reached, requests get a LocalConn without a
+fallback. Reads run against the copy. INSERT/UPDATE/DELETE on copied tables
+are applied to the copy and queued, one entry per commit. Rows inserted offline
+get temporary negative ids, so they can be read back by id; a write that
+refers to one can't be queued, because Postgres will assign a different id.
+The sync thread replays the queue to Postgres, in order, once it answers
+again, and only then copies tables back (with the real ids). Statements that
+need Postgres raise OfflineError (503): RETURNING, COPY, tables outside the
+copy, and writes that mention a temporary id.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import psycopg
+
+from metrics import metrics
+from queries import Query, get_query, to_sqlite
+
+# Tables copied from Postgres -> columns worth an index
+TABLES: Dict[str, Tuple[str, ...]] = {
+    "recipes": ("id", "drink"),
+    "recipeingredients": ("recipe_id",),
+    "possibleingredients": ("id",),
+    "categories": ("name",),
+    "subcategories": ("category_id",),
+    "glasstypes": (),
+    "methods": (),
+    "iceoptions": (),
+    "units": (),
+    "bottles": ("ingredient_id",),
+}
+
+# Postgres type OIDs whose values come back from SQLite as something else
+_KINDS = {16: "bool", 1082: "date", 1114: "timestamp", 1184: "timestamp"}
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "bool": bool,
+    "date": date.fromisoformat,
+    "timestamp": datetime.fromisoformat,
+}
+
+# Queue entries still "replaying" after this long belonged to a worker that died mid-replay
+_CLAIM_TIMEOUT = 300
+
+# Columns holding row ids: "id" and "<something>_id"
+_ID_COLUMN = re.compile(r"(?:^|_)id$", re.IGNORECASE)
+# A placeholder compared with a column: "col = %s", "col = ANY(%s)", "col IN (%s, %s"
+_COMPARED = re.compile(
+    r"(?<![%\w.])([A-Za-z_][\w.]*)\s*"
+    r"(?:(?:=|<>|!=|<=|>=|<|>)\s*(?:ANY\s*\(\s*)?|IN\s*\((?:\s*%s\s*,)*\s*)$",
+    re.IGNORECASE,
+)
+_INSERT_COLUMNS = re.compile(r"\s*INSERT\s+INTO\s+[\w.]+\s*\(([^)]*)\)", re.IGNORECASE)
+# Placeholder lists matched to columns by position: the INSERT's, or unnest(...) AS alias(columns)
+_ARGUMENT_LIST = re.compile(r"\b(VALUES|unnest)\s*\(", re.IGNORECASE)
+_ALIAS_COLUMNS = re.compile(r"\s*AS\s+\w+\s*\(([^)]*)\)", re.IGNORECASE)
+
+
+class OfflineError(psycopg.OperationalError):
+    """Postgres is unreachable and the statement can't be answered or queued locally."""
+
+
+def _sqlite_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        # "= ANY(%s)" becomes json_each(?) (queries.to_sqlite)
+        return json.dumps(list(value), default=str)
+    return value
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot queue a {type(value).__name__} parameter")
+
+
+def _is_id_column(name: str) -> bool:
+    return bool(_ID_COLUMN.search(name.strip().rsplit(".", 1)[-1]))
+
+
+def _arguments(sql: str, start: int) -> Tuple[List[Tuple[int, int]], int]:
+    """Spans of the top-level comma-separated arguments opening at `start`, and where the list ends."""
+    spans, depth, begin = [], 0, start
+    for i in range(start, len(sql)):
+        if sql[i] == "(":
+            depth += 1
+        elif sql[i] == ")" and depth:
+            depth -= 1
+        elif sql[i] in ",)" and not depth:
+            spans.append((begin, i))
+            begin = i + 1
+            if sql[i] == ")":
+                return spans, i + 1
+    return spans, len(sql)
+
+
+@lru_cache(maxsize=256)
+def _id_placeholders(sql: str) -> FrozenSet[int]:
+    """Positions of the %s placeholders bound to id columns (compared with, or inserted into, one)."""
+    starts = [match.start() for match in re.finditer(r"%s", sql)]
+    ids = set()
+    for n, start in enumerate(starts):
+        compared = _COMPARED.search(sql[:start])
+        if compared and _is_id_column(compared.group(1)):
+            ids.add(n)
+
+    insert = _INSERT_COLUMNS.match(sql)
+    insert_columns = insert.group(1).split(",") if insert else None
+    for listed in _ARGUMENT_LIST.finditer(sql):
+        spans, end = _arguments(sql, listed.end())
+        columns = insert_columns
+        if columns is None and listed.group(1).lower() == "unnest":
+            alias = _ALIAS_COLUMNS.match(sql, end)
+            columns = alias.group(1).split(",") if alias else None
+        for column, (begin, stop) in zip(columns or (), spans):
+            if _is_id_column(column):
+                ids.update(n for n, start in enumerate(starts) if begin <= start < stop)
+    return frozenset(ids)
+
+
+def _temporary_id(sql: str, params: Sequence[Any]) -> bool:
+    """Whether `params` puts a negative (offline-insert) id into an id column."""
+    for n in _id_placeholders(sql):
+        value = params[n] if n < len(params) else None
+        for item in value if isinstance(value, (list, tuple)) else (value,):
+            if isinstance(item, int) and not isinstance(item, bool) and item < 0:
+                return True
+    return False
+
+
+class LocalReplica:
+    def __init__(self):
+        self.path: Optional[str] = None
+        # Set when Postgres can't be reached; cleared by the next successful sync
+        self.offline = False
+        self.synced_at: Optional[float] = None
+        self._converters: Dict[str, Callable[[Any], Any]] = {}
+        self._local = threading.local()
+        # Bumped by every write this process commits to Postgres; the copy is
+        # current while the last sync started after the latest one
+        self._write_generation = 0
+        self._synced_generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def configure(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._connect()
+        db.execute("CREATE TABLE IF NOT EXISTS replica_meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS write_queue (id INTEGER PRIMARY KEY AUTOINCREMENT, statements TEXT NOT NULL, "
+            "queued_at REAL NOT NULL, status TEXT NOT NULL DEFAULT 'queued', claimed_at REAL, error TEXT)"
+        )
+        meta = {row["key"]: row["value"] for row in db.execute("SELECT key, value FROM replica_meta")}
+        if "synced_at" in meta:
+            # A copy from an earlier run: good enough to serve while offline, stale otherwise
+            self.synced_at = float(meta["synced_at"])
+            self._converters = {name: _CONVERTERS[kind] for name, kind in json.loads(meta["kinds"]).items()}
+            self._write_generation = 1
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.row_factory = self._row
+            self._local.db = db
+        return db
+
+    def _row(self, cursor: sqlite3.Cursor, values: tuple) -> dict:
+        row = {}
+        for (name, *_), value in zip(cursor.description, values):
+            convert = self._converters.get(name)
+            row[name] = convert(value) if convert is not None and value is not None else value
+        return row
+
+    def ready(self) -> bool:
+        """The copy has been synced at least once."""
+        return self.synced_at is not None
+
+    def fresh(self) -> bool:
+        return self.ready() and not self.offline and self._synced_generation == self._write_generation
+
+    def mark_stale(self) -> None:
+        self._write_generation += 1
+
+    def connect(self, fallback: Optional[Callable[[], Any]] = None) -> "LocalConn":
+        return LocalConn(self, fallback)
+
+    def sync(self, conn) -> bool:
+        """Copy TABLES from Postgres (`conn`, a DBConn); False while queued writes still wait for replay."""
+        t0 = time.perf_counter()
+        generation = self._write_generation
+        snapshot = {}
+        kinds: Dict[str, str] = {}
+        # One snapshot for every table, so e.g. recipeingredients is never newer than recipes
+        conn.rollback()
+        try:
+            conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            for table in TABLES:
+                cur = conn.execute(f"SELECT * FROM {table}")
+                columns = [column.name for column in cur.description]
+                for column in cur.description:
+                    if column.type_code in _KINDS:
+                        kinds[column.name] = _KINDS[column.type_code]
+                snapshot[table] = (columns, [tuple(_sqlite_value(v) for v in row.values()) for row in cur.fetchall()])
+        finally:
+            conn.rollback()
+
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if self._queued(db):
+                db.execute("ROLLBACK")
+                return False
+            for table, (columns, rows) in snapshot.items():
+                db.execute(f"DROP TABLE IF EXISTS {table}")
+                definitions = ["id INTEGER PRIMARY KEY" if column == "id" else column for column in columns]
+                db.execute(f"CREATE TABLE {table} ({', '.join(definitions)})")
+                db.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(columns))})", rows)
+                for column in TABLES[table]:
+                    if column != "id":
+                        db.execute(f"CREATE INDEX idx_{table}_{column} ON {table} ({column})")
+                if "id" in columns:
+                    # Offline inserts get the next negative id instead of one Postgres may hand out later
+                    top = max((row[columns.index("id")] for row in rows), default=0)
+                    db.execute(
+                        f"CREATE TRIGGER temp_id_{table} AFTER INSERT ON {table} WHEN NEW.id > {top} BEGIN "
+                        f"UPDATE {table} SET id = (SELECT min(0, min(id)) - 1 FROM {table}) WHERE id = NEW.id; END"
+                    )
+            now = time.time()
+            db.executemany(
+                "INSERT OR REPLACE INTO replica_meta (key, value) VALUES (?, ?)",
+                [("synced_at", str(now)), ("kinds", json.dumps(kinds))],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._converters = {name: _CONVERTERS[kind] for name, kind in kinds.items()}
+        self.synced_at = now
+        self._synced_generation = generation
+        metrics.observe("local_replica.sync", (time.perf_counter() - t0) * 1000)
+        return True
+
+    def _queued(self, db: sqlite3.Connection) -> int:
+        return db.execute("SELECT count(*) AS n FROM write_queue WHERE status IN ('queued', 'replaying')").fetchone()["n"]
+
+    def enqueue(self, db: sqlite3.Connection, statements: List[Tuple[str, Sequence[Any]]]) -> None:
+        db.execute(
+            "INSERT INTO write_queue (statements, queued_at) VALUES (?, ?)",
+            (json.dumps([[sql, list(params)] for sql, params in statements], default=_json_default), time.time()),
+        )
+
+    def replay(self, conn) -> int:
+        """
+        Apply queued writes to Postgres (`conn`, a DBConn), one transaction per
+        entry, oldest first. An entry Postgres rejects is marked failed and
+        skipped. Losing the connection stops the replay; the rest waits for the next sync.
+        """
+        db = self._connect()
+        db.execute(
+            "UPDATE write_queue SET status = 'queued' WHERE status = 'replaying' AND claimed_at < ?",
+            (time.time() - _CLAIM_TIMEOUT,),
+        )
+        replayed = 0
+        while True:
+            entry = db.execute("SELECT id, statements FROM write_queue WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if entry is None:
+                break
+            # Claim it, so another worker's sync thread doesn't replay it too
+            claimed = db.execute(
+                "UPDATE write_queue SET status = 'replaying', claimed_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), entry["id"]),
+            ).rowcount
+            if not claimed:
+                continue
+            try:
+                for sql, params in json.loads(entry["statements"]):
+                    conn.execute(sql, params)
+                conn.commit()
+            except psycopg.OperationalError:
+                db.execute("UPDATE write_queue SET status = 'queued' WHERE id = ?", (entry["id"],))
+                raise
+            except psycopg.Error as e:
+                conn.rollback()
+                db.execute("UPDATE write_queue SET status = 'failed', error = ? WHERE id = ?", (str(e), entry["id"]))
+                metrics.incr("local_replica.replay.failed")
+                print(f"[DB] Queued offline write {entry['id']} was rejected by Postgres: {e}")
+                continue
+            db.execute("DELETE FROM write_queue WHERE id = ?", (entry["id"],))
+            replayed += 1
+        metrics.incr("local_replica.replayed", replayed)
+        return replayed
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        counts = {
+            row["status"]: row["n"]
+            for row in self._connect().execute("SELECT status, count(*) AS n FROM write_queue GROUP BY status")
+        }
+        return {
+            "enabled": True,
+            "offline": self.offline,
+            "fresh": self.fresh(),
+            "synced_at": self.synced_at,
+            "queued": counts.get("queued", 0) + counts.get("replaying", 0),
+            "failed": counts.get("failed", 0),
+        }
+
+
+class LocalConn:
+    """
+    DBConn stand-in backed by the local replica.
+
+    With a fallback (online, @read_only requests) only local queries are
+    answered from SQLite; everything else goes to the Postgres connection
+    fallback() opens on first use. Without one (offline) reads and queueable
+    writes all run locally.
+    """
+
+    role = "local"
+
+    def __init__(self, replica: LocalReplica, fallback: Optional[Callable[[], Any]] = None):
+        self._replica = replica
+        self._fallback = fallback
+        self._remote = None
+        self._db = replica._connect()
+        self._pending: List[Tuple[str, Sequence[Any]]] = []
+
+    @property
+    def offline(self) -> bool:
+        return self._fallback is None
+
+    def _postgres(self):
+        if self._remote is None:
+            self._remote = self._fallback()
+        return self._remote
+
+    def _local(self, sql: str, params: Sequence[Any]) -> sqlite3.Cursor:
+        try:
+            return self._db.execute(sql, [_sqlite_value(value) for value in params])
+        except sqlite3.Error as e:
+            # Usually a table outside the copy, or SQL only Postgres understands
+            raise OfflineError("This needs the database, which is unreachable right now.") from e
+
+    def run(self, query: "str | Query", params: Sequence[Any] = ()) -> Any:
+        if not isinstance(query, Query):
+            query = get_query(query)
+        if self.offline:
+            return self._local(query.sqlite or to_sqlite(query.sql), params)
+        if query.sqlite is None or not self._replica.fresh():
+            return self._postgres().run(query, params)
+        t0 = time.perf_counter()
+        try:
+            cur = self._local(query.sqlite, params)
+        except OfflineError:
+            metrics.incr("local_replica.fallback")
+            return self._postgres().run(query, params)
+        metrics.observe(f"sql.{query.name}.local", (time.perf_counter() - t0) * 1000)
+        return cur
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> Any:
+        if not self.offline:
+            return self._postgres().execute(sql, params)
+        if sql.lstrip()[:6].upper() == "SELECT":
+            return self._local(to_sqlite(sql), params)
+        if "RETURNING" in sql.upper():
+            raise OfflineError("This change needs the database, which is unreachable right now.")
+        if _temporary_id(sql, params):
+            # A temporary id from an offline insert: Postgres will have given that row another one
+            raise OfflineError("This change refers to something added while offline; try again once the database is back.")
+        if not self._db.in_transaction:
+            self._db.execute("BEGIN IMMEDIATE")
+        cur = self._local(to_sqlite(sql), params)
+        self._pending.append((sql, params))
+        return cur
+
+    def copy(self, sql: str) -> Any:
+        if self.offline:
+            raise OfflineError("Imports need the database, which is unreachable right now.")
+        return self._postgres().copy(sql)
+
+    def commit(self) -> None:
+        if self._remote is not None:
+            self._remote.commit()
+        if self._db.in_transaction:
+            if self._pending:
+                self._replica.enqueue(self._db, self._pending)
+                metrics.incr("local_replica.queued")
+            self._db.execute("COMMIT")
+        self._pending = []
+
+    def rollback(self) -> None:
+        if self._remote is not None:
+            self._remote.rollback()
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+        self._pending = []
+
+    def close(self) -> None:
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+        self._pending = []
+        if self._remote is not None:
+            self._remote.close()
+            self._remote = None
+
+
+replica = LocalReplica()
@@ -0,0 +1,265 @@
+"""
+Memoisation for read helpers: @memoize(tags=("recipes", "bar"))
+
+Entries are keyed by function and arguments, expire after MEMO_TTL seconds and
+are bounded by an LRU of MEMO_MAX_ENTRIES. Write routes call invalidate(tag)
+after committing. Every tag has a version; an entry remembers the versions it
+was computed under (read *before* calling the function), so anything computed
+before a bump -- including a call still running when the write committed --
+is a miss afterwards.
+
+Tags: "recipes" (Recipes/RecipeIngredients), "bar" (in_bar), "catalog"
+(PossibleIngredients rows), "stock" (purchases, bottles, pours), "lists"
+(LISTS tables).
+
+Misses are coalesced (singleflight.py): one caller per key recomputes and
+concurrent callers wait for its result. An entry whose TTL merely ran out is
+served as-is for up to MEMO_STALE_TTL more seconds while a background thread
+refreshes it. An invalidated entry is never served, so a writer's follow-up
+read always sees its own write.
+
+Backends: "memory" (per process, the default) or "sqlite", a file shared by
+every worker on the host so one worker's invalidation reaches the others. With
+the memory backend other workers see a write within MEMO_TTL. "off" disables
+memoisation. Cached values are shared between callers: treat them as read-only.
+"""
+
+import functools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from flask import Flask
+
+from metrics import metrics
+from singleflight import flights
+
+TAGS = ("recipes", "bar", "catalog", "stock", "lists")
+
+# What "can I make it" answers depend on
+AVAILABILITY_TAGS = ("recipes", "bar", "catalog", "stock", "lists")
+
+# (expires_at, tag versions, value)
+Entry = Tuple[float, Tuple[int, ...], Any]
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Entry]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: Entry) -> None:
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def bump(self, tags: Iterable[str]) -> None:
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """Entries and tag versions in one SQLite file (WAL), shared by every process that opens it."""
+
+    def __init__(self, path: str, maxsize: int = 256):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS memo_entries "
+                "(key TEXT PRIMARY KEY, expires_at REAL, versions TEXT, value BLOB, used_at REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_memo_entries_used_at ON memo_entries (used_at)")
+            db.execute("CREATE TABLE IF NOT EXISTS memo_tags (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[Entry]:
+        db = self._connect()
+        row = db.execute("SELECT expires_at, versions, value FROM memo_entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE memo_entries SET used_at = ? WHERE key = ?", (time.time(), key))
+        versions = tuple(int(v) for v in row[1].split(",")) if row[1] else ()
+        return row[0], versions, pickle.loads(row[2])
+
+    def set(self, key: str, entry: Entry) -> None:
+        expires_at, versions, value = entry
+        db = self._connect()
+        db.execute(
+            "INSERT OR REPLACE INTO memo_entries (key, expires_at, versions, value, used_at) VALUES (?, ?, ?, ?, ?)",
+            (key, expires_at, ",".join(map(str, versions)), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time()),
+        )
+        excess = db.execute("SELECT count(*) FROM memo_entries").fetchone()[0] - self.maxsize
+        if excess > 0:
+            db.execute(
+                "DELETE FROM memo_entries WHERE key IN (SELECT key FROM memo_entries ORDER BY used_at LIMIT ?)",
+                (excess,),
+            )
+
+    def versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        tags = list(tags)
+        rows = dict(
+            self._connect()
+            .execute(f"SELECT tag, version FROM memo_tags WHERE tag IN ({','.join('?' * len(tags))})", tags)
+            .fetchall()
+        )
+        return tuple(rows.get(tag, 0) for tag in tags)
+
+    def bump(self, tags: Iterable[str]) -> None:
+        db = self._connect()
+        db.executemany(
+            "INSERT INTO memo_tags (tag, version) VALUES (?, 1) "
+            "ON CONFLICT (tag) DO UPDATE SET version = version + 1",
+            [(tag,) for tag in tags],
+        )
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM memo_entries")
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT count(*) FROM memo_entries").fetchone()[0]
+
+
+class Memo:
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.ttl = 300.0
+        self.stale_ttl = 600.0
+        self.enabled = True
+
+    def configure(self, backend, ttl: float, stale_ttl: float = 0.0, enabled: bool = True) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.enabled = enabled
+
+    def invalidate(self, *tags: str) -> None:
+        unknown = set(tags) - set(TAGS)
+        if unknown:
+            raise ValueError(f"Unknown memo tag(s): {', '.join(sorted(unknown))}")
+        self.backend.bump(tags)
+        metrics.incr("memo.invalidate", len(tags))
+
+    def call(self, name: str, tags: Tuple[str, ...], ttl: Optional[float], fn: Callable, args, kwargs):
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        key = f"{name}:{args!r}:{sorted(kwargs.items())!r}"
+        versions = self.backend.versions(tags)
+        # Keyed by tag versions too: a read after a write never joins a rebuild that started before it
+        flight = (key, versions)
+
+        def compute():
+            value = fn(*args, **kwargs)
+            self.backend.set(key, (time.time() + (self.ttl if ttl is None else ttl), versions, value))
+            return value
+
+        entry = self.backend.get(key)
+        now = time.time()
+        if entry is not None:
+            expires_at, entry_versions, value = entry
+            current = entry_versions == versions
+            if current and expires_at > now:
+                metrics.incr(f"memo.{name}.hit")
+                return value
+            if current and now < expires_at + self.stale_ttl:
+                # Only the TTL ran out: answer now, refresh behind the response
+                flights.refresh(flight, compute)
+                metrics.incr(f"memo.{name}.stale")
+                return value
+        metrics.incr(f"memo.{name}.miss")
+        return flights.do(flight, compute)
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        hits = sum(v for k, v in counters.items() if k.startswith("memo.") and k.endswith(".hit"))
+        misses = sum(v for k, v in counters.items() if k.startswith("memo.") and k.endswith(".miss"))
+        stale = sum(v for k, v in counters.items() if k.startswith("memo.") and k.endswith(".stale"))
+        return {
+            "backend": type(self.backend).__name__ if self.enabled else None,
+            "entries": len(self.backend) if self.enabled else 0,
+            "hits": hits,
+            "misses": misses,
+            "stale": stale,
+        }
+
+
+memo = Memo()
+
+
+def memoize(tags: Iterable[str], ttl: Optional[float] = None):
+    """Cache a function's result per arguments until its TTL passes or one of `tags` is invalidated."""
+    tags = tuple(tags)
+    unknown = set(tags) - set(TAGS)
+    if unknown:
+        raise ValueError(f"Unknown memo tag(s): {', '.join(sorted(unknown))}")
+
+    def decorator(fn: Callable) -> Callable:
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return memo.call(name, tags, ttl, fn, args, kwargs)
+
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
+
+
+def invalidate(*tags: str) -> None:
+    memo.invalidate(*tags)
+
+
+def init_memo(app: Flask) -> None:
+    """Pick the backend from MEMO_BACKEND (memory | sqlite | off)."""
+    kind = app.config.get("MEMO_BACKEND", "memory")
+    maxsize = app.config.get("MEMO_MAX_ENTRIES", 256)
+    if kind == "sqlite":
+        path = app.config.get("MEMO_SQLITE_PATH") or os.path.join(app.instance_path, "memo.sqlite3")
+        backend = SQLiteBackend(path, maxsize)
+    else:
+        backend = MemoryBackend(maxsize)
+    memo.configure(
+        backend,
+        app.config.get("MEMO_TTL", 300),
+        stale_ttl=app.config.get("MEMO_STALE_TTL", 600),
+        enabled=kind != "off",
+    )
+    app.logger.info("[STARTUP] Memo backend: %s", kind)
@@ -0,0 +1,43 @@
+import threading
+from typing import Dict
+
+
+class Metrics:
+    """
+    Tiny in-process metrics registry: counters plus timing summaries (ms).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name: str, ms: float) -> None:
+        with self._lock:
+            stats = self._timings.get(name)
+            if stats is None:
+                stats = self._timings[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+            stats["count"] += 1
+            stats["total_ms"] += ms
+            stats["last_ms"] = ms
+            if ms > stats["max_ms"]:
+                stats["max_ms"] = ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            timings = {}
+            for name, stats in self._timings.items():
+                timings[name] = dict(stats, avg_ms=stats["total_ms"] / stats["count"])
+            return {"counters": dict(self._counters), "timings": timings}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
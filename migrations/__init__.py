@@ -0,0 +1,82 @@
+"""
+Versioned schema migrations.
+
+Each module named mNNNN_<description>.py defines upgrade(conn). Pending
+migrations are applied in order, in a single transaction guarded by an
+advisory lock, so concurrent workers booting at once cannot race. Run with
+`python -m migrations`, or let create_app() run them at startup.
+"""
+
+import importlib
+import pkgutil
+import re
+from typing import List, Optional, Tuple
+
+from utils import DBConn, _create_connection
+
+# Arbitrary constant shared by every process running migrations against the same DB.
+# Only migrations take it: runtime writers lock per entity (7326002, m0009) or
+# per ingredient (7326003, m0008), so they never wait on each other through this key.
+_ADVISORY_LOCK_ID = 7_326_001
+
+_MODULE_PATTERN = re.compile(r"^m(\d{4})_\w+$")
+
+
+def discover() -> List[Tuple[int, str]]:
+    """Return (version, module name) for every migration module, oldest first."""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        match = _MODULE_PATTERN.match(info.name)
+        if match:
+            found.append((int(match.group(1)), info.name))
+    found.sort()
+    versions = [version for version, _ in found]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return found
+
+
+def run_migrations(conn: Optional[DBConn] = None) -> List[str]:
+    """
+    Apply pending migrations and return the names of the ones applied.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = _create_connection()
+
+    applied_now: List[str] = []
+    try:
+        conn.execute("SELECT pg_advisory_xact_lock(%s)", (_ADVISORY_LOCK_ID,))
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """
+        )
+        applied = {row["version"] for row in conn.execute("SELECT version FROM schema_migrations").fetchall()}
+
+        for version, name in discover():
+            if version in applied:
+                continue
+            module = importlib.import_module(f"{__name__}.{name}")
+            module.upgrade(conn)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
+            applied_now.append(name)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+    for name in applied_now:
+        print(f"[DB] Applied migration {name}")
+    return applied_now
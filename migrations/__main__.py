@@ -0,0 +1,5 @@
+from migrations import run_migrations
+
+if __name__ == "__main__":
+    applied = run_migrations()
+    print(f"Applied {len(applied)} migration(s)." if applied else "Schema is up to date.")
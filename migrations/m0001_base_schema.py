@@ -0,0 +1,78 @@
+"""
+Base schema: every table from schema_sqlite.sql, in its Postgres form.
+
+Uses IF NOT EXISTS throughout so it is a no-op against databases that were
+created before migrations existed.
+"""
+
+
+def upgrade(conn) -> None:
+    for table in ("Categories", "GlassTypes", "IceOptions", "Methods", "Units"):
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+            """
+        )
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS Subcategories (
+            id SERIAL PRIMARY KEY,
+            category_id INTEGER NOT NULL REFERENCES Categories(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            UNIQUE (category_id, name)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS PossibleIngredients (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            sub_category TEXT,
+            in_bar BOOLEAN NOT NULL DEFAULT FALSE,
+            UNIQUE (name, category, sub_category)
+        )
+        """
+    )
+    # Older databases predate the in_bar flag
+    conn.execute(
+        "ALTER TABLE PossibleIngredients ADD COLUMN IF NOT EXISTS in_bar BOOLEAN NOT NULL DEFAULT FALSE"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS BarContents (
+            name TEXT PRIMARY KEY,
+            category TEXT NOT NULL,
+            sub_category TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS Recipes (
+            drink TEXT UNIQUE,
+            glass TEXT,
+            garnish TEXT,
+            method TEXT,
+            ice TEXT,
+            notes TEXT,
+            base_spirit TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS RecipeIngredients (
+            id SERIAL PRIMARY KEY,
+            drink TEXT,
+            ingredient TEXT,
+            quantity TEXT,
+            unit TEXT
+        )
+        """
+    )
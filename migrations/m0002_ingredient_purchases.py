@@ -0,0 +1,23 @@
+"""
+Purchase history table (previously created on demand by the /prices handlers).
+"""
+
+
+def upgrade(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS IngredientPurchases (
+            id SERIAL PRIMARY KEY,
+            ingredient_id INTEGER NOT NULL REFERENCES PossibleIngredients(id) ON DELETE CASCADE,
+            purchase_date TEXT NOT NULL,
+            location TEXT,
+            size_value REAL NOT NULL,
+            size_unit TEXT NOT NULL,
+            price REAL NOT NULL,
+            notes TEXT
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ingredient_purchases_ingredient_id ON IngredientPurchases (ingredient_id)"
+    )
@@ -0,0 +1,25 @@
+"""
+Resolved references on RecipeIngredients, filled in when recipes are saved.
+
+label_key is the normalized label, possible_ingredient_id the bottle it names
+(if any) and ref_kind how it is satisfied (see resolver.REF_*). ref_kind stays
+NULL here; normalization.backfill_recipe_refs() resolves existing rows.
+"""
+
+
+def upgrade(conn) -> None:
+    conn.execute(
+        """
+        ALTER TABLE RecipeIngredients
+            ADD COLUMN IF NOT EXISTS label_key TEXT,
+            ADD COLUMN IF NOT EXISTS ref_kind TEXT,
+            ADD COLUMN IF NOT EXISTS possible_ingredient_id INTEGER
+                REFERENCES PossibleIngredients(id) ON DELETE SET NULL
+        """
+    )
+    conn.execute("UPDATE RecipeIngredients SET label_key = lower(trim(ingredient)) WHERE label_key IS NULL")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_possible_ingredient_id "
+        "ON RecipeIngredients (possible_ingredient_id)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_label_key ON RecipeIngredients (label_key)")
@@ -0,0 +1,26 @@
+"""
+Surrogate integer keys for Recipes, referenced from RecipeIngredients.
+
+RecipeIngredients.recipe_id is authoritative from here on; the old drink
+column is still written (the SQLite import tooling inserts by name) but no
+longer read, so renaming a recipe is a single-row UPDATE on Recipes.
+"""
+
+
+def upgrade(conn) -> None:
+    conn.execute("ALTER TABLE Recipes ADD COLUMN IF NOT EXISTS id SERIAL PRIMARY KEY")
+    conn.execute(
+        """
+        ALTER TABLE RecipeIngredients
+            ADD COLUMN IF NOT EXISTS recipe_id INTEGER REFERENCES Recipes(id) ON DELETE CASCADE
+        """
+    )
+    conn.execute(
+        """
+        UPDATE RecipeIngredients AS ri
+        SET recipe_id = r.id
+        FROM Recipes AS r
+        WHERE ri.recipe_id IS NULL AND r.drink = ri.drink
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_recipe_id ON RecipeIngredients (recipe_id)")
@@ -0,0 +1,71 @@
+"""
+Change log for delta sync (see changes.py).
+
+Row triggers append (version, entity, entity_id, op) for every write to
+recipes, recipe ingredients, possible ingredients (including in_bar) and
+purchases, whichever code path made it. Writers take a transaction-scoped
+advisory lock before drawing a version, so versions become visible in
+commit order and a client cursor never skips a slower transaction.
+"""
+
+# entity, table, id column, whether a DELETE removes the entity or just changes its parent
+_TRACKED = (
+    ("recipe", "Recipes", "id", True),
+    ("recipe", "RecipeIngredients", "recipe_id", False),
+    ("ingredient", "PossibleIngredients", "id", True),
+    ("purchase", "IngredientPurchases", "id", True),
+)
+
+
+def upgrade(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            version BIGSERIAL PRIMARY KEY,
+            entity TEXT NOT NULL,
+            entity_id INTEGER,
+            op TEXT NOT NULL,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_changed_at ON change_log (changed_at)")
+    conn.execute(
+        """
+        CREATE OR REPLACE FUNCTION record_change() RETURNS trigger AS $$
+        DECLARE
+            row_data JSONB;
+            op TEXT := 'upsert';
+        BEGIN
+            PERFORM pg_advisory_xact_lock(7326002);
+            IF TG_OP = 'DELETE' THEN
+                row_data := to_jsonb(OLD);
+                IF TG_ARGV[2] = 'owner' THEN
+                    op := 'delete';
+                END IF;
+            ELSE
+                row_data := to_jsonb(NEW);
+            END IF;
+            IF row_data ->> TG_ARGV[1] IS NOT NULL THEN
+                INSERT INTO change_log (entity, entity_id, op)
+                VALUES (TG_ARGV[0], (row_data ->> TG_ARGV[1])::int, op);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for entity, table, id_column, owner in _TRACKED:
+        args = f"'{entity}', '{id_column}', '{'owner' if owner else 'child'}'"
+        name = f"trg_{table.lower()}_changes"
+        conn.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+        conn.execute(
+            f"CREATE TRIGGER {name} AFTER INSERT OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION record_change({args})"
+        )
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}_update ON {table}")
+        # No-op updates (e.g. re-adding a bottle already in the bar) are not changes
+        conn.execute(
+            f"CREATE TRIGGER {name}_update AFTER UPDATE ON {table} "
+            f"FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION record_change({args})"
+        )
@@ -0,0 +1,9 @@
+"""
+Expression index for the case-insensitive name lookups used by the bar routes.
+"""
+
+
+def upgrade(conn) -> None:
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_possible_ingredients_lower_name ON PossibleIngredients (lower(name))"
+    )
@@ -0,0 +1,73 @@
+"""
+Bottle-level stock (see stock.py).
+
+Every purchase becomes a bottle with a remaining volume; pours deduct from
+them. Existing purchases are seeded here: the latest purchase of each
+ingredient currently in the bar is one full, open bottle, and older ones
+are recorded as finished. Ingredients with no convertible purchase stay
+untracked, so availability keeps treating them as plain in_bar flags.
+"""
+
+from units import convert_to_ml
+
+
+def upgrade(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bottles (
+            id SERIAL PRIMARY KEY,
+            ingredient_id INTEGER NOT NULL REFERENCES PossibleIngredients(id) ON DELETE CASCADE,
+            purchase_id INTEGER UNIQUE REFERENCES IngredientPurchases(id) ON DELETE CASCADE,
+            size_ml DOUBLE PRECISION NOT NULL,
+            remaining_ml DOUBLE PRECISION NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            opened_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bottles_open ON bottles (ingredient_id) WHERE finished_at IS NULL"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pours (
+            id BIGSERIAL PRIMARY KEY,
+            ingredient_id INTEGER NOT NULL REFERENCES PossibleIngredients(id) ON DELETE CASCADE,
+            recipe_id INTEGER REFERENCES Recipes(id) ON DELETE SET NULL,
+            volume_ml DOUBLE PRECISION NOT NULL,
+            poured_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pours_ingredient_time ON pours (ingredient_id, poured_at)")
+
+    if conn.execute("SELECT 1 FROM bottles LIMIT 1").fetchone():
+        return
+    purchases = conn.execute(
+        """
+        SELECT ip.id, ip.ingredient_id, ip.size_value, ip.size_unit, pi.in_bar,
+               row_number() OVER (
+                   PARTITION BY ip.ingredient_id ORDER BY ip.purchase_date DESC, ip.id DESC
+               ) AS recency
+        FROM IngredientPurchases ip
+        JOIN PossibleIngredients pi ON pi.id = ip.ingredient_id
+        """
+    ).fetchall()
+    seeds = []
+    for row in purchases:
+        size_ml = convert_to_ml(row["size_value"], row["size_unit"])
+        if not size_ml:
+            continue
+        full = row["in_bar"] and row["recency"] == 1
+        seeds.append((row["ingredient_id"], row["id"], size_ml, size_ml if full else 0.0, not full))
+    if seeds:
+        ingredient_ids, purchase_ids, sizes, remaining, finished = (list(column) for column in zip(*seeds))
+        conn.execute(
+            """
+            INSERT INTO bottles (ingredient_id, purchase_id, size_ml, remaining_ml, finished_at)
+            SELECT i, p, s, r, CASE WHEN f THEN now() END
+            FROM unnest(%s::int[], %s::int[], %s::float8[], %s::float8[], %s::bool[]) AS t(i, p, s, r, f)
+            """,
+            (ingredient_ids, purchase_ids, sizes, remaining, finished),
+        )
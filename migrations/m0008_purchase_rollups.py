@@ -0,0 +1,132 @@
+"""
+Monthly purchase rollups (see rollups.py).
+
+IngredientPurchases gains a size_ml column (the size converted with
+units.convert_to_ml by whoever writes the row; NULL for unknown units), and
+purchase_rollups keeps, per ingredient, location and month: the purchase count,
+total spend and the min/avg price per ml.
+
+Statement-level triggers recompute only the (ingredient, location, month)
+groups a statement touched, so a COPY of thousands of rows costs one pass and
+a delete can lower a group's minimum correctly. A per-ingredient advisory lock
+serialises concurrent writers to the same groups, so the last recompute always
+sees the other transaction's committed rows.
+"""
+
+from units import convert_to_ml
+
+
+def upgrade(conn) -> None:
+    conn.execute("ALTER TABLE IngredientPurchases ADD COLUMN IF NOT EXISTS size_ml DOUBLE PRECISION")
+    rows = conn.execute(
+        "SELECT id, size_value, size_unit FROM IngredientPurchases WHERE size_ml IS NULL"
+    ).fetchall()
+    sizes = [(row["id"], convert_to_ml(row["size_value"], row["size_unit"])) for row in rows]
+    sizes = [(purchase_id, size_ml) for purchase_id, size_ml in sizes if size_ml]
+    if sizes:
+        ids, values = (list(column) for column in zip(*sizes))
+        conn.execute(
+            """
+            UPDATE IngredientPurchases AS ip SET size_ml = u.size_ml
+            FROM unnest(%s::int[], %s::float8[]) AS u(id, size_ml)
+            WHERE ip.id = u.id
+            """,
+            (ids, values),
+        )
+    # Keyset pagination for /prices
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ingredient_purchases_date_id ON IngredientPurchases (purchase_date DESC, id DESC)"
+    )
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS purchase_rollups (
+            ingredient_id INTEGER NOT NULL REFERENCES PossibleIngredients(id) ON DELETE CASCADE,
+            location TEXT NOT NULL,
+            month TEXT NOT NULL,
+            purchases INTEGER NOT NULL,
+            total_spend DOUBLE PRECISION NOT NULL,
+            priced INTEGER NOT NULL,
+            price_per_ml_sum DOUBLE PRECISION NOT NULL,
+            min_price_per_ml DOUBLE PRECISION,
+            PRIMARY KEY (ingredient_id, location, month)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_purchase_rollups_location ON purchase_rollups (location, month)")
+
+    conn.execute(
+        """
+        CREATE OR REPLACE FUNCTION refresh_purchase_rollups(ingredient_ids INT[], locations TEXT[], months TEXT[])
+        RETURNS void AS $$
+        DECLARE
+            lock_id INT;
+        BEGIN
+            FOR lock_id IN SELECT DISTINCT i FROM unnest(ingredient_ids) AS i ORDER BY i LOOP
+                PERFORM pg_advisory_xact_lock(7326003, lock_id);
+            END LOOP;
+            DELETE FROM purchase_rollups r
+            USING unnest(ingredient_ids, locations, months) AS g(i, l, m)
+            WHERE r.ingredient_id = g.i AND r.location = g.l AND r.month = g.m;
+            INSERT INTO purchase_rollups
+                (ingredient_id, location, month, purchases, total_spend, priced, price_per_ml_sum, min_price_per_ml)
+            SELECT g.i, g.l, g.m,
+                   count(*),
+                   sum(ip.price),
+                   count(ip.size_ml),
+                   COALESCE(sum(ip.price / ip.size_ml), 0),
+                   min(ip.price / ip.size_ml)
+            FROM (SELECT DISTINCT * FROM unnest(ingredient_ids, locations, months)) AS g(i, l, m)
+            JOIN IngredientPurchases ip
+              ON ip.ingredient_id = g.i
+             AND COALESCE(ip.location, '') = g.l
+             AND left(ip.purchase_date, 7) = g.m
+            GROUP BY g.i, g.l, g.m;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    conn.execute(
+        """
+        CREATE OR REPLACE FUNCTION purchase_rollups_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM refresh_purchase_rollups(
+                    array_agg(ingredient_id), array_agg(COALESCE(location, '')), array_agg(left(purchase_date, 7))
+                ) FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM refresh_purchase_rollups(
+                    array_agg(ingredient_id), array_agg(COALESCE(location, '')), array_agg(left(purchase_date, 7))
+                ) FROM old_rows;
+            ELSE
+                PERFORM refresh_purchase_rollups(
+                    array_agg(ingredient_id), array_agg(COALESCE(location, '')), array_agg(left(purchase_date, 7))
+                ) FROM (SELECT * FROM old_rows UNION ALL SELECT * FROM new_rows) AS changed;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    # Transition tables allow one event per trigger
+    for event, referencing in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    ):
+        name = f"trg_ingredientpurchases_rollup_{event.lower()}"
+        conn.execute(f"DROP TRIGGER IF EXISTS {name} ON IngredientPurchases")
+        conn.execute(
+            f"CREATE TRIGGER {name} AFTER {event} ON IngredientPurchases "
+            f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION purchase_rollups_trigger()"
+        )
+
+    conn.execute("TRUNCATE purchase_rollups")
+    conn.execute(
+        """
+        SELECT refresh_purchase_rollups(
+            array_agg(ingredient_id), array_agg(COALESCE(location, '')), array_agg(left(purchase_date, 7))
+        )
+        FROM IngredientPurchases
+        """
+    )
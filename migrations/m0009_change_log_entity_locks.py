@@ -0,0 +1,59 @@
+"""
+Per-entity change_log locks.
+
+m0005's trigger took one advisory lock for every tracked write, so a purchase
+insert waited on a bar edit and the other way round. Writers now lock only
+their entity (recipe, ingredient, purchase: keys (7326002, 1..3)). Versions
+still become visible in commit order within an entity, and changes.py takes
+the same keys in shared mode while it reads, so a cursor never skips a
+slower transaction of the entities it asked for.
+"""
+
+# entity, table, id column, whether a DELETE removes the entity or just changes its parent, lock key
+_TRACKED = (
+    ("recipe", "Recipes", "id", True, 1),
+    ("recipe", "RecipeIngredients", "recipe_id", False, 1),
+    ("ingredient", "PossibleIngredients", "id", True, 2),
+    ("purchase", "IngredientPurchases", "id", True, 3),
+)
+
+
+def upgrade(conn) -> None:
+    conn.execute(
+        """
+        CREATE OR REPLACE FUNCTION record_change() RETURNS trigger AS $$
+        DECLARE
+            row_data JSONB;
+            op TEXT := 'upsert';
+        BEGIN
+            PERFORM pg_advisory_xact_lock(7326002, TG_ARGV[3]::int);
+            IF TG_OP = 'DELETE' THEN
+                row_data := to_jsonb(OLD);
+                IF TG_ARGV[2] = 'owner' THEN
+                    op := 'delete';
+                END IF;
+            ELSE
+                row_data := to_jsonb(NEW);
+            END IF;
+            IF row_data ->> TG_ARGV[1] IS NOT NULL THEN
+                INSERT INTO change_log (entity, entity_id, op)
+                VALUES (TG_ARGV[0], (row_data ->> TG_ARGV[1])::int, op);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for entity, table, id_column, owner, lock_key in _TRACKED:
+        args = f"'{entity}', '{id_column}', '{'owner' if owner else 'child'}', '{lock_key}'"
+        name = f"trg_{table.lower()}_changes"
+        conn.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+        conn.execute(
+            f"CREATE TRIGGER {name} AFTER INSERT OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION record_change({args})"
+        )
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}_update ON {table}")
+        conn.execute(
+            f"CREATE TRIGGER {name}_update AFTER UPDATE ON {table} "
+            f"FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION record_change({args})"
+        )
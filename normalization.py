@@ -0,0 +1,133 @@
+"""
+Write-time resolution of free-text recipe ingredients.
+
+Each RecipeIngredients row stores label_key / ref_kind / possible_ingredient_id
+(see migrations/m0003) so availability checks are id and set lookups instead of
+lower(trim()) comparisons. Rows are resolved when recipes are saved and
+re-resolved when the ingredient catalog or LISTS change.
+"""
+
+import time
+from typing import Iterable, List, Optional
+
+from metrics import metrics
+from resolver import IngredientResolver, get_resolver
+from utils import get_db_connection
+from warmup import register_warmer
+
+
+def insert_recipe_ingredient(
+    conn,
+    recipe_id: int,
+    drink: str,
+    ingredient: str,
+    quantity: str,
+    unit: str,
+    resolver: Optional[IngredientResolver] = None,
+) -> None:
+    ref = (resolver or get_resolver()).reference(ingredient)
+    conn.execute(
+        """
+        INSERT INTO recipeingredients
+            (recipe_id, drink, ingredient, quantity, unit, label_key, ref_kind, possible_ingredient_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (recipe_id, drink, ingredient, quantity, unit, ref.label_key, ref.ref_kind, ref.ingredient_id),
+    )
+
+
+def _apply_refs(conn, resolver: IngredientResolver, labels: List[str]) -> int:
+    refs = [resolver.reference(label) for label in labels]
+    if not refs:
+        return 0
+    cur = conn.execute(
+        """
+        UPDATE recipeingredients AS ri
+        SET label_key = v.label_key, ref_kind = v.ref_kind, possible_ingredient_id = v.ingredient_id
+        FROM unnest(%s::text[], %s::text[], %s::int[]) AS v(label_key, ref_kind, ingredient_id)
+        WHERE lower(trim(ri.ingredient)) = v.label_key
+          AND (ri.ref_kind IS DISTINCT FROM v.ref_kind
+               OR ri.label_key IS DISTINCT FROM v.label_key
+               OR ri.possible_ingredient_id IS DISTINCT FROM v.ingredient_id)
+        """,
+        (
+            [ref.label_key for ref in refs],
+            [ref.ref_kind for ref in refs],
+            [ref.ingredient_id for ref in refs],
+        ),
+    )
+    return cur.rowcount or 0
+
+
+def refresh_recipe_refs(
+    conn,
+    labels: Optional[Iterable[str]] = None,
+    resolver: Optional[IngredientResolver] = None,
+) -> int:
+    """
+    Re-resolve recipe rows whose label is one of `labels` (every row when None).
+    Call after an ingredient's name/category changes; the caller commits.
+    """
+    resolver = resolver or get_resolver()
+    if labels is None:
+        rows = conn.execute("SELECT DISTINCT lower(trim(ingredient)) AS key FROM recipeingredients").fetchall()
+        keys = [row["key"] for row in rows if row["key"] is not None]
+    else:
+        keys = sorted({(label or "").strip().lower() for label in labels if (label or "").strip()})
+    t0 = time.perf_counter()
+    updated = _apply_refs(conn, resolver, keys)
+    metrics.observe("normalization.refresh", (time.perf_counter() - t0) * 1000)
+    return updated
+
+
+def backfill_recipe_refs(conn, resolver: Optional[IngredientResolver] = None) -> int:
+    """
+    Resolve rows written before write-time resolution existed (ref_kind IS NULL).
+    """
+    rows = conn.execute(
+        "SELECT DISTINCT lower(trim(ingredient)) AS key FROM recipeingredients WHERE ref_kind IS NULL"
+    ).fetchall()
+    keys = [row["key"] for row in rows if row["key"] is not None]
+    return _apply_refs(conn, resolver or get_resolver(), keys)
+
+
+def backfill_recipe_ids(conn) -> int:
+    """
+    Attach rows inserted by name only (e.g. the SQLite import) to their recipe.
+    """
+    cur = conn.execute(
+        """
+        UPDATE recipeingredients AS ri
+        SET recipe_id = r.id
+        FROM recipes AS r
+        WHERE ri.recipe_id IS NULL AND r.drink = ri.drink
+        """
+    )
+    return cur.rowcount or 0
+
+
+@register_warmer
+def _backfill_on_warmup() -> None:
+    conn = get_db_connection()
+    try:
+        linked = backfill_recipe_ids(conn)
+        count = backfill_recipe_refs(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    if linked or count:
+        print(f"[DB] Backfilled {linked} recipe ids and {count} recipe ingredient references")
+
+
+if __name__ == "__main__":
+    from catalog import IngredientCatalog
+    from utils import _create_connection, load_lists
+
+    conn = _create_connection()
+    try:
+        resolver = IngredientResolver(load_lists(), IngredientCatalog.load(conn))
+        count = refresh_recipe_refs(conn, resolver=resolver)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"[DB] Re-resolved {count} recipe ingredient rows")
@@ -0,0 +1,210 @@
+"""
+Batch planning for events: a menu of drinks x servings in, per-ingredient
+volumes, a shopping list and a cost estimate out.
+
+Every recipe row on the menu is parsed once (parse_quantity + UNIT_TO_ML) and
+the per-requirement totals are a single weighted np.bincount, so a menu of
+hundreds of drinks costs three queries and one pass over its ingredient rows.
+
+Stock is what the bar's open bottles hold (stock.py), summed over every owned
+bottle that can fill a requirement; an owned but untracked ingredient counts as
+one full bottle of its most recent purchase size. Prices come from the bottle
+picked for the line and its latest purchase.
+"""
+
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from availability import Token, providers, recipe_row_token
+from catalog import IngredientCatalog
+from resolver import IngredientResolver
+from stock import stock_levels
+from units import convert_to_ml, parse_quantity
+
+
+def _parse_menu(menu) -> Tuple[List[Tuple[Optional[int], str, int]], List[dict]]:
+    """[(recipe id or None, drink name, servings)] plus per-item errors."""
+    items, errors = [], []
+    for position, item in enumerate(menu if isinstance(menu, list) else []):
+        if not isinstance(item, dict):
+            errors.append({"item": position, "error": "Expected an object."})
+            continue
+        recipe_id = item.get("id")
+        drink = (item.get("drink") or "").strip() if isinstance(item.get("drink"), str) else ""
+        servings = item.get("servings", 1)
+        if not isinstance(recipe_id, int) and not drink:
+            errors.append({"item": position, "error": "Expected 'id' or 'drink'."})
+        elif not isinstance(servings, int) or isinstance(servings, bool) or servings <= 0:
+            errors.append({"item": position, "error": "Servings must be a positive integer."})
+        else:
+            items.append((recipe_id if isinstance(recipe_id, int) else None, drink, servings))
+    return items, errors
+
+
+def _latest_purchases(conn, ingredient_ids: Iterable[int]) -> Dict[int, dict]:
+    rows = conn.execute(
+        """
+        SELECT DISTINCT ON (ingredient_id) ingredient_id, size_value, size_unit, price
+        FROM IngredientPurchases
+        WHERE ingredient_id = ANY(%s)
+        ORDER BY ingredient_id, purchase_date DESC, id DESC
+        """,
+        (list(ingredient_ids),),
+    ).fetchall()
+    latest = {}
+    for row in rows:
+        bottle_ml = convert_to_ml(row["size_value"], row["size_unit"])
+        if bottle_ml and row["price"] is not None:
+            latest[row["ingredient_id"]] = {
+                "bottle_ml": bottle_ml,
+                "price": float(row["price"]),
+                "price_per_ml": float(row["price"]) / bottle_ml,
+            }
+    return latest
+
+
+def _held_ml(record, prices: Dict[int, dict], levels: Dict[int, float]) -> float:
+    """What an owned bottle holds: its tracked level, else one full bottle of its latest purchase."""
+    if record.id in levels:
+        return levels[record.id]
+    return prices[record.id]["bottle_ml"] if record.id in prices else 0.0
+
+
+def _owned_ml(candidates: List, prices: Dict[int, dict], levels: Dict[int, float]) -> float:
+    """Stock across every in-bar bottle that can fill a requirement (e.g. all the gins for "gin")."""
+    return sum(_held_ml(record, prices, levels) for record in candidates if record.in_bar)
+
+
+def _pick_bottle(candidates: List, prices: Dict[int, dict], levels: Dict[int, float]):
+    """Prefer a bottle already in the bar (fullest first), then the cheapest per ml, then any."""
+    if not candidates:
+        return None
+    return min(
+        candidates,
+        key=lambda record: (
+            not record.in_bar,
+            -_held_ml(record, prices, levels),
+            prices[record.id]["price_per_ml"] if record.id in prices else math.inf,
+            record.name.lower(),
+        ),
+    )
+
+
+def plan_menu(conn, menu, resolver: IngredientResolver, catalog: IngredientCatalog) -> dict:
+    """Aggregate a menu ([{"drink" | "id", "servings"}]) into volumes, a shopping list and costs."""
+    items, errors = _parse_menu(menu)
+
+    names = [drink for recipe_id, drink, _ in items if recipe_id is None]
+    rows = conn.execute(
+        "SELECT id, drink FROM recipes WHERE id = ANY(%s) OR drink = ANY(%s)",
+        ([recipe_id for recipe_id, _, _ in items if recipe_id is not None], names),
+    ).fetchall()
+    by_id = {row["id"]: row["drink"] for row in rows}
+    by_name = {row["drink"]: row["id"] for row in rows}
+
+    servings_by_recipe: Dict[int, int] = defaultdict(int)
+    for recipe_id, drink, servings in items:
+        resolved = recipe_id if recipe_id is not None else by_name.get(drink)
+        if resolved not in by_id:
+            errors.append({"drink": drink or recipe_id, "error": "Recipe not found."})
+            continue
+        servings_by_recipe[resolved] += servings
+
+    ingredient_rows = conn.execute(
+        """
+        SELECT recipe_id, ingredient, quantity, unit, label_key, ref_kind, possible_ingredient_id
+        FROM recipeingredients
+        WHERE recipe_id = ANY(%s)
+        ORDER BY recipe_id, id
+        """,
+        (list(servings_by_recipe),),
+    ).fetchall()
+
+    # One pass over the rows: requirement index, ml per serving, servings
+    requirements: Dict[Token, int] = {}
+    labels: List[str] = []
+    requirement_of, ml_per_serving, servings = [], [], []
+    other_amounts: Dict[int, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for row in ingredient_rows:
+        label = (row["ingredient"] or "").strip()
+        if not label:
+            continue
+        token = recipe_row_token(row, resolver)
+        index = requirements.setdefault(token, len(requirements))
+        if index == len(labels):
+            labels.append(label)
+        amount = parse_quantity(row["quantity"])
+        ml = convert_to_ml(amount, row["unit"]) if amount is not None else None
+        if ml is None:
+            # Garnishes, "top with", etc.: kept as counts in their own unit
+            unit = (row["unit"] or "").strip().lower() or "each"
+            other_amounts[index][unit] += (amount or 1) * servings_by_recipe[row["recipe_id"]]
+            continue
+        requirement_of.append(index)
+        ml_per_serving.append(ml)
+        servings.append(servings_by_recipe[row["recipe_id"]])
+
+    totals = np.bincount(
+        np.asarray(requirement_of, dtype=np.int64),
+        weights=np.asarray(ml_per_serving, dtype=np.float64) * np.asarray(servings, dtype=np.float64),
+        minlength=len(requirements),
+    )
+
+    candidates = {token: providers(token, catalog) for token in requirements}
+    candidate_ids = {record.id for bottles in candidates.values() for record in bottles}
+    prices = _latest_purchases(conn, candidate_ids)
+    levels = stock_levels(conn, candidate_ids)
+
+    lines, shopping, unpriced = [], [], []
+    pour_cost = purchase_cost = 0.0
+    for token, index in requirements.items():
+        total_ml = float(totals[index])
+        bottle = _pick_bottle(candidates[token], prices, levels)
+        price = prices.get(bottle.id) if bottle is not None else None
+        stock_ml = _owned_ml(candidates[token], prices, levels)
+        shortfall_ml = max(0.0, total_ml - stock_ml)
+        line = {
+            "ingredient": labels[index],
+            "bottle": {"id": bottle.id, "name": bottle.name} if bottle is not None else None,
+            "in_bar": bool(bottle is not None and bottle.in_bar),
+            "total_ml": round(total_ml, 1),
+            "other_amounts": dict(other_amounts.get(index, {})),
+            "stock_ml": round(stock_ml, 1),
+            "shortfall_ml": round(shortfall_ml, 1),
+            "bottles_to_buy": None,
+            "pour_cost": None,
+            "purchase_cost": None,
+        }
+        if price:
+            line["bottle_ml"] = round(price["bottle_ml"], 1)
+            line["pour_cost"] = round(total_ml * price["price_per_ml"], 2)
+            line["bottles_to_buy"] = math.ceil(shortfall_ml / price["bottle_ml"] - 1e-9) if shortfall_ml else 0
+            line["purchase_cost"] = round(line["bottles_to_buy"] * price["price"], 2)
+            pour_cost += line["pour_cost"]
+            purchase_cost += line["purchase_cost"]
+        elif total_ml or not line["in_bar"]:
+            unpriced.append(labels[index])
+        if line["bottles_to_buy"] or (line["bottles_to_buy"] is None and not line["in_bar"]):
+            shopping.append(line)
+        lines.append(line)
+
+    lines.sort(key=lambda line: -line["total_ml"])
+    return {
+        "menu": [
+            {"id": recipe_id, "drink": by_id[recipe_id], "servings": count}
+            for recipe_id, count in servings_by_recipe.items()
+        ],
+        "errors": errors,
+        "ingredients": lines,
+        "shopping_list": sorted(shopping, key=lambda line: line["ingredient"].lower()),
+        "totals": {
+            "servings": sum(servings_by_recipe.values()),
+            "volume_ml": round(float(totals.sum()), 1),
+            "pour_cost": round(pour_cost, 2),
+            "purchase_cost": round(purchase_cost, 2),
+            "unpriced": sorted(unpriced, key=str.lower),
+        },
+    }
@@ -0,0 +1,235 @@
+"""
+Named SQL for the hot read paths.
+
+Queries are declared once here with query(name, sql) and executed by name with
+conn.run(name, params) (utils.DBConn). On pooled connections (DB_POOL_SIZE,
+psycopg_pool) they are sent with prepare=True: Postgres parses and plans each
+one once per connection and reuses the plan in later requests. A connection
+opened for a single request gains nothing from that extra round trip, so there
+psycopg only prepares a query once it has run prepare_threshold times.
+DB_PREPARE=false never prepares (e.g. behind a PgBouncer too old for
+protocol-level prepared statements).
+
+Every run is timed into metrics as "sql.<name>" (see /metrics).
+
+Queries declared with local=True only touch tables in the local SQLite replica
+(local_replica.py) and can be answered from it; their SQLite text is derived
+from the Postgres text unless given explicitly with sqlite=.
+
+Writes and SQL assembled at runtime (stock.py, rollups.py) stay ad hoc.
+"""
+
+import re
+from typing import Dict, Optional
+
+_CAST = re.compile(r"::\w+(\[\])?")
+_ANY = re.compile(r"=\s*ANY\(%s\)", re.IGNORECASE)
+
+
+def to_sqlite(sql: str) -> str:
+    """
+    Mechanical Postgres -> SQLite rewrite for the dialect used here: %s
+    placeholders, ::casts and "= ANY(%s)" (whose list parameter is passed as JSON).
+    """
+    sql = _ANY.sub("IN (SELECT value FROM json_each(%s))", sql)
+    return _CAST.sub("", sql).replace("%s", "?").replace("%%", "%")
+
+
+class Query:
+    __slots__ = ("name", "sql", "sqlite")
+
+    def __init__(self, name: str, sql: str, sqlite: Optional[str] = None):
+        self.name = name
+        self.sql = sql
+        self.sqlite = sqlite
+
+    def __repr__(self) -> str:
+        return f"Query({self.name!r})"
+
+
+REGISTRY: Dict[str, Query] = {}
+
+
+def query(name: str, sql: str, local: bool = False, sqlite: Optional[str] = None) -> Query:
+    """Register `sql` under `name`; a name can only be declared once."""
+    if name in REGISTRY:
+        raise ValueError(f"Query {name!r} is already registered")
+    if local and sqlite is None:
+        sqlite = to_sqlite(sql)
+    REGISTRY[name] = Query(name, sql, sqlite)
+    return REGISTRY[name]
+
+
+def get_query(name: str) -> Query:
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise ValueError(f"Unknown query {name!r}") from None
+
+
+# --- Reference lists (utils.load_lists) ---
+
+query("lists.categories", "SELECT name FROM Categories ORDER BY name", local=True)
+query("lists.category_id", "SELECT id FROM Categories WHERE name = %s", local=True)
+query("lists.subcategories", "SELECT name FROM Subcategories WHERE category_id = %s ORDER BY name", local=True)
+query("lists.glass_types", "SELECT name FROM GlassTypes ORDER BY name", local=True)
+query("lists.methods", "SELECT name FROM Methods ORDER BY name", local=True)
+query("lists.ice_options", "SELECT name FROM IceOptions ORDER BY name", local=True)
+query("lists.units", "SELECT name FROM Units ORDER BY name", local=True)
+
+# --- Catalog / bar ---
+
+query("catalog.all", "SELECT id, name, category, sub_category, in_bar FROM PossibleIngredients", local=True)
+
+query(
+    "bar.contents",
+    """
+    SELECT name, category, sub_category
+    FROM possibleingredients
+    WHERE in_bar = TRUE
+    ORDER BY category, name
+    """,
+    local=True,
+)
+
+query(
+    "bar.ingredient_by_name",
+    """
+    SELECT name, in_bar
+    FROM possibleingredients
+    WHERE lower(name) = lower(%s)
+    LIMIT 1
+    """,
+    local=True,
+)
+
+query(
+    "bar.ingredients_by_names",
+    "SELECT name, in_bar FROM possibleingredients WHERE lower(name) = ANY(%s)",
+    local=True,
+)
+
+# --- Availability (availability.load_availability) ---
+
+query(
+    "availability.requirements",
+    """
+    SELECT r.id AS recipe_id, r.drink, COALESCE(r.base_spirit, '') AS base_spirit,
+           ri.ingredient, ri.quantity, ri.unit, ri.label_key, ri.ref_kind, ri.possible_ingredient_id
+    FROM recipes r
+    LEFT JOIN recipeingredients ri
+      ON ri.recipe_id = r.id
+    ORDER BY r.drink, ri.id
+    """,
+    local=True,
+)
+
+query(
+    "availability.owned",
+    """
+    SELECT pi.id, pi.category, pi.sub_category, s.remaining_ml
+    FROM possibleingredients pi
+    LEFT JOIN (
+        SELECT ingredient_id, COALESCE(sum(remaining_ml) FILTER (WHERE finished_at IS NULL), 0) AS remaining_ml
+        FROM bottles
+        GROUP BY ingredient_id
+    ) s ON s.ingredient_id = pi.id
+    WHERE pi.in_bar = TRUE
+    """,
+    local=True,
+)
+
+# --- Recipes ---
+
+query("recipes.by_drink", "SELECT * FROM Recipes WHERE drink = %s", local=True)
+query("recipes.by_id", "SELECT * FROM Recipes WHERE id = %s", local=True)
+query("recipes.id_by_drink", "SELECT id FROM recipes WHERE drink = %s", local=True)
+
+query(
+    "recipes.list",
+    """
+    SELECT
+    r.id,
+    r.drink,
+    COALESCE(r.base_spirit, '') AS base_spirit
+    FROM recipes r
+    ORDER BY
+    CASE WHEN r.base_spirit IS NULL OR r.base_spirit = '' THEN 1 ELSE 0 END,
+    lower(r.base_spirit),
+    lower(r.drink)
+    """,
+    local=True,
+)
+
+query(
+    "recipes.ingredient_summaries",
+    """
+    SELECT
+    recipe_id,
+    COALESCE(
+        string_agg(
+        DISTINCT NULLIF(trim(ingredient), ''),
+        ' • '
+        ORDER BY NULLIF(trim(ingredient), '')
+        ),
+        ''
+    ) AS ingredient_summary
+    FROM recipeingredients
+    WHERE recipe_id IS NOT NULL
+    GROUP BY recipe_id
+    """,
+    # SQLite before 3.44 has no ORDER BY inside aggregates: de-duplicate and sort first
+    sqlite="""
+    SELECT recipe_id, COALESCE(group_concat(ingredient, ' • '), '') AS ingredient_summary
+    FROM (
+        SELECT DISTINCT recipe_id, NULLIF(trim(ingredient), '') AS ingredient
+        FROM recipeingredients
+        WHERE recipe_id IS NOT NULL AND NULLIF(trim(ingredient), '') IS NOT NULL
+        ORDER BY recipe_id, ingredient
+    )
+    GROUP BY recipe_id
+    """,
+)
+
+query(
+    "recipes.ingredients",
+    """
+    SELECT
+        ri.recipe_id,
+        ri.ingredient,
+        ri.quantity,
+        ri.unit,
+        COALESCE(pi.category, '') AS category,
+        COALESCE(pi.sub_category, '') AS sub_category
+    FROM recipeingredients AS ri
+    LEFT JOIN possibleingredients AS pi
+        ON pi.id = ri.possible_ingredient_id
+    WHERE ri.recipe_id = ANY(%s)
+    ORDER BY ri.id
+    """,
+    local=True,
+)
+
+query(
+    "recipes.ingredient_names",
+    "SELECT recipe_id, ingredient FROM recipeingredients WHERE recipe_id IS NOT NULL ORDER BY id",
+    local=True,
+)
+
+query(
+    "recipes.current_ingredients",
+    "SELECT ingredient, quantity, unit FROM recipeingredients WHERE recipe_id = %s ORDER BY id",
+    local=True,
+)
+
+# --- Purchases ---
+
+query(
+    "purchases.for_ingredient",
+    """
+    SELECT id, purchase_date, location, size_value, size_unit, size_ml, price, notes
+    FROM IngredientPurchases
+    WHERE ingredient_id = %s
+    ORDER BY purchase_date DESC, id DESC
+    """,
+)
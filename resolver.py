@@ -0,0 +1,192 @@
+import threading
+from typing import Dict, NamedTuple, Optional
+
+from flask import current_app
+
+from catalog import IngredientCatalog, get_catalog
+from utils import get_lists
+
+SPIRIT_CATEGORIES = [
+    "Absinthe",
+    "Aperitif",
+    "Bitters",
+    "Brandy",
+    "Cognac",
+    "Digestif",
+    "Fortified Wine",
+    "Gin",
+    "Liqueur",
+    "Mezcal",
+    "Rum",
+    "Tequila",
+    "Vermouth",
+    "Vodka",
+    "Whiskey",
+]
+
+_SPIRIT_KEYS = frozenset(s.lower() for s in SPIRIT_CATEGORIES)
+
+# How a recipe ingredient label is satisfied (stored in RecipeIngredients.ref_kind)
+REF_CATEGORY = "category"
+REF_SUB_CATEGORY = "sub_category"
+REF_INGREDIENT = "ingredient"
+REF_UNKNOWN = "unknown"
+
+
+class IngredientRef(NamedTuple):
+    label_key: str
+    ref_kind: str
+    ingredient_id: Optional[int]
+
+
+class Resolution:
+    """
+    Result of resolving a free-text ingredient label.
+
+    `category` is the canonical parent category (falls back to the label itself
+    when nothing matches), `sub_category` is empty when the label does not sit
+    under one, and `token_id` is a small integer unique per lowercase label.
+    """
+
+    __slots__ = ("label", "category", "sub_category", "is_spirit", "token_id", "ingredient_id")
+
+    def __init__(
+        self,
+        label: str,
+        category: str,
+        sub_category: str,
+        is_spirit: bool,
+        token_id: int,
+        ingredient_id: Optional[int] = None,
+    ):
+        self.label = label
+        self.category = category
+        self.sub_category = sub_category
+        self.is_spirit = is_spirit
+        self.token_id = token_id
+        self.ingredient_id = ingredient_id
+
+    def __repr__(self) -> str:
+        return (
+            f"Resolution({self.label!r}, category={self.category!r}, "
+            f"sub_category={self.sub_category!r}, is_spirit={self.is_spirit!r})"
+        )
+
+
+class IngredientResolver:
+    """
+    Ingredient -> category -> spirit resolution shared by helpers and routes.
+
+    Built from LISTS and the ingredient catalog; `key` records the generations
+    it was built from so get_resolver() can tell when it is out of date.
+    """
+
+    def __init__(self, lists: dict, catalog: IngredientCatalog):
+        self.key = (lists.get("_generation"), catalog.generation)
+        self._catalog = catalog
+        self._lock = threading.Lock()
+        self._memo: Dict[str, Resolution] = {}
+        self._tokens: Dict[str, int] = {}
+
+        # lowercase label -> canonical parent category
+        self._parent: Dict[str, str] = {}
+        # lowercase subcategory label -> display label
+        self._sub_labels: Dict[str, str] = {}
+        self._categories: set[str] = set()
+
+        for category, subs in lists.get("subcategories", {}).items():
+            self._parent[category.lower()] = category
+            self._categories.add(category.lower())
+            for sub in subs:
+                self._parent[sub.lower()] = category
+                self._sub_labels[sub.lower()] = sub
+        for category in lists.get("categories", []):
+            self._parent.setdefault(category.lower(), category)
+            self._categories.add(category.lower())
+
+        # Sub-categories used by ingredients but missing from LISTS still resolve
+        for ingredient in catalog:
+            if ingredient.sub_category:
+                key = ingredient.sub_category.lower()
+                self._sub_labels.setdefault(key, ingredient.sub_category)
+                self._parent.setdefault(key, self._parent.get(ingredient.category.lower(), ingredient.category))
+            if ingredient.category:
+                self._parent.setdefault(ingredient.category.lower(), ingredient.category)
+                self._categories.add(ingredient.category.lower())
+
+    def token(self, label: str) -> int:
+        """Return the integer token for a label, assigning one on first sight."""
+        key = (label or "").strip().lower()
+        token_id = self._tokens.get(key)
+        if token_id is None:
+            with self._lock:
+                token_id = self._tokens.setdefault(key, len(self._tokens))
+        return token_id
+
+    def resolve(self, label: str) -> Resolution:
+        raw = (label or "").strip()
+        key = raw.lower()
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        ingredient = self._catalog.find(key)
+        if ingredient is not None:
+            sub_category = ingredient.sub_category
+            category = ""
+            if sub_category:
+                category = self._parent.get(sub_category.lower(), "")
+            if not category:
+                category = self._parent.get(ingredient.category.lower(), ingredient.category)
+            flags = (category, ingredient.category, sub_category)
+            ingredient_id = ingredient.id
+        else:
+            sub_category = self._sub_labels.get(key, "")
+            category = self._parent.get(key, raw)
+            flags = (category, raw)
+            ingredient_id = None
+
+        resolution = Resolution(
+            raw,
+            category,
+            sub_category,
+            any((value or "").lower() in _SPIRIT_KEYS for value in flags),
+            self.token(key),
+            ingredient_id,
+        )
+        self._memo[key] = resolution
+        return resolution
+
+    def is_spirit(self, label: str) -> bool:
+        return self.resolve(label).is_spirit
+
+    def reference(self, label: str) -> IngredientRef:
+        """
+        Classify a recipe ingredient label for storage. A category or sub-category
+        is satisfied by any bottle under it, so it wins over an exact name match.
+        """
+        key = (label or "").strip().lower()
+        ingredient = self._catalog.find(key)
+        ingredient_id = ingredient.id if ingredient is not None else None
+        if key in self._categories:
+            kind = REF_CATEGORY
+        elif key in self._sub_labels:
+            kind = REF_SUB_CATEGORY
+        elif ingredient is not None:
+            kind = REF_INGREDIENT
+        else:
+            kind = REF_UNKNOWN
+        return IngredientRef(key, kind, ingredient_id)
+
+
+def get_resolver() -> IngredientResolver:
+    """
+    Return the shared resolver, rebuilding it only when LISTS or the catalog changed.
+    """
+    lists = get_lists()
+    catalog = get_catalog()
+    resolver = current_app.config.get("RESOLVER")
+    if resolver is None or resolver.key != (lists.get("_generation"), catalog.generation):
+        resolver = IngredientResolver(lists, catalog)
+        current_app.config["RESOLVER"] = resolver
+    return resolver
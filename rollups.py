@@ -0,0 +1,129 @@
+"""
+Purchase history reads for /prices.
+
+The purchase list is keyset-paginated on (purchase_date, id), newest first,
+so a page costs an index range scan however long the history gets. Summaries
+read purchase_rollups, which triggers keep per ingredient, location and month
+(migrations/m0008), so they cost O(ingredients x months), not O(purchases).
+"""
+
+from typing import List, Optional, Tuple
+
+from units import UNIT_TO_ML
+
+GROUPINGS = ("ingredient", "location", "month")
+
+_COLUMNS = {"ingredient_id": "r.ingredient_id", "ingredient_name": "pi.name", "location": "r.location", "month": "r.month"}
+
+# (purchase_date, id) of the last row on the previous page
+Cursor = Tuple[str, int]
+
+
+def parse_cursor(raw: Optional[str]) -> Optional[Cursor]:
+    """'2026-10-01:42' -> ('2026-10-01', 42); None when absent or malformed."""
+    purchase_date, _, purchase_id = (raw or "").rpartition(":")
+    if not purchase_date or not purchase_id.isdigit():
+        return None
+    return purchase_date, int(purchase_id)
+
+
+def format_cursor(row) -> str:
+    return f"{row['purchase_date']}:{row['id']}"
+
+
+def purchase_page(
+    conn,
+    cursor: Optional[Cursor] = None,
+    limit: int = 50,
+    ingredient_id: Optional[int] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of purchases older than `cursor`, plus the cursor for the next page (None on the last)."""
+    where, params = [], []
+    if cursor is not None:
+        where.append("(ip.purchase_date, ip.id) < (%s, %s)")
+        params.extend(cursor)
+    if ingredient_id is not None:
+        where.append("ip.ingredient_id = %s")
+        params.append(ingredient_id)
+    rows = conn.execute(
+        f"""
+        SELECT ip.id, ip.ingredient_id, pi.name AS ingredient_name, ip.purchase_date, ip.location,
+               ip.size_value, ip.size_unit, ip.size_ml, ip.price, ip.notes
+        FROM IngredientPurchases ip
+        JOIN PossibleIngredients pi ON pi.id = ip.ingredient_id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY ip.purchase_date DESC, ip.id DESC
+        LIMIT %s
+        """,
+        (*params, limit + 1),
+    ).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], format_cursor(rows[limit - 1])
+    return rows, None
+
+
+def _summary_row(row, keys) -> dict:
+    priced = row["priced"]
+    avg_per_ml = row["price_per_ml_sum"] / priced if priced else None
+    min_per_ml = row["min_price_per_ml"]
+    summary = {key: row[key] for key in keys}
+    summary.update(
+        {
+            "purchases": row["purchases"],
+            "total_spend": round(row["total_spend"], 2),
+            "avg_price_per_ml": avg_per_ml,
+            "min_price_per_ml": min_per_ml,
+            "avg_price_per_oz": avg_per_ml * UNIT_TO_ML["oz"] if avg_per_ml is not None else None,
+            "min_price_per_oz": min_per_ml * UNIT_TO_ML["oz"] if min_per_ml is not None else None,
+            "first_month": row["first_month"],
+            "last_month": row["last_month"],
+        }
+    )
+    return summary
+
+
+def purchase_summary(
+    conn,
+    by: str = "ingredient",
+    ingredient_id: Optional[int] = None,
+    location: Optional[str] = None,
+) -> List[dict]:
+    """
+    Rollup totals grouped by ingredient, by location, or one row per
+    ingredient/location/month ("month"), optionally filtered.
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping {by!r}.")
+    where, params = [], []
+    if ingredient_id is not None:
+        where.append("r.ingredient_id = %s")
+        params.append(ingredient_id)
+    if location is not None:
+        where.append("r.location = %s")
+        params.append(location)
+    keys = {
+        "ingredient": ("ingredient_id", "ingredient_name"),
+        "location": ("location",),
+        "month": ("ingredient_id", "ingredient_name", "location", "month"),
+    }[by]
+    group = ", ".join(_COLUMNS[key] for key in keys)
+    order = {"ingredient": "lower(pi.name)", "location": "r.location", "month": "r.month DESC, lower(pi.name), r.location"}[by]
+    rows = conn.execute(
+        f"""
+        SELECT {", ".join(f"{_COLUMNS[key]} AS {key}" for key in keys)},
+               sum(r.purchases)::int AS purchases,
+               sum(r.total_spend) AS total_spend,
+               sum(r.priced)::int AS priced,
+               sum(r.price_per_ml_sum) AS price_per_ml_sum,
+               min(r.min_price_per_ml) AS min_price_per_ml,
+               min(r.month) AS first_month,
+               max(r.month) AS last_month
+        FROM purchase_rollups r
+        JOIN PossibleIngredients pi ON pi.id = r.ingredient_id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        GROUP BY {group}
+        ORDER BY {order}
+        """,
+        params,
+    ).fetchall()
+    return [_summary_row(row, keys) for row in rows]
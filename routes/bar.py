@@ -8,35 +8,24 @@ from flask import (
     flash,
     current_app,
 )
-from utils import get_db_connection, load_lists, close_db_connection
+from utils import get_db_connection, get_lists, close_db_connection, read_only
+from catalog import get_catalog
+from resolver import get_resolver
+from events import broker, makeable_drinks, publish_availability_delta
+from memo import invalidate
 
 bar_bp = Blueprint('bar', __name__, template_folder='../templates')
 
 
-def _get_lists():
-    """Ensure the latest shared lists are available from the app config."""
-    cached = current_app.config.get('LISTS')
-    if not cached:
-        cached = load_lists()
-        current_app.config['LISTS'] = cached
-    return cached
-
 # Bar contents route
 @bar_bp.route('/bar', methods=['GET', 'POST'])
+@read_only
 def bar():
     conn = get_db_connection()
     try:
         if request.method == 'POST':
             submitted_name = (request.form.get('name') or '').strip()
-            existing = conn.execute(
-                """
-                SELECT name, in_bar
-                FROM possibleingredients
-                WHERE lower(name) = lower(%s)
-                LIMIT 1
-                """,
-                (submitted_name,),
-            ).fetchone()
+            existing = conn.run("bar.ingredient_by_name", (submitted_name,)).fetchone()
 
             if not existing:
                 flash(f'"{submitted_name}" not found in Possible Ingredients.', "error")
@@ -47,6 +36,7 @@ def bar():
                 flash(f"{canonical_name} already exists in your bar.", "info")
                 return redirect(url_for("bar.bar"))
 
+            makeable_before = makeable_drinks(conn)
             conn.execute(
                 """
                 UPDATE possibleingredients
@@ -56,41 +46,28 @@ def bar():
                 (submitted_name,),
             )
             conn.commit()
+            invalidate("bar")
+            record = get_catalog().set_in_bar(canonical_name, True)
+            broker.publish("bar", {"action": "added", "ingredient": record.to_dict() if record else {"name": canonical_name}})
+            publish_availability_delta(conn, makeable_before)
             flash(f"{canonical_name} added successfully to your bar.", "success")
 
             return redirect(url_for("bar.bar"))
             
-        # Define spirit categories (based on your subcategories and context)
-        spirit_categories = [
-            'Absinthe', 'Aperitif', 'Bitters', 'Brandy', 'Cognac', 'Gin', 'Liqueur', 'Mezcal', 'Rum', 'Tequila', 'Vermouth', 'Vodka', 'Whiskey',
-            'Digestif', 'Fortified Wine'
-        ]
-
         # Fetch bar contents and possible ingredients
-        bar_contents_rows = conn.execute(
-            """
-            SELECT name, category, sub_category
-            FROM possibleingredients
-            WHERE in_bar = TRUE
-            ORDER BY category, name
-            """
-        ).fetchall()
+        bar_contents_rows = conn.run("bar.contents").fetchall()
         bar_contents = [dict(row) for row in bar_contents_rows]
         
         # Tag each item with 'type': 'spirit' or 'modifier'
-        lists = _get_lists()
+        lists = get_lists()
+        resolver = get_resolver()
         for item in bar_contents:
-            is_spirit = (
-                item['category'] in spirit_categories or 
-                any(sub in spirit_categories for sub in lists['subcategories'].get(item['category'], []))
-            )
-            item['type'] = 'spirit' if is_spirit else 'modifier'
+            item['type'] = 'spirit' if resolver.is_spirit(item['name']) else 'modifier'
 
-        # Fetch possible names for the dropdown
-        possible_names = conn.execute('SELECT DISTINCT name FROM possibleingredients ORDER BY name').fetchall()
-        possible_names = [row['name'] for row in possible_names]
+        # Possible names for the dropdown
+        possible_names = get_catalog().names()
         
-        return render_template('bar.html', items=bar_contents, possible_names=possible_names, lists=lists)
+        return render_template('bar.html', items=bar_contents, possible_names=possible_names, lists=lists, live_events=True)
     finally:
         close_db_connection()
 
@@ -99,6 +76,7 @@ def bar():
 def delete_bar_item(name):
     conn = get_db_connection()
     try:
+        makeable_before = makeable_drinks(conn)
         cursor = conn.execute(
             """
             UPDATE possibleingredients
@@ -108,13 +86,94 @@ def delete_bar_item(name):
             (name,),
         )
         conn.commit()
+        invalidate("bar")
 
         if cursor.rowcount == 0:
             return jsonify({"message": f'No item named "{name}" found'}), 404
 
+        record = get_catalog().set_in_bar(name, False)
+        broker.publish("bar", {"action": "removed", "ingredient": record.to_dict() if record else {"name": name}})
+        publish_availability_delta(conn, makeable_before)
+
         return jsonify({"message": f'{name} removed from bar'}), 200
     except Exception as e:
         conn.rollback()
         return jsonify({"message": f"Error removing item: {str(e)}"}), 500
     finally:
         close_db_connection()
+
+
+# Bulk add/remove: {"operations": [{"action": "add" | "remove", "name": "..."}, ...]}
+@bar_bp.route("/bulk", methods=["POST"])
+def bulk_update():
+    data = request.get_json(silent=True) or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"message": "Expected a non-empty 'operations' list."}), 400
+    max_ops = current_app.config.get("BAR_BULK_MAX_OPERATIONS", 500)
+    if len(operations) > max_ops:
+        return jsonify({"message": f"At most {max_ops} operations per request."}), 400
+
+    # Later operations on the same name win, like applying them one by one
+    wanted = {}
+    results = []
+    for op in operations:
+        action = (op.get("action") or "").strip().lower() if isinstance(op, dict) else ""
+        name = (op.get("name") or "").strip() if isinstance(op, dict) else ""
+        result = {"name": name, "action": action}
+        results.append(result)
+        if action not in ("add", "remove") or not name:
+            result["status"] = "invalid"
+            continue
+        wanted[name.lower()] = (action == "add", result)
+
+    conn = get_db_connection()
+    try:
+        makeable_before = makeable_drinks(conn, force=True)
+        rows = conn.run("bar.ingredients_by_names", (list(wanted),)).fetchall()
+        current = {row["name"].lower(): row for row in rows}
+
+        to_add = [key for key, (in_bar, _) in wanted.items() if in_bar and key in current and not current[key]["in_bar"]]
+        to_remove = [key for key, (in_bar, _) in wanted.items() if not in_bar and key in current and current[key]["in_bar"]]
+        if to_add:
+            conn.execute("UPDATE possibleingredients SET in_bar = TRUE WHERE lower(name) = ANY(%s)", (to_add,))
+        if to_remove:
+            conn.execute("UPDATE possibleingredients SET in_bar = FALSE WHERE lower(name) = ANY(%s)", (to_remove,))
+        conn.commit()
+        invalidate("bar")
+
+        catalog = get_catalog()
+        added, removed = [], []
+        for key, (in_bar, result) in wanted.items():
+            row = current.get(key)
+            if row is None:
+                result["status"] = "not_found"
+                continue
+            result["name"] = row["name"]
+            if row["in_bar"] == in_bar:
+                result["status"] = "unchanged"
+                continue
+            result["status"] = "added" if in_bar else "removed"
+            record = catalog.set_in_bar(row["name"], in_bar)
+            (added if in_bar else removed).append(record.to_dict() if record else {"name": row["name"]})
+        # Duplicate operations on one name report the final outcome only once
+        for result in results:
+            result.setdefault("status", "superseded")
+
+        if added or removed:
+            broker.publish("bar", {"action": "bulk", "added": added, "removed": removed})
+        availability = publish_availability_delta(conn, makeable_before)
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"message": f"Error updating bar: {str(e)}"}), 500
+    finally:
+        close_db_connection()
+
+    return jsonify(
+        {
+            "results": results,
+            "added": len(added),
+            "removed": len(removed),
+            "availability": availability,
+        }
+    )
@@ -1,5 +1,10 @@
-from flask import Blueprint, render_template, redirect, url_for
-from helpers import get_drinks_missing_one, get_drinks_with_replacements
+from flask import Blueprint, render_template, redirect, url_for, request, jsonify, current_app
+from helpers import get_drinks_missing_one, get_drinks_with_replacements, get_shopping_suggestions
+from utils import get_db_connection, close_db_connection, read_only
+from catalog import get_catalog
+from resolver import get_resolver
+from substitutions import get_substitution_graph
+from planner import plan_menu
 
 drink_maker_bp = Blueprint('drink_maker', __name__)
 
@@ -10,11 +15,63 @@ def drink_maker():
 
 # Drinks missing ingredients route
 @drink_maker_bp.route('/missing_one')
+@read_only
 def missing_one():
     missing_one = get_drinks_missing_one()
     return render_template('missing_one.html', missing_one=missing_one)
 
 @drink_maker_bp.route('/replacements')
+@read_only
 def replacements():
     drinks_with_replacements = get_drinks_with_replacements()
     return render_template('replacements.html', replacements=drinks_with_replacements)
+
+# Ranked stand-ins for one ingredient (JSON); ?owned=0 includes bottles not in the bar
+@drink_maker_bp.route('/substitutes')
+@read_only
+def substitutes():
+    ingredient = (request.args.get('ingredient') or '').strip()
+    if not ingredient:
+        return jsonify({"message": "Expected an 'ingredient' parameter."}), 400
+    limit = min(request.args.get('limit', 5, type=int), 50)
+    owned_only = request.args.get('owned', '1') != '0'
+
+    conn = get_db_connection()
+    try:
+        graph = get_substitution_graph(conn)
+    finally:
+        close_db_connection()
+    catalog = get_catalog()
+    owned = {ing.id for ing in catalog if ing.in_bar} if owned_only else None
+    subs = graph.substitutes(get_resolver(), ingredient, owned, limit)
+    for sub in subs:
+        record = catalog.get(sub['id'])
+        sub['in_bar'] = bool(record and record.in_bar)
+    return jsonify({"ingredient": ingredient, "substitutes": subs})
+
+# Missing-k explorer / shopping suggestions (JSON)
+@drink_maker_bp.route('/shopping')
+@read_only
+def shopping():
+    max_k = min(request.args.get('max_k', 3, type=int), 10)
+    budget = min(request.args.get('budget', 3, type=int), 20)
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    return jsonify(get_shopping_suggestions(max_k=max_k, budget=budget, limit=limit))
+
+# Event/menu planner (JSON): {"menu": [{"drink": "Negroni", "servings": 40}, ...]}
+@drink_maker_bp.route('/plan', methods=['POST'])
+def plan():
+    data = request.get_json(silent=True) or {}
+    menu = data.get('menu')
+    if not isinstance(menu, list) or not menu:
+        return jsonify({"message": "Expected a non-empty 'menu' list."}), 400
+    max_items = current_app.config.get('PLAN_MAX_ITEMS', 500)
+    if len(menu) > max_items:
+        return jsonify({"message": f"At most {max_items} menu items per request."}), 400
+
+    conn = get_db_connection()
+    try:
+        result = plan_menu(conn, menu, get_resolver(), get_catalog())
+    finally:
+        close_db_connection()
+    return jsonify(result)
@@ -1,94 +1,24 @@
-from collections import defaultdict
-import time
+from typing import Optional
 
 from flask import Blueprint, render_template, request, redirect, url_for, jsonify, current_app
 
-from utils import get_db_connection, load_lists, close_db_connection
-from helpers import get_drinks_can_make
+from utils import get_db_connection, get_lists, close_db_connection, read_only
+from helpers import build_recipe_payload, fetch_recipe_ingredients, get_drinks_can_make, map_spirit_ingredients
+from resolver import SPIRIT_CATEGORIES, get_resolver
+from normalization import insert_recipe_ingredient
+from events import broker, makeable_drinks, publish_availability_delta
+from memo import invalidate
+from similarity import get_similarity_index
+from jsonio import wants_columns
 
 recipes_bp = Blueprint("recipes", __name__)
 
-SPIRIT_CATEGORIES = [
-    "Absinthe",
-    "Aperitif",
-    "Bitters",
-    "Brandy",
-    "Cognac",
-    "Digestif",
-    "Fortified Wine",
-    "Gin",
-    "Liqueur",
-    "Mezcal",
-    "Rum",
-    "Tequila",
-    "Vermouth",
-    "Vodka",
-    "Whiskey",
-]
-
-
-def _get_lists():
-    """Fetch shared option lists from the application config, refreshing if needed."""
-    cached = current_app.config.get("LISTS")
-    if not cached:
-        cached = load_lists()
-        current_app.config["LISTS"] = cached
-    return cached
-
-
-def _build_category_lookup(lists_data: dict) -> dict:
-    """Map subcategory -> parent category, also keep category names."""
-    category_lookup = {}
-    subcategories = lists_data.get("subcategories", {})
-    for category, subs in subcategories.items():
-        category_lookup[category.lower()] = category
-        for sub in subs:
-            category_lookup[sub.lower()] = category
-    for category in lists_data.get("categories", []):
-        category_lookup.setdefault(category.lower(), category)
-    return category_lookup
-
-
-def _get_spirit_name_set(conn) -> set[str]:
-    """
-    Build a set of ingredient names that count as "spirits" for summary purposes.
-
-    This avoids doing expensive LOWER(name) joins for every recipe page load.
-    Cached in app.config["LISTS"]["_spirit_name_set"].
-    """
-    lists_data = _get_lists()
-    cached = lists_data.get("_spirit_name_set")
-    if cached is not None:
-        return cached
-
-    spirit_cats = {s.lower() for s in SPIRIT_CATEGORIES}
-
-    # Pull all possible ingredients once and filter in Python (fast enough and cached)
-    rows = conn.execute(
-        "SELECT name, category, sub_category FROM possibleingredients"
-    ).fetchall()
-
-    spirit_names: set[str] = set()
-    for r in rows:
-        name = (r.get("name") or "").strip()
-        if not name:
-            continue
-        cat = (r.get("category") or "").strip().lower()
-        sub = (r.get("sub_category") or "").strip().lower()
-        if cat in spirit_cats or sub in spirit_cats:
-            spirit_names.add(name.lower())
-
-    lists_data["_spirit_name_set"] = spirit_names
-    current_app.config["LISTS"] = lists_data
-    return spirit_names
-
-
 @recipes_bp.route("/recipe", methods=["GET", "POST"])
+@read_only
 def recipes():
-    lists_data = _get_lists()
+    lists_data = get_lists()
     conn = get_db_connection()
 
-    t_total = time.perf_counter()
     try:
         if request.method == "POST":
             form = request.form
@@ -111,10 +41,12 @@ def recipes():
             notes = (form.get("notes") or "").strip()
             base_spirit = (form.get("base_spirit") or "").strip()
 
-            conn.execute(
-                "INSERT INTO recipes (drink, glass, garnish, method, ice, notes, base_spirit) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            makeable_before = makeable_drinks(conn)
+            recipe_id = conn.execute(
+                "INSERT INTO recipes (drink, glass, garnish, method, ice, notes, base_spirit) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id",
                 (drink, glass, garnish, method, ice, notes, base_spirit),
-            )
+            ).fetchone()["id"]
+            resolver = get_resolver()
 
             i = 0
             while True:
@@ -139,125 +71,53 @@ def recipes():
                     )
                     return f"Bad Request: missing quantity/unit for ingredient row {i}", 400
 
-                conn.execute(
-                    "INSERT INTO recipeingredients (drink, ingredient, quantity, unit) VALUES (%s, %s, %s, %s)",
-                    (drink, ingredient, quantity, unit),
-                )
+                insert_recipe_ingredient(conn, recipe_id, drink, ingredient, quantity, unit, resolver)
                 i += 1
 
             conn.commit()
+            invalidate("recipes")
+            broker.publish("recipe", {"action": "saved", "id": recipe_id, "drink": drink})
+            publish_availability_delta(conn, makeable_before)
             return redirect(url_for("recipes.recipes"))
 
         # ---- GET (fast path) ----
-        category_lookup = _build_category_lookup(lists_data)
-        spirit_category_set = {s.lower() for s in SPIRIT_CATEGORIES}
-
-        # Cache spirit-name lookup set (lowercased names)
-        t0 = time.perf_counter()
-        spirit_name_set = _get_spirit_name_set(conn)
-        print(f"[PERF] build spirit_name_set (cached): {(time.perf_counter() - t0) * 1000:.0f} ms")
+        # Queries are timed as sql.<name> in /metrics; the whole request by _perf_log
+        resolver = get_resolver()
 
         # 1) Fetch recipe list
-        t0 = time.perf_counter()
-        raw_recipes = conn.execute(
-            """
-            SELECT
-            r.drink,
-            COALESCE(r.base_spirit, '') AS base_spirit
-            FROM recipes r
-            ORDER BY
-            CASE WHEN r.base_spirit IS NULL OR r.base_spirit = '' THEN 1 ELSE 0 END,
-            lower(r.base_spirit),
-            lower(r.drink)
-            """
-        ).fetchall()
-        print(f"[PERF] recipes list: {(time.perf_counter() - t0) * 1000:.0f} ms, rows={len(raw_recipes)}")
+        raw_recipes = conn.run("recipes.list").fetchall()
 
         # 2) Ingredient summary per drink
-        t0 = time.perf_counter()
-        ing_rows = conn.execute(
-            """
-            SELECT
-            drink,
-            COALESCE(
-                string_agg(
-                DISTINCT NULLIF(trim(ingredient), ''),
-                ' • '
-                ORDER BY NULLIF(trim(ingredient), '')
-                ),
-                ''
-            ) AS ingredient_summary
-            FROM recipeingredients
-            GROUP BY drink
-            """
-        ).fetchall()
-        ingredient_summary_by_drink = {r["drink"]: (r["ingredient_summary"] or "") for r in ing_rows}
-        print(f"[PERF] ingredients aggregate: {(time.perf_counter() - t0) * 1000:.0f} ms, rows={len(ing_rows)}")
+        ing_rows = conn.run("recipes.ingredient_summaries").fetchall()
+        ingredient_summary_by_id = {r["recipe_id"]: (r["ingredient_summary"] or "") for r in ing_rows}
 
         # 3) Spirit summary per drink
-        t0 = time.perf_counter()
-        ri_rows = conn.execute(
-            "SELECT drink, ingredient FROM recipeingredients ORDER BY id"
-        ).fetchall()
-        print(f"[PERF] recipeingredients scan: {(time.perf_counter() - t0) * 1000:.0f} ms, rows={len(ri_rows)}")
-
-        def _is_spirit_label(label: str) -> bool:
-            raw = (label or "").strip()
-            if not raw:
-                return False
-            lowered = raw.lower()
-
-            # direct match to a spirit category label
-            if lowered in spirit_category_set:
-                return True
-
-            # "bourbon" -> "whiskey" via category_lookup (subcategory -> parent category)
-            resolved = category_lookup.get(lowered, raw)
-            resolved_lower = (resolved or "").strip().lower()
-            return resolved_lower in spirit_category_set
-
-        spirits_by_drink = defaultdict(list)
-        seen_spirits = defaultdict(set)
-
-        for r in ri_rows:
-            drink = r["drink"]
-            ing = (r["ingredient"] or "").strip()
-            if not ing:
-                continue
-
-            lowered = ing.lower()
-
-            # Spirit if it's a known spirit NAME or a spirit category/subcategory label
-            if (lowered in spirit_name_set) or _is_spirit_label(ing):
-                if ing not in seen_spirits[drink]:
-                    spirits_by_drink[drink].append(ing)
-                    seen_spirits[drink].add(ing)
-
-        print(f"[PERF] spirit_summary build: {(time.perf_counter() - t0) * 1000:.0f} ms, rows={len(ri_rows)}")
+        spirits_by_drink = map_spirit_ingredients(conn)
+
         # 4) Availability ("can make")
-        t0 = time.perf_counter()
         can_make_entries = get_drinks_can_make()
-        can_make_set = {(entry.get("drink") or "").strip().lower() for entry in can_make_entries}
-        print(f"[PERF] get_drinks_can_make: {(time.perf_counter() - t0) * 1000:.0f} ms, rows={len(can_make_entries)}")
+        can_make_ids = {entry["id"] for entry in can_make_entries}
 
         # 5) Build view model
         all_recipes = []
         for row in raw_recipes:
+            recipe_id = row["id"]
             drink = row["drink"]
             base_spirit = (row["base_spirit"] or "").strip()
 
-            resolved_category = category_lookup.get(base_spirit.lower(), base_spirit or "Unknown")
+            resolved_category = resolver.resolve(base_spirit).category if base_spirit else "Unknown"
             resolved_category = (resolved_category or "Unknown").strip() or "Unknown"
 
-            is_makeable = (drink or "").strip().lower() in can_make_set
+            is_makeable = recipe_id in can_make_ids
 
             all_recipes.append(
                 {
+                    "id": recipe_id,
                     "drink": drink,
                     "base_spirit": base_spirit,
                     "base_spirit_category": resolved_category,
-                    "spirit_summary": " • ".join(spirits_by_drink.get(drink, [])),
-                    "ingredient_summary": (ingredient_summary_by_drink.get(drink) or "").strip(),
+                    "spirit_summary": " • ".join(spirits_by_drink.get(recipe_id, [])),
+                    "ingredient_summary": (ingredient_summary_by_id.get(recipe_id) or "").strip(),
 
                     # the template/JS expects this
                     "available": is_makeable,
@@ -276,8 +136,6 @@ def recipes():
             )
         )
 
-        print(f"[PERF] total /recipe/recipe: {(time.perf_counter() - t_total) * 1000:.0f} ms")
-
         return render_template(
             "recipes.html",
             all_recipes=all_recipes,
@@ -289,71 +147,92 @@ def recipes():
         close_db_connection()
 
 
-@recipes_bp.route("/<string:drink>", methods=["GET"])
-def get_recipe(drink):
+def _recipe_id_for(conn, drink: str) -> Optional[int]:
+    row = conn.run("recipes.id_by_drink", (drink,)).fetchone()
+    return row["id"] if row else None
+
+
+def _recipe_json(recipe_id: Optional[int]):
     conn = get_db_connection()
     try:
-        recipe = conn.execute("SELECT * FROM Recipes WHERE drink = %s", (drink,)).fetchone()
-        ingredients = conn.execute(
-            """
-            SELECT
-                ri.ingredient,
-                ri.quantity,
-                ri.unit,
-                COALESCE(pi.category, '') AS category,
-                COALESCE(pi.sub_category, '') AS sub_category
-            FROM recipeingredients AS ri
-            LEFT JOIN possibleingredients AS pi
-                ON LOWER(pi.name) = LOWER(ri.ingredient)
-            WHERE ri.drink = %s
-            ORDER BY ri.id
-            """,
-            (drink,),
-        ).fetchall()
+        recipe = None
+        if recipe_id is not None:
+            recipe = conn.run("recipes.by_id", (recipe_id,)).fetchone()
+        ingredients = fetch_recipe_ingredients(conn, [recipe_id]).get(recipe_id, []) if recipe else []
     finally:
         close_db_connection()
 
     if recipe:
-        recipe_data = {
-            "name": recipe["drink"],
-            "glass": recipe["glass"],
-            "garnish": recipe["garnish"],
-            "method": recipe["method"],
-            "ice": recipe["ice"],
-            "notes": recipe["notes"],
-            "base_spirit": recipe["base_spirit"],
-            "ingredients": [
-                {
-                    "ingredient": ing["ingredient"],
-                    "quantity": ing["quantity"],
-                    "unit": ing["unit"],
-                    "category": ing["category"],
-                    "sub_category": ing["sub_category"],
-                }
-                for ing in ingredients
-            ],
-        }
-        return jsonify(recipe_data)
+        return jsonify(build_recipe_payload(recipe, ingredients, columns=wants_columns()))
 
     return jsonify({"error": "Recipe not found"}), 404
 
 
-@recipes_bp.route("/delete_recipe/<string:drink>", methods=["DELETE"])
-def delete_recipe(drink):
+@recipes_bp.route("/id/<int:recipe_id>", methods=["GET"])
+@read_only
+def get_recipe_by_id(recipe_id):
+    return _recipe_json(recipe_id)
+
+
+@recipes_bp.route("/<string:drink>", methods=["GET"])
+@read_only
+def get_recipe(drink):
+    return _recipe_json(_recipe_id_for(get_db_connection(), drink))
+
+
+def _similar_json(recipe_id: Optional[int]):
     conn = get_db_connection()
     try:
-        conn.execute("DELETE FROM recipeingredients WHERE drink = %s", (drink,))
-        conn.execute("DELETE FROM recipes WHERE drink = %s", (drink,))
-        conn.commit()
+        index = get_similarity_index(conn) if recipe_id is not None else None
+    finally:
+        close_db_connection()
+
+    if index is None or recipe_id not in index:
+        return jsonify({"error": "Recipe not found"}), 404
+    limit = request.args.get("limit", type=int)
+    return jsonify({"id": recipe_id, "name": index.names[recipe_id], "similar": index.similar(recipe_id, limit)})
+
+
+@recipes_bp.route("/id/<int:recipe_id>/similar", methods=["GET"])
+@read_only
+def get_similar_by_id(recipe_id):
+    return _similar_json(recipe_id)
+
+
+@recipes_bp.route("/<string:drink>/similar", methods=["GET"])
+@read_only
+def get_similar(drink):
+    return _similar_json(_recipe_id_for(get_db_connection(), drink))
+
+
+def _delete_recipe(recipe_id: Optional[int]):
+    conn = get_db_connection()
+    try:
+        if recipe_id is not None:
+            makeable_before = makeable_drinks(conn)
+            # RecipeIngredients rows go with it (ON DELETE CASCADE)
+            deleted = conn.execute("DELETE FROM recipes WHERE id = %s RETURNING drink", (recipe_id,)).fetchone()
+            conn.commit()
+            invalidate("recipes")
+            if deleted:
+                broker.publish("recipe", {"action": "deleted", "id": recipe_id, "drink": deleted["drink"]})
+                publish_availability_delta(conn, makeable_before)
     finally:
         close_db_connection()
     return jsonify({"message": "Recipe deleted successfully"}), 200
 
 
-@recipes_bp.route("/edit_recipe/<drink>", methods=["POST"])
-def edit_recipe(drink):
-    data = request.get_json()
-    original_drink = data.get("original_drink")
+@recipes_bp.route("/delete_recipe/id/<int:recipe_id>", methods=["DELETE"])
+def delete_recipe_by_id(recipe_id):
+    return _delete_recipe(recipe_id)
+
+
+@recipes_bp.route("/delete_recipe/<string:drink>", methods=["DELETE"])
+def delete_recipe(drink):
+    return _delete_recipe(_recipe_id_for(get_db_connection(), drink))
+
+
+def _edit_recipe(recipe_id: Optional[int], data: dict):
     new_drink = data.get("drink")
     glass = data.get("glass")
     garnish = data.get("garnish")
@@ -363,45 +242,67 @@ def edit_recipe(drink):
     base_spirit = data.get("base_spirit")
     ingredients = data.get("ingredients", [])
 
-    if not original_drink or not new_drink:
+    if not new_drink:
+        close_db_connection()
         return jsonify({"success": False, "message": "Drink name is required."}), 400
 
     conn = get_db_connection()
     try:
-        conn.execute("DELETE FROM RecipeIngredients WHERE drink = %s", (original_drink,))
-
-        update_result = conn.execute(
-            """
-            UPDATE recipes
-            SET drink = %s, glass = %s, garnish = %s, method = %s, ice = %s, notes = %s, base_spirit = %s
-            WHERE drink = %s
-            """,
-            (
-                new_drink,
-                glass or None,
-                garnish or None,
-                method or None,
-                ice or None,
-                notes or None,
-                base_spirit,
-                original_drink,
-            ),
-        )
-        if getattr(update_result, "rowcount", 0) == 0:
+        makeable_before = makeable_drinks(conn)
+        updated = None
+        if recipe_id is not None:
+            updated = conn.execute(
+                """
+                UPDATE recipes
+                SET drink = %s, glass = %s, garnish = %s, method = %s, ice = %s, notes = %s, base_spirit = %s
+                WHERE id = %s
+                RETURNING id
+                """,
+                (
+                    new_drink,
+                    glass or None,
+                    garnish or None,
+                    method or None,
+                    ice or None,
+                    notes or None,
+                    base_spirit,
+                    recipe_id,
+                ),
+            ).fetchone()
+        if updated is None:
             conn.rollback()
             return jsonify({"success": False, "message": "Recipe not found."}), 404
 
-        target_drink = new_drink
-        for ingredient in ingredients:
-            conn.execute(
-                "INSERT INTO recipeingredients (drink, ingredient, quantity, unit) VALUES (%s, %s, %s, %s)",
-                (target_drink, ingredient["ingredient"], ingredient["quantity"], ingredient["unit"]),
-            )
+        # Ingredients hang off recipe_id, so a rename alone touches no ingredient rows
+        current = conn.run("recipes.current_ingredients", (recipe_id,)).fetchall()
+        wanted = [(ing["ingredient"], ing["quantity"], ing["unit"]) for ing in ingredients]
+        if [(row["ingredient"], row["quantity"], row["unit"]) for row in current] != wanted:
+            conn.execute("DELETE FROM recipeingredients WHERE recipe_id = %s", (recipe_id,))
+            resolver = get_resolver()
+            for ingredient, quantity, unit in wanted:
+                insert_recipe_ingredient(conn, recipe_id, new_drink, ingredient, quantity, unit, resolver)
 
         conn.commit()
-        return jsonify({"success": True})
+        invalidate("recipes")
+        broker.publish("recipe", {"action": "saved", "id": recipe_id, "drink": new_drink})
+        publish_availability_delta(conn, makeable_before)
+        return jsonify({"success": True, "id": recipe_id})
     except Exception as e:
         conn.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
     finally:
         close_db_connection()
+
+
+@recipes_bp.route("/edit_recipe/id/<int:recipe_id>", methods=["POST"])
+def edit_recipe_by_id(recipe_id):
+    return _edit_recipe(recipe_id, request.get_json())
+
+
+@recipes_bp.route("/edit_recipe/<drink>", methods=["POST"])
+def edit_recipe(drink):
+    data = request.get_json()
+    original_drink = data.get("original_drink")
+    if not original_drink:
+        return jsonify({"success": False, "message": "Drink name is required."}), 400
+    return _edit_recipe(_recipe_id_for(get_db_connection(), original_drink), data)
@@ -0,0 +1,162 @@
+from flask import Blueprint, request, jsonify, current_app
+
+from utils import get_db_connection, close_db_connection, read_only
+from catalog import get_catalog
+from resolver import get_resolver
+from events import makeable_drinks, publish_availability_delta
+from jsonio import encode_records
+from memo import invalidate
+from stock import depletion, list_bottles, record_pours, recipe_pours, set_bottle_level
+from units import convert_to_ml, parse_float
+
+stock_bp = Blueprint('stock', __name__)
+
+
+# Remaining volume and projected run-out per tracked ingredient (JSON); ?low=1 for low stock only
+@stock_bp.route('', methods=['GET'])
+@read_only
+def stock_levels():
+    conn = get_db_connection()
+    try:
+        rows = depletion(
+            conn,
+            window_days=current_app.config.get('STOCK_RATE_WINDOW_DAYS', 30),
+            low_days=current_app.config.get('STOCK_LOW_DAYS', 14),
+        )
+    finally:
+        close_db_connection()
+    if request.args.get('low') == '1':
+        rows = [row for row in rows if row['low']]
+    return jsonify({"ingredients": encode_records(rows)})
+
+
+# Open bottles (JSON), optionally for one ingredient: ?ingredient_id=3
+@stock_bp.route('/bottles', methods=['GET'])
+@read_only
+def bottles():
+    conn = get_db_connection()
+    try:
+        rows = list_bottles(conn, request.args.get('ingredient_id', type=int))
+    finally:
+        close_db_connection()
+    return jsonify({"bottles": encode_records(rows)})
+
+
+# Log pours: {"pours": [{"drink" | "recipe_id", "servings"} | {"ingredient" | "ingredient_id", "ml"}]}
+@stock_bp.route('/pour', methods=['POST'])
+def pour():
+    data = request.get_json(silent=True) or {}
+    entries = data.get('pours')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"message": "Expected a non-empty 'pours' list."}), 400
+    max_pours = current_app.config.get('STOCK_MAX_POURS', 500)
+    if len(entries) > max_pours:
+        return jsonify({"message": f"At most {max_pours} pours per request."}), 400
+
+    catalog = get_catalog()
+    errors = []
+    servings_by_recipe = {}
+    drink_names = {}
+    direct = []
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            errors.append({"item": position, "error": "Expected an object."})
+            continue
+        if 'ml' in entry or 'quantity' in entry:
+            record = None
+            if isinstance(entry.get('ingredient_id'), int):
+                record = catalog.get(entry['ingredient_id'])
+            elif entry.get('ingredient'):
+                record = catalog.find(str(entry['ingredient']))
+            ml = parse_float(entry.get('ml'))
+            if ml is None and entry.get('quantity') is not None:
+                ml = convert_to_ml(parse_float(entry.get('quantity')), entry.get('unit') or 'oz')
+            if record is None:
+                errors.append({"item": position, "error": "Unknown ingredient."})
+            elif ml is None or ml <= 0:
+                errors.append({"item": position, "error": "Pour volume must be a positive number."})
+            else:
+                direct.append((record.id, None, ml))
+            continue
+        servings = entry.get('servings', 1)
+        if not isinstance(servings, int) or isinstance(servings, bool) or servings <= 0:
+            errors.append({"item": position, "error": "Servings must be a positive integer."})
+            continue
+        if isinstance(entry.get('recipe_id'), int):
+            servings_by_recipe[entry['recipe_id']] = servings_by_recipe.get(entry['recipe_id'], 0) + servings
+        elif (entry.get('drink') or '').strip():
+            drink_names.setdefault(entry['drink'].strip(), []).append((position, servings))
+        else:
+            errors.append({"item": position, "error": "Expected 'drink', 'recipe_id' or 'ingredient' with 'ml'."})
+
+    conn = get_db_connection()
+    try:
+        found = conn.execute(
+            "SELECT id, drink FROM recipes WHERE id = ANY(%s) OR drink = ANY(%s)",
+            (list(servings_by_recipe), list(drink_names)),
+        ).fetchall()
+        ids = {row['id'] for row in found}
+        by_name = {row['drink']: row['id'] for row in found}
+        for recipe_id in [recipe_id for recipe_id in servings_by_recipe if recipe_id not in ids]:
+            errors.append({"recipe_id": recipe_id, "error": "Recipe not found."})
+            del servings_by_recipe[recipe_id]
+        for drink, items in drink_names.items():
+            if drink not in by_name:
+                errors.extend({"item": position, "error": f'Recipe "{drink}" not found.'} for position, _ in items)
+                continue
+            for _, servings in items:
+                servings_by_recipe[by_name[drink]] = servings_by_recipe.get(by_name[drink], 0) + servings
+
+        makeable_before = makeable_drinks(conn)
+        pours, skipped = recipe_pours(conn, servings_by_recipe, get_resolver(), catalog) if servings_by_recipe else ([], [])
+        pours.extend(direct)
+        overdrawn = record_pours(conn, pours)
+        conn.commit()
+        invalidate("stock")
+
+        availability = publish_availability_delta(conn, makeable_before)
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"message": f"Error logging pours: {str(e)}"}), 500
+    finally:
+        close_db_connection()
+
+    return jsonify(
+        {
+            "poured": len(pours),
+            "volume_ml": round(sum(ml for _, _, ml in pours), 1),
+            "skipped": skipped,
+            "overdrawn": [{"id": ingredient_id, "ml": ml} for ingredient_id, ml in sorted(overdrawn.items())],
+            "errors": errors,
+            "availability": availability,
+        }
+    )
+
+
+# Correct a bottle after checking the shelf: {"remaining_ml": 350} or {"fraction": 0.5}
+@stock_bp.route('/bottle/<int:bottle_id>', methods=['POST'])
+def update_bottle(bottle_id):
+    data = request.get_json(silent=True) or {}
+    remaining_ml = parse_float(data.get('remaining_ml'))
+    fraction = parse_float(data.get('fraction'))
+    if remaining_ml is None and fraction is None:
+        return jsonify({"message": "Expected 'remaining_ml' or 'fraction'."}), 400
+
+    conn = get_db_connection()
+    try:
+        if remaining_ml is None:
+            size = conn.execute("SELECT size_ml FROM bottles WHERE id = %s", (bottle_id,)).fetchone()
+            if size is None:
+                return jsonify({"message": "Bottle not found."}), 404
+            remaining_ml = size['size_ml'] * min(1.0, max(0.0, fraction))
+        makeable_before = makeable_drinks(conn)
+        bottle = set_bottle_level(conn, bottle_id, remaining_ml)
+        if bottle is None:
+            conn.rollback()
+            return jsonify({"message": "Bottle not found."}), 404
+        conn.commit()
+        invalidate("stock")
+        publish_availability_delta(conn, makeable_before)
+    finally:
+        close_db_connection()
+    return jsonify(dict(bottle))
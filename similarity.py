@@ -0,0 +1,313 @@
+"""
+Recipe similarity ("drinks like this").
+
+Each recipe is a vector over resolved tokens: the bottle, sub-category or
+category a label resolves to, plus (at a lower weight) the bottle's own
+sub-category and category, so "Tanqueray" and "gin" still partly match.
+Unresolved labels count as themselves. Rows are L2-normalised, so a matrix
+product gives cosine similarity; each recipe's top-k neighbours are
+precomputed in blocks and cached per worker.
+
+The cached index follows change_log (migrations/m0005): recipes written since
+it was built are re-encoded and only the neighbour lists they can affect are
+recomputed. A resolver change (ingredient names/categories or LISTS) rebuilds
+it from scratch.
+"""
+
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+from metrics import metrics
+from resolver import REF_CATEGORY, REF_INGREDIENT, REF_SUB_CATEGORY, REF_UNKNOWN, IngredientResolver, get_resolver
+from units import convert_to_ml, parse_quantity
+from utils import get_db_connection
+from warmup import register_warmer
+
+# Weight of a bottle's sub-category/category relative to the bottle itself
+PARENT_WEIGHT = 0.5
+# Rows per matrix product when computing neighbour lists
+_BLOCK_ROWS = 256
+
+_lock = threading.Lock()
+
+Features = Dict[str, float]
+
+
+def _quantity_weight(quantity, unit) -> float:
+    """~1.0 for a 1 oz pour, growing with the square root of volume; 1.0 when unknown."""
+    amount = parse_quantity(quantity)
+    ml = convert_to_ml(amount, unit) if amount is not None else None
+    if not ml:
+        return 1.0
+    return min(2.0, max(0.25, math.sqrt(ml / 30.0)))
+
+
+def _label_features(resolver: IngredientResolver, label: str) -> List[Tuple[str, str, float]]:
+    """(token, display name, weight) for one recipe ingredient label."""
+    ref = resolver.reference(label)
+    if ref.ref_kind == REF_UNKNOWN:
+        return [(f"label:{ref.label_key}", label.strip(), 1.0)]
+
+    resolution = resolver.resolve(label)
+    if ref.ref_kind == REF_INGREDIENT:
+        features = [(f"bottle:{ref.ingredient_id}", label.strip(), 1.0)]
+        if resolution.sub_category:
+            features.append((f"sub:{resolution.sub_category.lower()}", resolution.sub_category, PARENT_WEIGHT))
+    elif ref.ref_kind == REF_SUB_CATEGORY:
+        features = [(f"sub:{ref.label_key}", label.strip(), 1.0)]
+    else:
+        features = [(f"cat:{ref.label_key}", label.strip(), 1.0)]
+    if ref.ref_kind != REF_CATEGORY and resolution.category and resolution.category.lower() != ref.label_key:
+        features.append((f"cat:{resolution.category.lower()}", resolution.category, PARENT_WEIGHT))
+    return features
+
+
+def _load_recipes(conn, ids: Optional[List[int]] = None) -> Dict[int, Tuple[str, List[dict]]]:
+    sql = """
+        SELECT r.id, r.drink, ri.ingredient, ri.quantity, ri.unit
+        FROM recipes r
+        LEFT JOIN recipeingredients ri
+          ON ri.recipe_id = r.id
+    """
+    if ids is None:
+        rows = conn.execute(f"{sql} ORDER BY r.id, ri.id").fetchall()
+    else:
+        rows = conn.execute(f"{sql} WHERE r.id = ANY(%s) ORDER BY r.id, ri.id", (ids,)).fetchall()
+    recipes: Dict[int, Tuple[str, List[dict]]] = {}
+    for row in rows:
+        entry = recipes.setdefault(row["id"], (row["drink"], []))
+        if row["ingredient"] and row["ingredient"].strip():
+            entry[1].append(row)
+    return recipes
+
+
+class SimilarityIndex:
+    """
+    Dense (recipes x tokens) matrix with cached top-k neighbours per recipe.
+    Deleted recipes leave a zeroed row that the next added recipe reuses.
+    Once published its recipes are never modified: updates go to a copy().
+    """
+
+    def __init__(self, resolver_key, top_k: int = 10, weight_quantities: bool = False):
+        self.resolver_key = resolver_key
+        self.top_k = top_k
+        self.weight_quantities = weight_quantities
+        self.version = 0
+        self.names: Dict[int, str] = {}
+        self._row_of: Dict[int, int] = {}
+        self._id_at: List[Optional[int]] = []
+        self._free: List[int] = []
+        self._columns: Dict[str, int] = {}
+        self._display: Dict[int, Dict[str, str]] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._neighbours: Dict[int, List[Tuple[int, float]]] = {}
+
+    def __contains__(self, recipe_id: int) -> bool:
+        return recipe_id in self._row_of
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def copy(self) -> "SimilarityIndex":
+        clone = SimilarityIndex(self.resolver_key, self.top_k, self.weight_quantities)
+        clone.version = self.version
+        clone.names = dict(self.names)
+        clone._row_of = dict(self._row_of)
+        clone._id_at = list(self._id_at)
+        clone._free = list(self._free)
+        clone._columns = dict(self._columns)
+        # Per-recipe display dicts and neighbour lists are replaced, never mutated
+        clone._display = dict(self._display)
+        clone._matrix = self._matrix.copy()
+        clone._neighbours = dict(self._neighbours)
+        return clone
+
+    def _encode(self, resolver: IngredientResolver, ingredients: Iterable[dict]) -> Tuple[Features, Dict[str, str]]:
+        weights: Features = defaultdict(float)
+        display: Dict[str, str] = {}
+        for row in ingredients:
+            scale = _quantity_weight(row["quantity"], row["unit"]) if self.weight_quantities else 1.0
+            for token, name, weight in _label_features(resolver, row["ingredient"]):
+                weights[token] += weight * scale
+                display.setdefault(token, name)
+        return weights, display
+
+    def _store(self, recipe_id: int, name: str, weights: Features, display: Dict[str, str]) -> None:
+        new_tokens = [token for token in weights if token not in self._columns]
+        for token in new_tokens:
+            self._columns[token] = len(self._columns)
+        row = self._row_of.get(recipe_id)
+        if row is None:
+            row = self._free.pop() if self._free else len(self._id_at)
+            if row == len(self._id_at):
+                self._id_at.append(None)
+        rows, cols = max(self._matrix.shape[0], len(self._id_at)), len(self._columns)
+        if (rows, cols) != self._matrix.shape:
+            grown = np.zeros((rows, cols), dtype=np.float32)
+            grown[: self._matrix.shape[0], : self._matrix.shape[1]] = self._matrix
+            self._matrix = grown
+
+        vector = np.zeros(cols, dtype=np.float32)
+        for token, weight in weights.items():
+            vector[self._columns[token]] = weight
+        norm = np.linalg.norm(vector)
+        self._matrix[row] = vector / norm if norm else vector
+        self._row_of[recipe_id] = row
+        self._id_at[row] = recipe_id
+        self.names[recipe_id] = name
+        self._display[recipe_id] = display
+
+    def _drop(self, recipe_id: int) -> None:
+        row = self._row_of.pop(recipe_id, None)
+        if row is None:
+            return
+        self._matrix[row] = 0
+        self._id_at[row] = None
+        self._free.append(row)
+        self.names.pop(recipe_id, None)
+        self._display.pop(recipe_id, None)
+        self._neighbours.pop(recipe_id, None)
+
+    def _compute_neighbours(self, recipe_ids: List[int]) -> None:
+        """Recompute top-k lists for the given recipes, _BLOCK_ROWS at a time."""
+        recipe_ids = [recipe_id for recipe_id in recipe_ids if recipe_id in self._row_of]
+        k = min(self.top_k, len(self._row_of) - 1)
+        for start in range(0, len(recipe_ids), _BLOCK_ROWS):
+            block_ids = recipe_ids[start : start + _BLOCK_ROWS]
+            rows = np.array([self._row_of[recipe_id] for recipe_id in block_ids])
+            scores = self._matrix[rows] @ self._matrix.T
+            scores[np.arange(len(rows)), rows] = -1.0
+            if k <= 0:
+                for recipe_id in block_ids:
+                    self._neighbours[recipe_id] = []
+                continue
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for i, recipe_id in enumerate(block_ids):
+                ranked = sorted(top[i], key=lambda col: -scores[i, col])
+                self._neighbours[recipe_id] = [
+                    (self._id_at[col], float(scores[i, col]))
+                    for col in ranked
+                    if scores[i, col] > 0 and self._id_at[col] is not None
+                ]
+
+    def load(self, conn, resolver: IngredientResolver, ids: Optional[List[int]] = None) -> None:
+        """(Re-)encode recipes from the database; ids=None loads everything."""
+        recipes = _load_recipes(conn, ids)
+        for recipe_id, (name, ingredients) in recipes.items():
+            self._store(recipe_id, name, *self._encode(resolver, ingredients))
+        if ids is None:
+            self._compute_neighbours(list(self._row_of))
+            return
+
+        removed = [recipe_id for recipe_id in ids if recipe_id not in recipes]
+        for recipe_id in removed:
+            self._drop(recipe_id)
+        changed = [recipe_id for recipe_id in ids if recipe_id in recipes]
+
+        # A changed recipe can enter another list (it now beats that list's last
+        # entry) or leave one it was in; only those lists are recomputed.
+        affected = set(changed)
+        stale = set(ids)
+        if changed:
+            changed_rows = np.array([self._row_of[recipe_id] for recipe_id in changed])
+            scores = self._matrix @ self._matrix[changed_rows].T
+            best = scores.max(axis=1)
+        for recipe_id, neighbours in self._neighbours.items():
+            if any(other in stale for other, _ in neighbours):
+                affected.add(recipe_id)
+            elif changed:
+                floor = neighbours[-1][1] if len(neighbours) >= self.top_k else 0.0
+                if best[self._row_of[recipe_id]] > floor:
+                    affected.add(recipe_id)
+        self._compute_neighbours(sorted(affected))
+
+    def similar(self, recipe_id: int, limit: Optional[int] = None) -> List[dict]:
+        mine = self._display.get(recipe_id, {})
+        result = []
+        for other, score in self._neighbours.get(recipe_id, [])[: limit or self.top_k]:
+            theirs = self._display.get(other, {})
+            result.append(
+                {
+                    "id": other,
+                    "name": self.names.get(other),
+                    "score": round(score, 4),
+                    "shared": sorted(mine[token] for token in mine if token in theirs),
+                }
+            )
+        return result
+
+
+def _log_state(conn, since: int) -> dict:
+    return conn.execute(
+        """
+        SELECT
+            (SELECT min(version) FROM change_log) AS oldest,
+            (SELECT COALESCE(max(version), 0) FROM change_log) AS latest,
+            ARRAY(
+                SELECT DISTINCT entity_id FROM change_log
+                WHERE entity = 'recipe' AND version > %s AND entity_id IS NOT NULL
+            ) AS changed
+        """,
+        (since,),
+    ).fetchone()
+
+
+def build_similarity_index(conn, resolver: IngredientResolver) -> SimilarityIndex:
+    t0 = time.perf_counter()
+    index = SimilarityIndex(
+        resolver.key,
+        top_k=current_app.config.get("SIMILARITY_TOP_K", 10),
+        weight_quantities=current_app.config.get("SIMILARITY_WEIGHT_QUANTITIES", False),
+    )
+    # Read the cursor first: anything written while we load is simply re-applied later
+    index.version = _log_state(conn, 0)["latest"]
+    index.load(conn, resolver)
+    metrics.observe("similarity.build", (time.perf_counter() - t0) * 1000)
+    return index
+
+
+def get_similarity_index(conn) -> SimilarityIndex:
+    """
+    Return the per-worker index, applying recipe changes logged since it was
+    built (one small query when nothing changed). Changes are applied to a copy
+    that replaces the cached index when done, so callers can keep reading the
+    index they got without holding _lock.
+    """
+    resolver = get_resolver()
+    with _lock:
+        index = current_app.config.get("SIMILARITY_INDEX")
+        if index is None or index.resolver_key != resolver.key:
+            index = build_similarity_index(conn, resolver)
+            current_app.config["SIMILARITY_INDEX"] = index
+            return index
+
+        state = _log_state(conn, index.version)
+        if state["oldest"] is not None and index.version < state["oldest"] - 1:
+            # Our cursor was pruned from the log; we can't tell what changed
+            index = build_similarity_index(conn, resolver)
+            current_app.config["SIMILARITY_INDEX"] = index
+        elif state["changed"]:
+            t0 = time.perf_counter()
+            index = index.copy()
+            index.load(conn, resolver, list(state["changed"]))
+            index.version = state["latest"]
+            metrics.observe("similarity.update", (time.perf_counter() - t0) * 1000)
+            current_app.config["SIMILARITY_INDEX"] = index
+        else:
+            index.version = max(index.version, state["latest"])
+        return index
+
+
+@register_warmer
+def _build_similarity_on_warmup() -> None:
+    conn = get_db_connection()
+    try:
+        get_similarity_index(conn)
+    finally:
+        conn.close()
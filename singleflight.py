@@ -0,0 +1,83 @@
+"""
+Request coalescing for expensive cache rebuilds.
+
+SingleFlight.do(key, fn): the first caller for a key runs fn; callers that
+arrive while it runs wait for its result (or exception) instead of repeating
+the same queries. SingleFlight.refresh(key, fn) runs fn on a background thread
+(inside an app context) unless a rebuild of that key is already running; it is
+for stale-while-revalidate callers that have an old value they can return now.
+
+Coalescing is per process: each worker still rebuilds once.
+"""
+
+import threading
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from flask import current_app, has_app_context
+
+from metrics import metrics
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def running(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.incr("singleflight.shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def refresh(self, key: Hashable, fn: Callable[[], Any]) -> bool:
+        """Rebuild `key` in the background; False when a rebuild is already running."""
+        if self.running(key):
+            return False
+        app = current_app._get_current_object() if has_app_context() else None
+
+        def run():
+            with app.app_context() if app is not None else nullcontext():
+                try:
+                    self.do(key, fn)
+                    metrics.incr("singleflight.refreshed")
+                except Exception as e:
+                    if app is not None:
+                        app.logger.warning("[CACHE] Background refresh of %s failed: %s", key, e)
+
+        threading.Thread(target=run, name=f"refresh-{key}", daemon=True).start()
+        return True
+
+
+flights = SingleFlight()
@@ -83,10 +83,37 @@
     }
   }
 
+  /**
+   * Subscribe to /events/stream and re-dispatch each server event on window as
+   * "homebar:<type>" (bar, recipe, availability, resync) for page scripts.
+   */
+  function initLiveEvents() {
+    if (!window.EventSource || document.body.dataset.liveEvents !== "1") {
+      return;
+    }
+
+    const source = new EventSource("/events/stream");
+    ["bar", "recipe", "availability", "resync"].forEach((type) => {
+      source.addEventListener(type, (event) => {
+        const detail = event.data ? JSON.parse(event.data) : {};
+        window.dispatchEvent(new CustomEvent(`homebar:${type}`, { detail }));
+      });
+    });
+
+    window.addEventListener("homebar:availability", (event) => {
+      const gained = event.detail.now_makeable || [];
+      if (gained.length) {
+        showToast(`Now makeable: ${gained.join(", ")}`, 5000);
+      }
+    });
+    window.addEventListener("pagehide", () => source.close());
+  }
+
   document.addEventListener("DOMContentLoaded", () => {
     initFlashToast();
     initViewportDebugger();
     initDesktopNavOffset();
+    initLiveEvents();
   });
 
   window.showToast = showToast;
@@ -747,6 +747,50 @@
     });
   }
 
+  function initLiveUpdates() {
+    // Changes made from another device: drop removed rows in place, reload for
+    // additions (rows are rendered server-side) unless a modal is in use.
+    window.addEventListener("homebar:bar", (event) => {
+      const detail = event.detail || {};
+      const added = detail.action === "bulk" ? detail.added || [] : [];
+      const removed = detail.action === "bulk" ? detail.removed || [] : [];
+      if (detail.action === "added" && detail.ingredient) {
+        added.push(detail.ingredient);
+      } else if (detail.action === "removed" && detail.ingredient) {
+        removed.push(detail.ingredient);
+      }
+
+      const rows = Array.from(document.querySelectorAll(".bar-row"));
+      const findRow = (name) =>
+        rows.find((candidate) => candidate.dataset.name.toLowerCase() === (name || "").toLowerCase());
+
+      const removedNames = removed.map((item) => item.name).filter((name) => {
+        const row = findRow(name);
+        row?.remove();
+        return Boolean(row);
+      });
+      if (removedNames.length) {
+        updateCategorySections();
+        window.showToast?.(`Removed from the bar: ${removedNames.join(", ")}`);
+      }
+
+      const addedNames = added.map((item) => item.name).filter((name) => name && !findRow(name));
+      if (addedNames.length) {
+        const modalOpen = ["add-modal", "new-ingredient-modal", "delete-modal"].some((id) =>
+          isModalOpen(getElement(id))
+        );
+        if (modalOpen) {
+          window.showToast?.(`Added to the bar: ${addedNames.join(", ")}`);
+        } else {
+          window.location.reload();
+        }
+      }
+    });
+    window.addEventListener("homebar:resync", () => {
+      window.showToast?.("Live updates were interrupted; refresh to see the latest bar.", 5000);
+    });
+  }
+
   function initFilterButtons() {
     document.querySelectorAll(".filter-btn").forEach((button) => {
       button.addEventListener("click", () => {
@@ -867,6 +911,7 @@
 
     highlightFilterButton(activeFilter);
     initDeleteModal();
+    initLiveUpdates();
     initFilterButtons();
     initTopFiltersToggle();
     initAccordion();
@@ -0,0 +1,249 @@
+"""
+Bottle-level stock: remaining volume per bottle, pours and depletion.
+
+An ingredient is tracked once it has any row in `bottles` (migrations/m0007
+seeds them from past purchases; each new purchase opens one through
+open_purchase_bottles). A tracked ingredient holds what its open bottles hold.
+Untracked ingredients keep the plain in_bar behaviour.
+"""
+
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from availability import Token, providers, recipe_row_token, serving_ml
+from catalog import IngredientCatalog
+from resolver import IngredientResolver
+from units import convert_to_ml
+
+# Anything under this is the dregs: the bottle counts as finished
+EMPTY_ML = 1.0
+
+# (ingredient id, recipe id or None, ml)
+Pour = Tuple[int, Optional[int], float]
+
+
+def next_purchase_id(conn) -> int:
+    """Lowest id the next purchases can get; pass it to open_purchase_bottles afterwards."""
+    return conn.execute("SELECT COALESCE(max(id), 0) + 1 AS id FROM IngredientPurchases").fetchone()["id"]
+
+
+def open_purchase_bottles(conn, min_purchase_id: int) -> int:
+    """Add a full bottle for each purchase from min_purchase_id on that has none yet; the caller commits."""
+    rows = conn.execute(
+        """
+        SELECT ip.id, ip.ingredient_id, ip.size_value, ip.size_unit
+        FROM IngredientPurchases ip
+        LEFT JOIN bottles b ON b.purchase_id = ip.id
+        WHERE ip.id >= %s AND b.id IS NULL
+        """,
+        (min_purchase_id,),
+    ).fetchall()
+    seeds = []
+    for row in rows:
+        size_ml = convert_to_ml(row["size_value"], row["size_unit"])
+        if size_ml:
+            seeds.append((row["ingredient_id"], row["id"], size_ml))
+    if not seeds:
+        return 0
+    ingredient_ids, purchase_ids, sizes = (list(column) for column in zip(*seeds))
+    cur = conn.execute(
+        """
+        INSERT INTO bottles (ingredient_id, purchase_id, size_ml, remaining_ml)
+        SELECT i, p, s, s FROM unnest(%s::int[], %s::int[], %s::float8[]) AS t(i, p, s)
+        ON CONFLICT (purchase_id) DO NOTHING
+        """,
+        (ingredient_ids, purchase_ids, sizes),
+    )
+    return cur.rowcount or 0
+
+
+def stock_levels(conn, ingredient_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """Ingredient id -> ml left in open bottles, for tracked ingredients only."""
+    sql = """
+        SELECT ingredient_id, COALESCE(sum(remaining_ml) FILTER (WHERE finished_at IS NULL), 0) AS remaining_ml
+        FROM bottles
+    """
+    if ingredient_ids is None:
+        rows = conn.execute(f"{sql} GROUP BY ingredient_id").fetchall()
+    else:
+        rows = conn.execute(f"{sql} WHERE ingredient_id = ANY(%s) GROUP BY ingredient_id", (list(ingredient_ids),)).fetchall()
+    return {row["ingredient_id"]: float(row["remaining_ml"]) for row in rows}
+
+
+def pour_source(token: Token, catalog: IngredientCatalog, levels: Dict[int, float]):
+    """The owned bottle a requirement is poured from: the fullest one (untracked counts as full)."""
+    owned = [record for record in providers(token, catalog) if record.in_bar]
+    if not owned:
+        return None
+    return max(owned, key=lambda record: (levels.get(record.id, math.inf), -record.id))
+
+
+def recipe_pours(
+    conn,
+    servings_by_recipe: Dict[int, int],
+    resolver: IngredientResolver,
+    catalog: IngredientCatalog,
+) -> Tuple[List[Pour], List[dict]]:
+    """Expand recipe servings into pours, plus the ingredients that could not be poured."""
+    rows = conn.execute(
+        """
+        SELECT recipe_id, ingredient, quantity, unit, label_key, ref_kind, possible_ingredient_id
+        FROM recipeingredients
+        WHERE recipe_id = ANY(%s)
+        ORDER BY recipe_id, id
+        """,
+        (list(servings_by_recipe),),
+    ).fetchall()
+    tokens = [(row, recipe_row_token(row, resolver)) for row in rows if (row["ingredient"] or "").strip()]
+    levels = stock_levels(conn, {record.id for _, token in tokens for record in providers(token, catalog)})
+
+    pours: List[Pour] = []
+    skipped: List[dict] = []
+    for row, token in tokens:
+        ml = serving_ml(row["quantity"], row["unit"])
+        if not ml:
+            continue
+        source = pour_source(token, catalog, levels)
+        if source is None:
+            skipped.append({"recipe_id": row["recipe_id"], "ingredient": row["ingredient"].strip(), "reason": "not in bar"})
+            continue
+        pours.append((source.id, row["recipe_id"], ml * servings_by_recipe[row["recipe_id"]]))
+    return pours, skipped
+
+
+def record_pours(conn, pours: List[Pour]) -> Dict[int, float]:
+    """
+    Log pours and deduct them from open bottles, already-opened ones first.
+    Three statements whatever the batch size; the caller commits. Returns ml
+    per ingredient poured beyond what its open bottles held.
+    """
+    if not pours:
+        return {}
+    ingredient_ids, recipe_ids, volumes = (list(column) for column in zip(*pours))
+    conn.execute(
+        """
+        INSERT INTO pours (ingredient_id, recipe_id, volume_ml)
+        SELECT * FROM unnest(%s::int[], %s::int[], %s::float8[])
+        """,
+        (ingredient_ids, recipe_ids, volumes),
+    )
+
+    wanted: Dict[int, float] = defaultdict(float)
+    for ingredient_id, _, ml in pours:
+        wanted[ingredient_id] += ml
+    bottles = conn.execute(
+        """
+        SELECT id, ingredient_id, remaining_ml
+        FROM bottles
+        WHERE finished_at IS NULL AND ingredient_id = ANY(%s)
+        ORDER BY ingredient_id, opened_at IS NULL, opened_at, id
+        FOR UPDATE
+        """,
+        (list(wanted),),
+    ).fetchall()
+
+    tracked = set()
+    updates = []
+    for bottle in bottles:
+        tracked.add(bottle["ingredient_id"])
+        need = wanted[bottle["ingredient_id"]]
+        if need <= 0:
+            continue
+        taken = min(need, bottle["remaining_ml"])
+        wanted[bottle["ingredient_id"]] = need - taken
+        remaining = bottle["remaining_ml"] - taken
+        updates.append((bottle["id"], max(0.0, remaining), remaining < EMPTY_ML))
+    if updates:
+        bottle_ids, remaining, finished = (list(column) for column in zip(*updates))
+        conn.execute(
+            """
+            UPDATE bottles AS b
+            SET remaining_ml = u.remaining_ml,
+                opened_at = COALESCE(b.opened_at, now()),
+                finished_at = CASE WHEN u.finished THEN now() END
+            FROM unnest(%s::int[], %s::float8[], %s::bool[]) AS u(id, remaining_ml, finished)
+            WHERE b.id = u.id
+            """,
+            (bottle_ids, remaining, finished),
+        )
+    return {ingredient_id: round(ml, 1) for ingredient_id, ml in wanted.items() if ingredient_id in tracked and ml > 0}
+
+
+def list_bottles(conn, ingredient_id: Optional[int] = None) -> List[dict]:
+    """Open bottles, with their ids for set_bottle_level."""
+    sql = """
+        SELECT b.id, b.ingredient_id, pi.name, b.size_ml, b.remaining_ml, b.opened_at, b.created_at
+        FROM bottles b
+        JOIN possibleingredients pi ON pi.id = b.ingredient_id
+        WHERE b.finished_at IS NULL
+    """
+    if ingredient_id is None:
+        rows = conn.execute(f"{sql} ORDER BY pi.name, b.id").fetchall()
+    else:
+        rows = conn.execute(f"{sql} AND b.ingredient_id = %s ORDER BY b.id", (ingredient_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def set_bottle_level(conn, bottle_id: int, remaining_ml: float) -> Optional[dict]:
+    """Correct a bottle after checking the shelf; the caller commits."""
+    return conn.execute(
+        """
+        UPDATE bottles
+        SET remaining_ml = LEAST(size_ml, GREATEST(0, %s)),
+            opened_at = CASE WHEN %s < size_ml THEN COALESCE(opened_at, now()) END,
+            finished_at = CASE WHEN %s < %s THEN COALESCE(finished_at, now()) END
+        WHERE id = %s
+        RETURNING id, ingredient_id, size_ml, remaining_ml, opened_at, finished_at
+        """,
+        (remaining_ml, remaining_ml, remaining_ml, EMPTY_ML, bottle_id),
+    ).fetchone()
+
+
+def depletion(conn, window_days: int = 30, low_days: int = 14) -> List[dict]:
+    """
+    Per tracked ingredient: open bottles, ml left, average daily pour over the
+    last window_days (or since the first pour, if more recent) and when it runs out.
+    """
+    rows = conn.execute(
+        """
+        SELECT pi.id, pi.name, pi.in_bar,
+               count(b.id) FILTER (WHERE b.finished_at IS NULL) AS open_bottles,
+               COALESCE(sum(b.remaining_ml) FILTER (WHERE b.finished_at IS NULL), 0) AS remaining_ml,
+               r.daily_ml
+        FROM bottles b
+        JOIN possibleingredients pi ON pi.id = b.ingredient_id
+        LEFT JOIN (
+            SELECT ingredient_id,
+                   sum(volume_ml) / GREATEST(1, LEAST(%s, extract(epoch FROM now() - min(poured_at)) / 86400)) AS daily_ml
+            FROM pours
+            WHERE poured_at > now() - make_interval(days => %s)
+            GROUP BY ingredient_id
+        ) r ON r.ingredient_id = pi.id
+        GROUP BY pi.id, pi.name, pi.in_bar, r.daily_ml
+        ORDER BY pi.name
+        """,
+        (window_days, window_days),
+    ).fetchall()
+
+    today = date.today()
+    result = []
+    for row in rows:
+        remaining = float(row["remaining_ml"])
+        daily = float(row["daily_ml"]) if row["daily_ml"] else None
+        days_left = remaining / daily if daily else None
+        result.append(
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "in_bar": row["in_bar"],
+                "open_bottles": row["open_bottles"],
+                "remaining_ml": round(remaining, 1),
+                "daily_ml": round(daily, 1) if daily else None,
+                "days_left": round(days_left, 1) if days_left is not None else None,
+                "empty_on": (today + timedelta(days=int(days_left))).isoformat() if days_left is not None else None,
+                "low": remaining < EMPTY_ML or (days_left is not None and days_left <= low_days),
+            }
+        )
+    return result
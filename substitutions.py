@@ -0,0 +1,256 @@
+"""
+Ingredient substitution graph.
+
+Nodes are bottles, sub-categories, categories and unresolved recipe labels.
+Edges carry a similarity in (0, 1]:
+
+- hierarchy: bottle - sub-category - category (and bottle - category);
+- context: two spirits (or two non-spirits) used with
+  the same other ingredients across recipes (cosine of their co-occurrence
+  profiles). Nodes that appear together in a recipe are complements, not
+  substitutes, and never get a context edge.
+
+A replacement's score is the product of edge weights along the best path,
+searched at most MAX_HOPS deep. The graph is built once per worker and rebuilt
+when the resolver changes (catalog names/categories or LISTS) or after
+SUBSTITUTION_MAX_AGE seconds, so recipe edits are picked up; bar contents are
+applied at lookup time, so adding a bottle never invalidates it.
+"""
+
+import heapq
+import time
+from collections import defaultdict
+from typing import Collection, Dict, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+from catalog import IngredientCatalog, get_catalog
+from metrics import metrics
+from resolver import REF_CATEGORY, REF_INGREDIENT, REF_SUB_CATEGORY, IngredientResolver, get_resolver
+from singleflight import flights
+from utils import get_db_connection
+from warmup import register_warmer
+
+BOTTLE_SUB_WEIGHT = 0.9
+SUB_CATEGORY_WEIGHT = 0.7
+BOTTLE_CATEGORY_WEIGHT = 0.6
+# Context edges are weighted CONTEXT_WEIGHT * cosine, and dropped below CONTEXT_MIN
+CONTEXT_WEIGHT = 0.8
+CONTEXT_MIN = 0.3
+# Nodes seen in fewer recipes than this have too little context to compare
+CONTEXT_MIN_RECIPES = 2
+MAX_HOPS = 4
+MIN_SCORE = 0.05
+
+# (bottle id, score, names of the nodes in between)
+Reachable = Tuple[int, float, List[str]]
+
+
+class SubstitutionGraph:
+    def __init__(self, resolver_key):
+        self.resolver_key = resolver_key
+        self.built_at = time.monotonic()
+        self._edges: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._names: Dict[str, str] = {}
+        self._spirit: Dict[str, bool] = {}
+        self._reachable: Dict[str, List[Reachable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _link(self, a: str, b: str, weight: float) -> None:
+        if a == b or weight <= 0:
+            return
+        if weight > self._edges[a].get(b, 0.0):
+            self._edges[a][b] = weight
+            self._edges[b][a] = weight
+
+    def _add(self, node: str, name: str) -> str:
+        self._names.setdefault(node, name)
+        return node
+
+    def _add_parents(self, resolver: IngredientResolver, node: str, label: str, weight_to_category: float) -> None:
+        resolution = resolver.resolve(label)
+        if resolution.category and resolution.category.lower() != label.strip().lower():
+            category = self._add(f"cat:{resolution.category.lower()}", resolution.category)
+            self._link(node, category, weight_to_category)
+
+    def node_for(self, resolver: IngredientResolver, label: str) -> str:
+        """Graph node for a recipe ingredient label (added, with its parents, when new)."""
+        ref = resolver.reference(label)
+        if ref.ref_kind == REF_INGREDIENT:
+            node = f"bottle:{ref.ingredient_id}"
+        elif ref.ref_kind == REF_SUB_CATEGORY:
+            node = f"sub:{ref.label_key}"
+        elif ref.ref_kind == REF_CATEGORY:
+            node = f"cat:{ref.label_key}"
+        else:
+            node = f"label:{ref.label_key}"
+        if node not in self._names:
+            self._add(node, label.strip())
+            self._spirit[node] = resolver.is_spirit(label)
+            if ref.ref_kind == REF_SUB_CATEGORY:
+                self._add_parents(resolver, node, label, SUB_CATEGORY_WEIGHT)
+        return node
+
+    def add_bottles(self, resolver: IngredientResolver, catalog: IngredientCatalog) -> None:
+        for ingredient in catalog:
+            node = self._add(f"bottle:{ingredient.id}", ingredient.name)
+            self._spirit[node] = resolver.is_spirit(ingredient.name)
+            sub_category = resolver.resolve(ingredient.name).sub_category
+            if sub_category:
+                sub = self._add(f"sub:{sub_category.lower()}", sub_category)
+                self._link(node, sub, BOTTLE_SUB_WEIGHT)
+                self._add_parents(resolver, sub, sub_category, SUB_CATEGORY_WEIGHT)
+            self._add_parents(resolver, node, ingredient.name, BOTTLE_CATEGORY_WEIGHT)
+
+    def add_context(self, recipes: List[Collection[str]]) -> int:
+        """Add context edges from each recipe's set of nodes; returns how many were added."""
+        counts: Dict[str, int] = defaultdict(int)
+        for recipe in recipes:
+            for node in recipe:
+                counts[node] += 1
+        nodes = sorted(counts)
+        if len(nodes) < 2:
+            return 0
+        column = {node: i for i, node in enumerate(nodes)}
+        incidence = np.zeros((len(recipes), len(nodes)), dtype=np.float32)
+        for row, recipe in enumerate(recipes):
+            incidence[row, [column[node] for node in recipe]] = 1.0
+
+        together = incidence.T @ incidence
+        np.fill_diagonal(together, 0.0)
+        norms = np.linalg.norm(together, axis=1)
+        norms[norms == 0] = 1.0
+        profiles = together / norms[:, None]
+        context = profiles @ profiles.T
+        context[together > 0] = 0.0
+        np.fill_diagonal(context, 0.0)
+
+        added = 0
+        for a, b in zip(*np.nonzero(np.triu(context) >= CONTEXT_MIN)):
+            if min(counts[nodes[a]], counts[nodes[b]]) < CONTEXT_MIN_RECIPES:
+                continue
+            if self._spirit.get(nodes[a]) != self._spirit.get(nodes[b]):
+                continue
+            self._link(nodes[a], nodes[b], CONTEXT_WEIGHT * float(context[a, b]))
+            added += 1
+        return added
+
+    def reachable(self, node: str) -> List[Reachable]:
+        """Bottles reachable from `node` within MAX_HOPS, best path first (memoised)."""
+        cached = self._reachable.get(node)
+        if cached is not None:
+            return cached
+
+        best = {node: 1.0}
+        previous: Dict[str, str] = {}
+        heap = [(-1.0, 0, node)]
+        found: List[Reachable] = []
+        done = set()
+        while heap:
+            negative, hops, current = heapq.heappop(heap)
+            if current in done:
+                continue
+            done.add(current)
+            score = -negative
+            if current != node and current.startswith("bottle:"):
+                path, step = [], previous[current]
+                while step != node:
+                    path.append(self._names[step])
+                    step = previous[step]
+                found.append((int(current.split(":", 1)[1]), score, path[::-1]))
+            if hops == MAX_HOPS:
+                continue
+            for neighbour, weight in self._edges.get(current, {}).items():
+                candidate = score * weight
+                if candidate >= MIN_SCORE and candidate > best.get(neighbour, 0.0):
+                    best[neighbour] = candidate
+                    previous[neighbour] = current
+                    heapq.heappush(heap, (-candidate, hops + 1, neighbour))
+
+        self._reachable[node] = found
+        return found
+
+    def substitutes(
+        self,
+        resolver: IngredientResolver,
+        label: str,
+        owned: Optional[Collection[int]] = None,
+        limit: int = 5,
+    ) -> List[dict]:
+        """Ranked stand-ins for `label`; restricted to bottles in `owned` unless it is None."""
+        node = self.node_for(resolver, label)
+        result = []
+        for bottle_id, score, via in self.reachable(node):
+            if owned is not None and bottle_id not in owned:
+                continue
+            result.append(
+                {
+                    "id": bottle_id,
+                    "name": self._names[f"bottle:{bottle_id}"],
+                    "score": round(score, 4),
+                    "via": via,
+                }
+            )
+            if len(result) >= limit:
+                break
+        return result
+
+
+def build_substitution_graph(conn, resolver: IngredientResolver, catalog: IngredientCatalog) -> SubstitutionGraph:
+    t0 = time.perf_counter()
+    graph = SubstitutionGraph(resolver.key)
+    graph.add_bottles(resolver, catalog)
+
+    rows = conn.execute(
+        "SELECT recipe_id, ingredient FROM recipeingredients WHERE recipe_id IS NOT NULL ORDER BY recipe_id"
+    ).fetchall()
+    recipes: Dict[int, set] = defaultdict(set)
+    for row in rows:
+        if row["ingredient"] and row["ingredient"].strip():
+            recipes[row["recipe_id"]].add(graph.node_for(resolver, row["ingredient"]))
+    graph.add_context(list(recipes.values()))
+
+    metrics.observe("substitutions.build", (time.perf_counter() - t0) * 1000)
+    return graph
+
+
+def _install_substitution_graph(conn, resolver: IngredientResolver) -> SubstitutionGraph:
+    graph = build_substitution_graph(conn, resolver, get_catalog())
+    current_app.config["SUBSTITUTION_GRAPH"] = graph
+    return graph
+
+
+def _refresh_substitution_graph() -> None:
+    conn = get_db_connection()
+    try:
+        _install_substitution_graph(conn, get_resolver())
+    finally:
+        conn.close()
+
+
+def get_substitution_graph(conn) -> SubstitutionGraph:
+    """
+    Return the per-worker graph, rebuilding it after catalog/LISTS changes
+    (one rebuild, shared by concurrent requests) or, once it is too old, in the
+    background while the current graph keeps answering.
+    """
+    resolver = get_resolver()
+    graph = current_app.config.get("SUBSTITUTION_GRAPH")
+    max_age = current_app.config.get("SUBSTITUTION_MAX_AGE", 300)
+    if graph is None or graph.resolver_key != resolver.key:
+        return flights.do(("substitutions", resolver.key), lambda: _install_substitution_graph(conn, resolver))
+    if max_age and time.monotonic() - graph.built_at > max_age:
+        flights.refresh(("substitutions", resolver.key), _refresh_substitution_graph)
+    return graph
+
+
+@register_warmer
+def _build_substitutions_on_warmup() -> None:
+    conn = get_db_connection()
+    try:
+        get_substitution_graph(conn)
+    finally:
+        conn.close()
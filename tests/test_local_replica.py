@@ -0,0 +1,115 @@
+from collections import namedtuple
+
+import pytest
+
+from local_replica import TABLES, LocalReplica, OfflineError
+
+Column = namedtuple("Column", "name type_code")
+
+COLUMNS = {
+    "recipes": ("id", "drink"),
+    "recipeingredients": ("id", "recipe_id", "ingredient"),
+    "possibleingredients": ("id", "name", "in_bar"),
+    "subcategories": ("id", "category_id", "name"),
+    "bottles": ("id", "ingredient_id", "remaining_ml"),
+}
+
+ROWS = {
+    "recipes": [(1, "Daiquiri"), (2, "Manhattan")],
+    "recipeingredients": [(10, 1, "Rum")],
+    "possibleingredients": [(5, "Rum", True)],
+    "bottles": [(7, 5, 700)],
+}
+
+
+class FakeCursor:
+    def __init__(self, table):
+        columns = COLUMNS.get(table, ("id", "name"))
+        # 16 is Postgres' bool type, which SQLite hands back as an int
+        self.description = [Column(name, 16 if name == "in_bar" else 25) for name in columns]
+        self.rows = [dict(zip(columns, row)) for row in ROWS.get(table, [])]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakePostgres:
+    """The DBConn calls LocalReplica.sync() makes."""
+
+    def __init__(self):
+        self.log = []
+
+    def execute(self, sql, params=()):
+        self.log.append(sql)
+        return FakeCursor(sql.rsplit(" ", 1)[-1])
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+@pytest.fixture
+def replica(tmp_path):
+    replica = LocalReplica()
+    replica.configure(str(tmp_path / "replica.sqlite3"))
+    return replica
+
+
+def test_sync_reads_one_snapshot(replica):
+    pg = FakePostgres()
+    assert replica.sync(pg)
+    assert pg.log[:2] == ["ROLLBACK", "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"]
+    assert pg.log[2:-1] == [f"SELECT * FROM {table}" for table in TABLES]
+    assert pg.log[-1] == "ROLLBACK"
+    assert replica.fresh()
+
+
+def test_synced_rows_keep_their_types(replica):
+    replica.sync(FakePostgres())
+    conn = replica.connect()
+    assert conn.run("recipes.by_id", (2,)).fetchone()["drink"] == "Manhattan"
+    assert conn.run("bar.ingredient_by_name", ("rum",)).fetchone() == {"name": "Rum", "in_bar": True}
+
+
+def test_offline_insert_gets_a_temporary_id(replica):
+    replica.sync(FakePostgres())
+    conn = replica.connect()
+    conn.execute("INSERT INTO recipes (drink) VALUES (%s)", ("Negroni",))
+    conn.execute("INSERT INTO recipes (drink) VALUES (%s)", ("Gimlet",))
+    conn.commit()
+
+    ids = {row["drink"]: row["id"] for row in conn.execute("SELECT id, drink FROM recipes").fetchall()}
+    assert ids == {"Daiquiri": 1, "Manhattan": 2, "Negroni": -1, "Gimlet": -2}
+    assert conn.run("recipes.by_id", (-1,)).fetchone()["drink"] == "Negroni"
+    assert replica.stats()["queued"] == 1
+
+
+def test_write_referring_to_a_temporary_id_is_refused(replica):
+    replica.sync(FakePostgres())
+    conn = replica.connect()
+    conn.execute("INSERT INTO recipes (drink) VALUES (%s)", ("Negroni",))
+    conn.commit()
+    with pytest.raises(OfflineError):
+        conn.execute("INSERT INTO recipeingredients (recipe_id, ingredient) VALUES (%s, %s)", (-1, "Gin"))
+    conn.rollback()
+    with pytest.raises(OfflineError):
+        conn.execute("DELETE FROM recipes WHERE id = ANY(%s)", ([2, -1],))
+    conn.rollback()
+    assert replica.stats()["queued"] == 1
+
+
+def test_negative_values_outside_id_columns_are_queued(replica):
+    replica.sync(FakePostgres())
+    conn = replica.connect()
+    conn.execute("UPDATE bottles SET remaining_ml = remaining_ml + %s WHERE id = %s", (-30, 7))
+    conn.commit()
+    assert conn.execute("SELECT remaining_ml FROM bottles WHERE id = %s", (7,)).fetchone()["remaining_ml"] == 670
+    assert replica.stats()["queued"] == 1
+
+
+def test_sync_waits_for_queued_writes(replica):
+    replica.sync(FakePostgres())
+    conn = replica.connect()
+    conn.execute("UPDATE possibleingredients SET in_bar = FALSE WHERE id = %s", (5,))
+    conn.commit()
+    assert not replica.sync(FakePostgres())
+    assert conn.run("bar.ingredient_by_name", ("rum",)).fetchone()["in_bar"] is False
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+from flask import Flask, g, has_request_context
+
+import helpers
+from memo import MemoryBackend, memo
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeIndex:
+    recipe_ids = [1]
+    drinks = ["Daiquiri"]
+    base_spirits = ["Rum"]
+
+    def missing_k(self, k):
+        return [0]
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    memo.configure(MemoryBackend(), ttl=300.0, stale_ttl=600.0)
+    yield app
+    memo.configure(MemoryBackend(), ttl=300.0, stale_ttl=600.0)
+
+
+def _wait_for_refreshes():
+    for thread in threading.enumerate():
+        if thread.name.startswith("refresh-"):
+            thread.join(5)
+
+
+def test_stale_refresh_closes_its_connection(app, monkeypatch):
+    opened = []
+
+    def get_db_connection():
+        # Like utils.get_db_connection: one connection per request, a new one outside
+        if has_request_context():
+            if "db_connection" not in g:
+                opened.append(FakeConn())
+                g.db_connection = opened[-1]
+            return g.db_connection
+        opened.append(FakeConn())
+        return opened[-1]
+
+    monkeypatch.setattr(helpers, "get_db_connection", get_db_connection)
+    monkeypatch.setattr(helpers, "load_availability", lambda conn: FakeIndex())
+
+    with app.test_request_context():
+        first = helpers.get_drinks_can_make()
+
+    # Expire the entry without invalidating it: the next call serves it stale
+    for key, (expires_at, versions, value) in list(memo.backend._data.items()):
+        memo.backend._data[key] = (time.time() - 1, versions, value)
+
+    with app.test_request_context():
+        assert helpers.get_drinks_can_make() == first
+    _wait_for_refreshes()
+
+    assert len(opened) == 2
+    assert all(conn.closed for conn in opened)
@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+from planner import _owned_ml, _pick_bottle
+
+
+def bottle(id, name, in_bar=True):
+    return SimpleNamespace(id=id, name=name, in_bar=in_bar)
+
+
+PRICES = {
+    1: {"bottle_ml": 700.0, "price": 28.0, "price_per_ml": 0.04},
+    2: {"bottle_ml": 1000.0, "price": 30.0, "price_per_ml": 0.03},
+    3: {"bottle_ml": 750.0, "price": 45.0, "price_per_ml": 0.06},
+}
+
+
+def test_owned_stock_sums_every_bottle_in_the_bar():
+    gins = [bottle(1, "Beefeater"), bottle(2, "Gordon's"), bottle(3, "Monkey 47", in_bar=False)]
+    # Beefeater is tracked at 200 ml; Gordon's is untracked and counts as one full bottle
+    assert _owned_ml(gins, PRICES, {1: 200.0}) == 1200.0
+
+
+def test_owned_stock_without_a_price_or_level_is_zero():
+    assert _owned_ml([bottle(9, "Mystery")], {}, {}) == 0.0
+
+
+def test_pick_bottle_prefers_the_fullest_owned_bottle():
+    gins = [bottle(1, "Beefeater"), bottle(2, "Gordon's"), bottle(3, "Monkey 47", in_bar=False)]
+    # An untracked bottle counts as its purchase size, not as bottomless
+    assert _pick_bottle(gins, PRICES, {1: 650.0}).id == 2
+    assert _pick_bottle(gins, PRICES, {2: 100.0}).id == 1
+
+
+def test_pick_bottle_falls_back_to_cheapest_unowned():
+    gins = [bottle(1, "Beefeater", in_bar=False), bottle(2, "Gordon's", in_bar=False)]
+    assert _pick_bottle(gins, PRICES, {}).id == 2
+    assert _pick_bottle([], PRICES, {}) is None
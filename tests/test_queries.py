@@ -0,0 +1,87 @@
+import json
+import sqlite3
+
+import pytest
+
+from local_replica import TABLES
+from queries import REGISTRY, Query, get_query, query, to_sqlite
+
+
+@pytest.fixture
+def scratch_names():
+    names = []
+    yield names
+    for name in names:
+        REGISTRY.pop(name, None)
+
+
+def test_get_query_returns_registered_query():
+    q = get_query("recipes.by_id")
+    assert isinstance(q, Query)
+    assert q.name == "recipes.by_id"
+    assert "%s" in q.sql
+
+
+def test_get_query_unknown_name():
+    with pytest.raises(ValueError, match="Unknown query"):
+        get_query("no.such.query")
+
+
+def test_duplicate_name_is_rejected(scratch_names):
+    scratch_names.append("test.duplicate")
+    query("test.duplicate", "SELECT 1")
+    with pytest.raises(ValueError, match="already registered"):
+        query("test.duplicate", "SELECT 2")
+    assert get_query("test.duplicate").sql == "SELECT 1"
+
+
+def test_local_queries_get_sqlite_text(scratch_names):
+    scratch_names.extend(["test.local", "test.explicit", "test.remote"])
+    assert query("test.local", "SELECT id FROM recipes WHERE id = %s", local=True).sqlite == (
+        "SELECT id FROM recipes WHERE id = ?"
+    )
+    assert query("test.explicit", "SELECT 1", local=True, sqlite="SELECT 2").sqlite == "SELECT 2"
+    assert query("test.remote", "SELECT 1").sqlite is None
+
+
+def test_to_sqlite_placeholders():
+    assert to_sqlite("SELECT * FROM recipes WHERE drink = %s AND id > %s") == (
+        "SELECT * FROM recipes WHERE drink = ? AND id > ?"
+    )
+
+
+def test_to_sqlite_any_becomes_json_each():
+    assert to_sqlite("SELECT * FROM recipeingredients WHERE recipe_id = ANY(%s)") == (
+        "SELECT * FROM recipeingredients WHERE recipe_id IN (SELECT value FROM json_each(?))"
+    )
+    assert to_sqlite("WHERE lower(name) =any(%s)") == "WHERE lower(name) IN (SELECT value FROM json_each(?))"
+
+
+def test_to_sqlite_strips_casts():
+    assert to_sqlite("SELECT id::text, ids::int[], 1::numeric FROM t") == "SELECT id, ids, 1 FROM t"
+
+
+def test_to_sqlite_unescapes_percent():
+    assert to_sqlite("SELECT * FROM t WHERE name LIKE 'a%%' AND id = %s") == (
+        "SELECT * FROM t WHERE name LIKE 'a%' AND id = ?"
+    )
+
+
+def test_registered_local_queries_run_on_sqlite():
+    db = sqlite3.connect(":memory:")
+    columns = {
+        "recipes": "id, drink, base_spirit, glass, garnish, method, ice, notes",
+        "recipeingredients": "id, recipe_id, ingredient, quantity, unit, label_key, ref_kind, possible_ingredient_id",
+        "possibleingredients": "id, name, category, sub_category, in_bar",
+        "categories": "id, name",
+        "subcategories": "id, name, category_id",
+        "bottles": "id, ingredient_id, remaining_ml, finished_at",
+    }
+    for table in TABLES:
+        db.execute(f"CREATE TABLE {table} ({columns.get(table, 'id, name')})")
+    for q in REGISTRY.values():
+        if q.sqlite is None:
+            continue
+        # A query takes either "= ANY(%s)" list parameters (passed as JSON) or scalars, never both
+        params = [json.dumps([1]) if "json_each" in q.sqlite else 1] * q.sqlite.count("?")
+        db.execute(q.sqlite, params).fetchall()
@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+
+import pytest
+from flask import Flask, session
+
+import utils
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConn:
+    """Stands in for both a psycopg connection and a DBConn."""
+
+    def __init__(self, role, replay_lsn=None):
+        self.role = role
+        self.replay_lsn = replay_lsn
+        self.statements = []
+        self.commits = 0
+        self.closed = False
+
+    def execute(self, sql, params=(), **kwargs):
+        self.statements.append(sql)
+        if "pg_last_wal_replay_lsn" in sql:
+            return FakeCursor({"lsn": self.replay_lsn})
+        if "pg_current_wal_lsn" in sql:
+            return FakeCursor({"lsn": "0/3000"})
+        return FakeCursor(None)
+
+    @contextmanager
+    def pipeline(self):
+        yield
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(utils, "_last_write_lsn", 0)
+    monkeypatch.setattr(utils, "_replica_replayed_lsn", 0)
+    monkeypatch.setattr(utils, "_replica_down_until", 0.0)
+    app = Flask(__name__)
+    app.secret_key = "test"
+    return app
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def install(replay_lsn):
+        def create_connection(role="primary"):
+            opened.append(FakeConn(role, replay_lsn if role == "replica" else None))
+            return opened[-1]
+
+        monkeypatch.setattr(utils, "_create_connection", create_connection)
+        return opened
+
+    return install
+
+
+def test_replica_behind_session_write_falls_back_to_primary(app, connections):
+    opened = connections("0/1000")
+    with app.test_request_context():
+        session[utils._SESSION_LSN_KEY] = "0/2000"
+        conn = utils._read_connection()
+        assert conn.role == "primary"
+        assert [c.role for c in opened] == ["replica", "primary"]
+        assert opened[0].closed
+        # Still waiting for the replica: the next read checks again
+        assert session[utils._SESSION_LSN_KEY] == "0/2000"
+
+
+def test_replica_caught_up_serves_the_read(app, connections):
+    opened = connections("0/2000")
+    with app.test_request_context():
+        session[utils._SESSION_LSN_KEY] = "0/2000"
+        conn = utils._read_connection()
+        assert conn.role == "replica"
+        assert len(opened) == 1
+        assert utils._SESSION_LSN_KEY not in session
+
+
+def test_standby_check_skipped_without_writes(app, connections):
+    opened = connections(None)
+    with app.test_request_context():
+        conn = utils._read_connection()
+        assert conn.role == "replica"
+        assert opened[0].statements == []
+
+
+def test_process_write_applies_to_other_sessions(app, connections, monkeypatch):
+    connections("0/1000")
+    monkeypatch.setattr(utils, "_last_write_lsn", utils._parse_lsn("0/2000"))
+    with app.test_request_context():
+        assert utils._read_connection().role == "primary"
+
+
+def test_parse_lsn_orders_positions():
+    assert utils._parse_lsn(None) == 0
+    assert utils._parse_lsn("0/FF") < utils._parse_lsn("1/0") < utils._parse_lsn("16/B374D848")
+
+
+def test_dirty_commit_records_lsn(app, monkeypatch):
+    monkeypatch.setenv("DATABASE_READ_URL", "postgresql://replica")
+    raw = FakeConn("primary")
+    conn = utils.DBConn(raw)
+    with app.test_request_context():
+        conn.execute("UPDATE possibleingredients SET in_bar = TRUE")
+        conn.commit()
+        assert session[utils._SESSION_LSN_KEY] == "0/3000"
+    assert raw.statements[-2:] == ["COMMIT", "SELECT pg_current_wal_lsn()::text AS lsn"]
+    assert utils._last_write_lsn == utils._parse_lsn("0/3000")
+
+
+def test_read_only_commit_skips_lsn(app, monkeypatch):
+    monkeypatch.setenv("DATABASE_READ_URL", "postgresql://replica")
+    raw = FakeConn("primary")
+    conn = utils.DBConn(raw)
+    with app.test_request_context():
+        conn.execute("SELECT 1")
+        conn.commit()
+        assert utils._SESSION_LSN_KEY not in session
+    assert raw.commits == 1
+    assert raw.statements == ["SELECT 1"]
@@ -0,0 +1,94 @@
+"""
+Unit normalization and number parsing shared by the purchase pages and bulk ingest.
+"""
+
+UNIT_TO_ML = {
+    "ml": 1.0,
+    "milliliter": 1.0,
+    "millilitre": 1.0,
+    "l": 1000.0,
+    "liter": 1000.0,
+    "litre": 1000.0,
+    "oz": 29.5735,
+    "fl oz": 29.5735,
+    "floz": 29.5735,
+    "fluid ounce": 29.5735,
+    "gal": 3785.41,
+    "gallon": 3785.41,
+    "qt": 946.353,
+    "quart": 946.353,
+    "pt": 473.176,
+    "pint": 473.176,
+    "cup": 236.588,
+    "tbsp": 14.7868,
+    "tablespoon": 14.7868,
+    "tsp": 4.92892,
+    "teaspoon": 4.92892,
+    "barspoon": 4.92892,
+    "dash": 0.92,
+    "dashes": 0.92,
+}
+
+_VULGAR_FRACTIONS = {"¼": 0.25, "½": 0.5, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3, "⅛": 0.125}
+
+
+def normalize_unit(unit: str) -> str:
+    u = (unit or "").strip().lower()
+    u = u.replace(".", "")
+    u = u.replace("fluid ounces", "fluid ounce")
+    u = u.replace("fluid ounce", "fl oz")
+    u = u.replace("fl oz", "fl oz")
+    u = u.replace("floz", "fl oz")
+    u = " ".join(u.split())
+    if u.endswith("s") and u[:-1] in UNIT_TO_ML:
+        u = u[:-1]
+    return u
+
+
+def convert_to_ml(value: float, unit: str) -> float | None:
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return None
+    factor = UNIT_TO_ML.get(normalize_unit(unit))
+    if not factor:
+        return None
+    return v * factor
+
+
+def parse_float(value) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_quantity(value) -> float | None:
+    """
+    Parse a recipe amount such as "2", "1.5", "3/4", "2 1/2" or "1½".
+    A range ("1-2") gives its midpoint; anything else (e.g. "top") gives None.
+    """
+    text = str(value or "").strip()
+    for glyph, amount in _VULGAR_FRACTIONS.items():
+        text = text.replace(glyph, f" {amount}")
+    if "-" in text:
+        bounds = [parse_quantity(part) for part in text.split("-", 1)]
+        if None in bounds:
+            return None
+        return sum(bounds) / 2
+    total = 0.0
+    parts = text.split()
+    if not parts:
+        return None
+    for part in parts:
+        try:
+            if "/" in part:
+                numerator, denominator = part.split("/", 1)
+                total += float(numerator) / float(denominator)
+            else:
+                total += float(part)
+        except (ValueError, ZeroDivisionError):
+            return None
+    return total
@@ -1,12 +1,68 @@
+import functools
+import itertools
 import os
-from typing import Optional, Any, Sequence, cast
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional, Any, Sequence, cast
 
-from flask import g, has_request_context
+from flask import Flask, current_app, g, has_app_context, has_request_context, request, session
 
 # Postgres driver (Neon)
 import psycopg
+from psycopg.pq import TransactionStatus
 from psycopg.rows import dict_row
 
+from local_replica import replica as local_replica
+from metrics import metrics
+from queries import Query, get_query
+from singleflight import flights
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:  # optional: without it every request opens its own connection
+    ConnectionPool = None
+
+
+# Stamped onto every load_lists() result so caches derived from LISTS can tell reloads apart.
+_LISTS_GENERATION = itertools.count(1)
+
+# monotonic time of the last connection handed to app code; the keepalive only
+# pings while this is recent, so an idle deployment is still allowed to suspend.
+_last_db_activity = 0.0
+
+_DB_DEFAULTS = {
+    "DB_CONNECT_TIMEOUT": 5,
+    "DB_CONNECT_RETRIES": 3,
+    "DB_CONNECT_BACKOFF": 0.25,
+    "DB_KEEPALIVE_INTERVAL": 0,
+    "DB_KEEPALIVE_IDLE_AFTER": 900,
+    "DB_POOL_SIZE": 0,
+    "DB_POOL_TIMEOUT": 10,
+    "DB_PREPARE": True,
+    "DB_READ_RETRY_AFTER": 30,
+}
+
+# One pool per role ("primary", "replica")
+_pools: Dict[str, Any] = {}
+_pool_lock = threading.Lock()
+
+# Highest WAL position this process has committed a write at (see DBConn.commit)
+_last_write_lsn = 0
+# Highest WAL position the replica has been seen to have replayed
+_replica_replayed_lsn = 0
+_lsn_lock = threading.Lock()
+# monotonic time before which reads skip a replica that just failed to connect
+_replica_down_until = 0.0
+
+# Pending post-write sync of the local replica (see _sync_local_replica_soon)
+_replica_sync_timer: Optional[threading.Timer] = None
+_replica_sync_lock = threading.Lock()
+
+# Session key holding the LSN of this session's latest write
+_SESSION_LSN_KEY = "db_write_lsn"
+
 
 class DBConn:
     """
@@ -14,44 +70,385 @@ class DBConn:
     can keep calling: conn.execute(sql, params), conn.commit(), conn.rollback(), conn.close()
     """
 
-    def __init__(self, conn: Any):
+    def __init__(self, conn: Any, pool: Optional[Any] = None, prepare: Optional[bool] = None, role: str = "primary"):
         self._conn = conn
+        self._pool = pool
+        self._prepare = prepare
+        self.role = role
+        # Set by anything but a plain SELECT since the last commit/rollback
+        self._dirty = False
 
     def execute(self, sql: str, params: Sequence[Any] = ()) -> Any:
+        if not self._dirty and sql.lstrip()[:6].upper() != "SELECT":
+            self._dirty = True
         return self._conn.execute(sql, params)
 
+    def run(self, query: "str | Query", params: Sequence[Any] = ()) -> Any:
+        """Execute a registered query (queries.py) by name, timed as sql.<name> (prepared on pooled connections)."""
+        if not isinstance(query, Query):
+            query = get_query(query)
+        t0 = time.perf_counter()
+        try:
+            return self._conn.execute(query.sql, params, prepare=self._prepare)
+        finally:
+            metrics.observe(f"sql.{query.name}", (time.perf_counter() - t0) * 1000)
+
+    @contextmanager
+    def copy(self, sql: str) -> Any:
+        """COPY ... FROM STDIN inside the current transaction; call write_row() on the result."""
+        self._dirty = True
+        with self._conn.cursor() as cur, cur.copy(sql) as copy:
+            yield copy
+
     def commit(self) -> None:
-        self._conn.commit()
+        if self._dirty and self.role == "primary" and os.environ.get("DATABASE_READ_URL"):
+            # COMMIT and read the WAL position it reached in a single round trip
+            with self._conn.pipeline():
+                self._conn.execute("COMMIT")
+                cur = self._conn.execute("SELECT pg_current_wal_lsn()::text AS lsn")
+            _note_write(cur.fetchone()["lsn"])
+        else:
+            self._conn.commit()
+        if self._dirty and self.role == "primary" and local_replica.enabled:
+            local_replica.mark_stale()
+            _sync_local_replica_soon()
+        self._dirty = False
 
     def rollback(self) -> None:
         self._conn.rollback()
+        self._dirty = False
 
     def close(self) -> None:
-        self._conn.close()
+        if self._pool is None:
+            self._conn.close()
+            return
+        status = self._conn.info.transaction_status
+        if status == TransactionStatus.INTRANS and not self._dirty:
+            # Only SELECTs ran: commit, because a rollback would also drop the statements
+            # prepared in this transaction
+            self._conn.commit()
+        elif status in (TransactionStatus.INTRANS, TransactionStatus.INERROR):
+            self._conn.rollback()
+        self._pool.putconn(self._conn)
 
 
-def _create_connection() -> DBConn:
+def _db_setting(name: str):
+    if has_app_context():
+        return current_app.config.get(name, _DB_DEFAULTS[name])
+    return _DB_DEFAULTS[name]
+
+
+def _connect_with_retry(dsn: str) -> Any:
     """
-    Create a Postgres (Neon) connection wrapped in DBConn.
+    Connect with a bounded timeout, retrying transient failures with jittered
+    exponential backoff. A suspended Neon compute usually answers on the 2nd try.
     """
-    dsn = os.environ.get("DATABASE_URL")
+    timeout = _db_setting("DB_CONNECT_TIMEOUT")
+    retries = max(0, int(_db_setting("DB_CONNECT_RETRIES")))
+    backoff = float(_db_setting("DB_CONNECT_BACKOFF"))
+
+    for attempt in range(retries + 1):
+        t0 = time.perf_counter()
+        try:
+            conn = psycopg.connect(dsn, connect_timeout=timeout)
+        except psycopg.OperationalError as e:
+            metrics.observe("db.connect.failed", (time.perf_counter() - t0) * 1000)
+            if attempt >= retries:
+                raise
+            # "Full jitter": spread retries from many workers hitting the same cold compute
+            delay = random.uniform(0, backoff * (2 ** attempt))
+            metrics.incr("db.connect.retries")
+            print(f"[DB] Connect attempt {attempt + 1} failed ({e}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        metrics.observe("db.connect", (time.perf_counter() - t0) * 1000)
+        return conn
+
+
+def _get_pool(dsn: str, role: str) -> Optional[Any]:
+    """
+    The per-process connection pool for `role`, created on first use when
+    psycopg_pool is installed and DB_POOL_SIZE > 0. Pooled connections keep
+    their prepared statements between requests.
+    """
+    size = int(_db_setting("DB_POOL_SIZE"))
+    if ConnectionPool is None or size <= 0 or not has_app_context():
+        return None
+    pool = _pools.get(role)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(role)
+            if pool is None:
+                pool = _pools[role] = ConnectionPool(
+                    dsn,
+                    min_size=1,
+                    max_size=size,
+                    kwargs={"connect_timeout": _db_setting("DB_CONNECT_TIMEOUT"), "row_factory": dict_row},
+                    check=ConnectionPool.check_connection,
+                    name=f"homebar-{role}",
+                )
+                print(f"[DB] Connection pool opened for {role} (max {size})")
+    return pool
+
+
+def _create_connection(role: str = "primary") -> DBConn:
+    """
+    Create a Postgres (Neon) connection wrapped in DBConn, from the pool when there is one.
+    role="replica" connects to DATABASE_READ_URL instead of DATABASE_URL.
+    """
+    global _last_db_activity
+    env = "DATABASE_READ_URL" if role == "replica" else "DATABASE_URL"
+    dsn = os.environ.get(env)
     if not dsn:
-        raise RuntimeError("DATABASE_URL is required for this Postgres-only app configuration.")
-    conn = cast(Any, psycopg.connect(dsn))
+        raise RuntimeError(f"{env} is required for this Postgres-only app configuration.")
+    prepare = bool(_db_setting("DB_PREPARE"))
+    pool = _get_pool(dsn, role)
+    if pool is not None:
+        t0 = time.perf_counter()
+        conn = pool.getconn(timeout=float(_db_setting("DB_POOL_TIMEOUT")))
+        metrics.observe("db.pool.wait", (time.perf_counter() - t0) * 1000)
+        _last_db_activity = time.monotonic()
+        return DBConn(conn, pool, prepare, role)
+    conn = cast(Any, _connect_with_retry(dsn))
     conn.row_factory = dict_row
-    print("[DB] Using POSTGRES via DATABASE_URL (Neon)")
-    return DBConn(conn)
+    _last_db_activity = time.monotonic()
+    print(f"[DB] Using POSTGRES via {env} (Neon)")
+    # Preparing costs a round trip of its own, which only pays off on a pooled connection
+    # that outlives the request; here psycopg decides (prepare_threshold)
+    return DBConn(conn, prepare=None if prepare else False, role=role)
+
+
+def _parse_lsn(lsn: Optional[str]) -> int:
+    """'16/B374D848' -> comparable int (0 for None)."""
+    if not lsn:
+        return 0
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def _note_write(lsn: str) -> None:
+    """Remember a committed write so reads in this process and session wait for the replica to replay it."""
+    global _last_write_lsn
+    position = _parse_lsn(lsn)
+    with _lsn_lock:
+        _last_write_lsn = max(_last_write_lsn, position)
+    if has_request_context():
+        session[_SESSION_LSN_KEY] = lsn
+
+
+def _replica_caught_up(conn: DBConn, required: int) -> bool:
+    """True when the replica has replayed WAL up to `required`; remembered so the check runs once per write."""
+    global _replica_replayed_lsn
+    if required <= _replica_replayed_lsn:
+        return True
+    replayed = _parse_lsn(conn.execute("SELECT pg_last_wal_replay_lsn()::text AS lsn").fetchone()["lsn"])
+    with _lsn_lock:
+        _replica_replayed_lsn = max(_replica_replayed_lsn, replayed)
+    # NULL (not a standby) never counts as caught up: it may be a different server altogether
+    return replayed >= required
+
+
+def _read_connection() -> DBConn:
+    """
+    A replica connection for a read-only request, or the primary when the
+    replica has not yet replayed this session's (or this process's) last write.
+    """
+    global _replica_down_until
+    if time.monotonic() < _replica_down_until:
+        metrics.incr("db.read.replica_down")
+        return _create_connection()
+    required = max(_last_write_lsn, _parse_lsn(session.get(_SESSION_LSN_KEY)))
+    try:
+        conn = _create_connection("replica")
+    except psycopg.OperationalError as e:
+        retry_after = float(_db_setting("DB_READ_RETRY_AFTER"))
+        _replica_down_until = time.monotonic() + retry_after
+        metrics.incr("db.read.replica_failed")
+        current_app.logger.warning("[DB] Read replica unavailable (%s); using primary for %.0fs", e, retry_after)
+        return _create_connection()
+    if required and not _replica_caught_up(conn, required):
+        conn.close()
+        metrics.incr("db.read.primary_fallback")
+        return _create_connection()
+    if _SESSION_LSN_KEY in session:
+        # The replica has this session's writes; later reads skip the check
+        session.pop(_SESSION_LSN_KEY)
+    metrics.incr("db.read.replica")
+    return conn
+
+
+def start_db_keepalive(app: Flask) -> Optional[threading.Thread]:
+    """
+    Ping the database every DB_KEEPALIVE_INTERVAL seconds while the app has seen
+    DB traffic within DB_KEEPALIVE_IDLE_AFTER seconds, so Neon does not suspend
+    between bursts of requests. Disabled when the interval is 0.
+    """
+    interval = app.config.get("DB_KEEPALIVE_INTERVAL", 0)
+    idle_after = app.config.get("DB_KEEPALIVE_IDLE_AFTER", _DB_DEFAULTS["DB_KEEPALIVE_IDLE_AFTER"])
+    dsn = os.environ.get("DATABASE_URL")
+    if not interval or not dsn:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            if time.monotonic() - _last_db_activity > idle_after:
+                continue
+            t0 = time.perf_counter()
+            try:
+                with psycopg.connect(dsn, connect_timeout=app.config.get("DB_CONNECT_TIMEOUT", 5)) as conn:
+                    conn.execute("SELECT 1")
+            except psycopg.Error as e:
+                metrics.incr("db.keepalive.failed")
+                app.logger.warning("[DB] Keepalive ping failed: %s", e)
+                continue
+            metrics.observe("db.keepalive", (time.perf_counter() - t0) * 1000)
+
+    thread = threading.Thread(target=run, name="db-keepalive", daemon=True)
+    thread.start()
+    return thread
+
+
+def read_only(view):
+    """
+    Mark a view as read-only: its GET/HEAD requests read from DATABASE_READ_URL
+    when one is configured (see get_db_connection). Other methods still use the primary.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = request.method in ("GET", "HEAD")
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def _postgres_connection(read_only: bool = False) -> DBConn:
+    if read_only and os.environ.get("DATABASE_READ_URL"):
+        return _read_connection()
+    return _create_connection()
+
+
+def _open_connection(read_only: bool = False) -> Any:
+    """
+    Postgres, or the local SQLite replica (local_replica.py) when it is enabled
+    and either Postgres is unreachable or a read-only request can be served from it.
+    """
+    if local_replica.enabled:
+        if local_replica.offline and local_replica.ready():
+            metrics.incr("db.local.offline")
+            return local_replica.connect()
+        if read_only and local_replica.fresh():
+            return local_replica.connect(fallback=lambda: _postgres_connection(read_only))
+    try:
+        return _postgres_connection(read_only)
+    except psycopg.OperationalError as e:
+        if not (local_replica.enabled and local_replica.ready()):
+            raise
+        local_replica.offline = True
+        print(f"[DB] Postgres unreachable ({e}); serving from the local replica and queueing writes")
+        return local_replica.connect()
 
 
 def get_db_connection() -> DBConn:
     """
     Return a DB connection, reusing the same connection within a request.
+
+    Requests to @read_only views go to the read replica (DATABASE_READ_URL) if
+    there is one, unless it has not replayed the session's latest write yet.
+    Everything else -- writes, background refreshes, scripts -- uses the primary.
+    With LOCAL_REPLICA on, see _open_connection().
     """
     if has_request_context():
         if "db_connection" not in g:
-            g.db_connection = _create_connection()
+            g.db_connection = _open_connection(bool(g.get("db_read_only")))
         return g.db_connection
-    return _create_connection()
+    return _open_connection()
+
+
+def sync_local_replica() -> bool:
+    """
+    Replay writes queued while offline, then refresh the local replica from
+    Postgres. False while Postgres is unreachable.
+    """
+    try:
+        conn = _create_connection()
+    except psycopg.OperationalError:
+        local_replica.offline = True
+        return False
+    try:
+        replayed = local_replica.replay(conn)
+        local_replica.sync(conn)
+    except psycopg.OperationalError:
+        local_replica.offline = True
+        return False
+    finally:
+        conn.close()
+    if local_replica.offline:
+        local_replica.offline = False
+        print(f"[DB] Postgres reachable again; replayed {replayed} queued write(s)")
+    return True
+
+
+def _sync_local_replica_soon(app: Optional[Flask] = None) -> None:
+    """
+    Sync the local replica LOCAL_REPLICA_WRITE_SYNC_DELAY seconds after a write,
+    once for every write in that window: a burst of writes costs one full copy,
+    not one each. Meanwhile the copy is stale, so reads go to Postgres.
+    """
+    global _replica_sync_timer
+    if app is None and has_app_context():
+        app = current_app._get_current_object()
+    with _replica_sync_lock:
+        if _replica_sync_timer is not None:
+            return
+        delay = app.config.get("LOCAL_REPLICA_WRITE_SYNC_DELAY", 5) if app is not None else 5
+        _replica_sync_timer = threading.Timer(delay, _run_scheduled_sync, (app,))
+        _replica_sync_timer.daemon = True
+        _replica_sync_timer.start()
+
+
+def _run_scheduled_sync(app: Optional[Flask]) -> None:
+    global _replica_sync_timer
+    with _replica_sync_lock:
+        # Writes from here on schedule the next sync
+        _replica_sync_timer = None
+    if flights.running("local-replica"):
+        # That sync may have read its snapshot before the writes we are here for
+        _sync_local_replica_soon(app)
+        return
+    with app.app_context() if app is not None else nullcontext():
+        try:
+            flights.do("local-replica", sync_local_replica)
+        except Exception as e:
+            if app is not None:
+                app.logger.warning("[DB] Local replica sync failed: %s", e)
+
+
+def start_local_replica_sync(app: Flask) -> Optional[threading.Thread]:
+    """
+    Keep the local SQLite replica current: sync now, then every
+    LOCAL_REPLICA_SYNC_INTERVAL seconds. Disabled unless LOCAL_REPLICA is on.
+    """
+    if not app.config.get("LOCAL_REPLICA"):
+        return None
+    local_replica.configure(
+        app.config.get("LOCAL_REPLICA_PATH") or os.path.join(app.instance_path, "replica.sqlite3")
+    )
+    interval = app.config.get("LOCAL_REPLICA_SYNC_INTERVAL", 30)
+
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    flights.do("local-replica", sync_local_replica)
+                except Exception as e:
+                    app.logger.warning("[DB] Local replica sync failed: %s", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="local-replica-sync", daemon=True)
+    thread.start()
+    return thread
 
 
 def close_db_connection(exception: Optional[BaseException] = None) -> None:
@@ -66,6 +463,10 @@ def close_db_connection(exception: Optional[BaseException] = None) -> None:
         conn.close()
 
 
+def next_lists_generation() -> int:
+    return next(_LISTS_GENERATION)
+
+
 def load_lists() -> dict:
     """
     Load reference lists from the database.
@@ -80,41 +481,48 @@ def load_lists() -> dict:
         "methods": [],
         "ice_options": [],
         "units": [],
+        "_generation": next_lists_generation(),
     }
 
     try:
-        categories = conn.execute("SELECT name FROM Categories ORDER BY name").fetchall()
+        categories = conn.run("lists.categories").fetchall()
         lists["categories"] = [row["name"] for row in categories]
 
         for cat in lists["categories"]:
-            cursor = conn.execute("SELECT id FROM Categories WHERE name = %s", (cat,))
+            cursor = conn.run("lists.category_id", (cat,))
             cat_row = cursor.fetchone()
             if not cat_row:
                 lists["subcategories"][cat] = []
                 continue
             cat_id = cat_row["id"]
-            subcategories = conn.execute(
-                "SELECT name FROM Subcategories WHERE category_id = %s ORDER BY name",
-                (cat_id,),
-            ).fetchall()
+            subcategories = conn.run("lists.subcategories", (cat_id,)).fetchall()
             lists["subcategories"][cat] = [row["name"] for row in subcategories]
 
-        glass_types = conn.execute("SELECT name FROM GlassTypes ORDER BY name").fetchall()
+        glass_types = conn.run("lists.glass_types").fetchall()
         lists["glass_types"] = [row["name"] for row in glass_types]
 
-        methods = conn.execute("SELECT name FROM Methods ORDER BY name").fetchall()
+        methods = conn.run("lists.methods").fetchall()
         lists["methods"] = [row["name"] for row in methods]
 
-        ice_options = conn.execute("SELECT name FROM IceOptions ORDER BY name").fetchall()
+        ice_options = conn.run("lists.ice_options").fetchall()
         lists["ice_options"] = [row["name"] for row in ice_options]
 
-        units = conn.execute("SELECT name FROM Units ORDER BY name").fetchall()
+        units = conn.run("lists.units").fetchall()
         lists["units"] = [row["name"] for row in units]
-
-        ingredients = conn.execute("SELECT * FROM PossibleIngredients").fetchall()
-        lists["ingredients"] = {row["name"]: row for row in ingredients}
     finally:
         if should_close:
             conn.close()
 
     return lists
+
+
+def get_lists() -> dict:
+    """
+    Return the shared reference lists from the app config, loading them if needed
+    (once per worker, however many requests are waiting for them).
+    """
+    cached = current_app.config.get("LISTS")
+    if not cached:
+        cached = flights.do("lists", load_lists)
+        current_app.config["LISTS"] = cached
+    return cached
@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, List
+
+import psycopg
+from flask import Flask
+
+from catalog import IngredientCatalog, IngredientRecord, reload_catalog
+from migrations import run_migrations
+from resolver import get_resolver
+from singleflight import flights
+from utils import load_lists, next_lists_generation
+
+# Extra warm-up steps registered by other modules; each runs inside an app context
+_WARMERS: List[Callable[[], None]] = []
+
+
+def register_warmer(fn: Callable[[], None]) -> Callable[[], None]:
+    _WARMERS.append(fn)
+    return fn
+
+
+def _snapshot_path(app: Flask) -> str:
+    return app.config.get("WARM_SNAPSHOT_PATH") or os.path.join(app.instance_path, "warm_snapshot.json")
+
+
+def write_snapshot(app: Flask) -> None:
+    """Persist LISTS and the catalog so the next boot can serve them before the DB answers."""
+    lists = app.config.get("LISTS") or {}
+    catalog = app.config.get("CATALOG")
+    payload = {
+        "saved_at": time.time(),
+        "lists": {k: v for k, v in lists.items() if not k.startswith("_")},
+        "ingredients": [record.to_dict() for record in catalog] if catalog is not None else [],
+    }
+    path = _snapshot_path(app)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh)
+    os.replace(tmp, path)
+
+
+def seed_from_snapshot(app: Flask) -> bool:
+    """
+    Load the last good LISTS/catalog from disk. The catalog is marked as already
+    expired so the first real load replaces it.
+    """
+    path = _snapshot_path(app)
+    try:
+        with open(path, encoding="utf-8") as fh:
+            payload = json.load(fh)
+    except (OSError, ValueError):
+        return False
+
+    lists = payload.get("lists") or {}
+    if lists:
+        # Fresh generation so LISTS-derived caches treat it like any other load
+        lists["_generation"] = next_lists_generation()
+        app.config["LISTS"] = lists
+
+    records = [IngredientRecord.from_row(row) for row in payload.get("ingredients") or []]
+    if records:
+        catalog = IngredientCatalog(records)
+        catalog.loaded_at -= app.config.get("CATALOG_MAX_AGE", 300) or 0
+        app.config["CATALOG"] = catalog
+    app.logger.info("[STARTUP] Seeded LISTS/catalog from snapshot %s", path)
+    return True
+
+
+def migrate_on_startup(app: Flask) -> bool:
+    """
+    Apply pending migrations before the app serves anything (RUN_MIGRATIONS_ON_STARTUP),
+    so no request ever sees an older schema. When the database can't be reached at
+    boot, the first request to find it reachable applies them before it runs.
+    """
+    if not app.config.get("RUN_MIGRATIONS_ON_STARTUP"):
+        return True
+    try:
+        with app.app_context():
+            run_migrations()
+        return True
+    except psycopg.OperationalError as e:
+        app.logger.warning("[STARTUP] Migrations deferred, database unreachable: %s", e)
+
+    app.extensions["migrations_pending"] = True
+    retry_at = [0.0]
+
+    @app.before_request
+    def _migrate_before_first_use():
+        # At most one connect attempt per 30s, so offline requests aren't each held up by one
+        if not app.extensions.get("migrations_pending") or time.monotonic() < retry_at[0]:
+            return
+        try:
+            _apply_deferred_migrations(app)
+        except psycopg.OperationalError:
+            # Still unreachable: the request fails (or is served offline) on its own
+            retry_at[0] = time.monotonic() + 30
+
+    return False
+
+
+def _apply_deferred_migrations(app: Flask) -> None:
+    if app.extensions.get("migrations_pending"):
+        flights.do("migrations", run_migrations)
+        app.extensions["migrations_pending"] = False
+
+
+def warm(app: Flask) -> None:
+    """Load every startup cache and run the registered warmers, then refresh the snapshot."""
+    with app.app_context():
+        _apply_deferred_migrations(app)
+        app.config["LISTS"] = load_lists()
+        reload_catalog()
+        get_resolver()
+        for warmer in _WARMERS:
+            warmer()
+        try:
+            write_snapshot(app)
+        except OSError as e:
+            app.logger.warning("[STARTUP] Could not write warm snapshot: %s", e)
+
+
+def start_background_warmup(app: Flask) -> threading.Thread:
+    """
+    Warm caches off the boot path. Retries with backoff; if every attempt fails the
+    app keeps serving, and routes load what they need lazily.
+    """
+    attempts = app.config.get("WARMUP_ATTEMPTS", 4)
+    state = app.extensions.setdefault("warmup", {"status": "pending", "error": None})
+
+    def run():
+        delay = 1.0
+        for attempt in range(1, attempts + 1):
+            t0 = time.perf_counter()
+            try:
+                warm(app)
+            except Exception as e:
+                state.update(status="retrying", error=str(e))
+                app.logger.warning("[STARTUP] Warm-up attempt %s/%s failed: %s", attempt, attempts, e)
+                if attempt < attempts:
+                    time.sleep(delay)
+                    delay *= 2
+                continue
+            state.update(status="ready", error=None, ms=round((time.perf_counter() - t0) * 1000))
+            app.logger.info("[STARTUP] Warm-up finished in %s ms", state["ms"])
+            return
+        state["status"] = "failed"
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread